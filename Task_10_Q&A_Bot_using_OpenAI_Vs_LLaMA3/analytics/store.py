@@ -0,0 +1,243 @@
+import math
+import time
+import atexit
+import sqlite3
+import threading
+from typing import List, Dict, Any
+from analytics.streaming_stats import QuantileSketch
+
+MODELS = ("openai", "llama3")
+
+# latency_bins row for zero/failed latencies (sketch buckets only cover v > 0)
+ZERO_BIN = -(10 ** 6)
+
+# Seconds between retention passes over the raw queries table
+PRUNE_INTERVAL = 3600
+
+class AnalyticsStore:
+    """Durable, process-wide analytics store (SQLite)
+
+    Query records are buffered and appended in batches. Every flush also
+    updates per-minute rollups (count, sums, min/max) and per-minute quantile
+    sketch bins, so windowed aggregates such as "last hour" or "per day" are
+    answered from the rollups without loading raw records into the app.
+    Raw records older than ``raw_retention_days`` are pruned by the flusher
+    thread; the rollups keep the history.
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 20, flush_interval: float = 5.0,
+                 raw_retention_days: float = 0.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.raw_retention = raw_retention_days * 86400
+        self._next_prune = 0.0
+        self.lock = threading.Lock()
+        self.buffer: List[Dict[str, Any]] = []
+        self._bucket = QuantileSketch()
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS queries (
+                ts REAL, query TEXT,
+                openai_latency REAL, llama3_latency REAL,
+                openai_tokens INTEGER, llama3_tokens INTEGER,
+                openai_length INTEGER, llama3_length INTEGER,
+                openai_ttft REAL, llama3_ttft REAL,
+                relevance REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_queries_ts ON queries (ts);
+            CREATE TABLE IF NOT EXISTS rollup (
+                minute INTEGER, model TEXT,
+                count INTEGER, sum_latency REAL, sum_sq_latency REAL,
+                min_latency REAL, max_latency REAL, sum_tokens INTEGER,
+                PRIMARY KEY (minute, model)
+            );
+            CREATE TABLE IF NOT EXISTS latency_bins (
+                minute INTEGER, model TEXT, bin INTEGER, count INTEGER,
+                PRIMARY KEY (minute, model, bin)
+            );
+        """)
+        self.db.commit()
+
+        # Time-based flush so small batches are not held forever
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    # ===== WRITES =====
+
+    def append(self, record: Dict[str, Any]):
+        """Buffer one query record (flushed in batches)"""
+        with self.lock:
+            self.buffer.append(record)
+            should_flush = len(self.buffer) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if time.time() >= self._next_prune:
+                self.prune()
+
+    def _bin(self, latency: float) -> int:
+        return self._bucket.bucket_key(latency) if latency > 0 else ZERO_BIN
+
+    def flush(self):
+        with self.lock:
+            batch, self.buffer = self.buffer, []
+            if not batch:
+                return
+
+            self.db.executemany(
+                "INSERT INTO queries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(
+                    r['ts'], r['query'],
+                    r['openai_latency'], r['llama3_latency'],
+                    r['openai_tokens'], r['llama3_tokens'],
+                    r['openai_length'], r['llama3_length'],
+                    r.get('openai_ttft'), r.get('llama3_ttft'),
+                    r['relevance']
+                ) for r in batch]
+            )
+
+            rollups, bins = [], []
+            for r in batch:
+                minute = int(r['ts'] // 60)
+                for model in MODELS:
+                    latency = float(r[f'{model}_latency'] or 0)
+                    rollups.append((minute, model, latency, latency * latency,
+                                    latency, latency, int(r[f'{model}_tokens'] or 0)))
+                    bins.append((minute, model, self._bin(latency)))
+
+            self.db.executemany(
+                """INSERT INTO rollup VALUES (?, ?, 1, ?, ?, ?, ?, ?)
+                   ON CONFLICT (minute, model) DO UPDATE SET
+                       count = count + 1,
+                       sum_latency = sum_latency + excluded.sum_latency,
+                       sum_sq_latency = sum_sq_latency + excluded.sum_sq_latency,
+                       min_latency = MIN(min_latency, excluded.min_latency),
+                       max_latency = MAX(max_latency, excluded.max_latency),
+                       sum_tokens = sum_tokens + excluded.sum_tokens""",
+                rollups
+            )
+            self.db.executemany(
+                """INSERT INTO latency_bins VALUES (?, ?, ?, 1)
+                   ON CONFLICT (minute, model, bin) DO UPDATE SET count = count + 1""",
+                bins
+            )
+            self.db.commit()
+
+    def prune(self) -> int:
+        """Delete raw query records older than the retention; returns how many"""
+        self._next_prune = time.time() + PRUNE_INTERVAL
+        if self.raw_retention <= 0:
+            return 0
+        cutoff = time.time() - self.raw_retention
+        with self.lock:
+            try:
+                deleted = self.db.execute("DELETE FROM queries WHERE ts < ?", (cutoff,)).rowcount
+                self.db.commit()
+            except sqlite3.Error as e:
+                self.db.rollback()
+                print(f"Analytics prune failed: {e}")
+                return 0
+        if deleted:
+            print(f"Analytics: pruned {deleted} raw queries past the {self.raw_retention / 86400:g}-day retention")
+        return deleted
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    # ===== WINDOWED QUERIES =====
+
+    def _sketch(self, model: str, min_minute: int, max_minute: int = None) -> QuantileSketch:
+        sql = "SELECT bin, SUM(count) FROM latency_bins WHERE model = ? AND minute >= ?"
+        args = [model, min_minute]
+        if max_minute is not None:
+            sql += " AND minute < ?"
+            args.append(max_minute)
+        sketch = QuantileSketch()
+        with self.lock:
+            rows = self.db.execute(sql + " GROUP BY bin", args).fetchall()
+        for bin_id, count in rows:
+            if bin_id == ZERO_BIN:
+                sketch.add(0, count)
+            else:
+                sketch.add_bucket(bin_id, count)
+        return sketch
+
+    def window_summary(self, model: str, seconds: float) -> Dict[str, Any]:
+        """Aggregates for one model over the last `seconds` (all sessions)"""
+        min_minute = int((time.time() - seconds) // 60)
+        with self.lock:
+            row = self.db.execute(
+                """SELECT SUM(count), SUM(sum_latency), SUM(sum_sq_latency),
+                          MIN(min_latency), MAX(max_latency), SUM(sum_tokens)
+                   FROM rollup WHERE model = ? AND minute >= ?""",
+                (model, min_minute)
+            ).fetchone()
+
+        count = row[0] or 0
+        if count == 0:
+            return {"count": 0, "avg": 0.0, "stdev": 0.0, "min": 0.0, "max": 0.0,
+                    "p50": 0.0, "p95": 0.0, "p99": 0.0, "tokens": 0}
+
+        mean = row[1] / count
+        variance = (row[2] - count * mean * mean) / (count - 1) if count > 1 else 0.0
+        sketch = self._sketch(model, min_minute)
+        return {
+            "count": count,
+            "avg": round(mean, 2),
+            "stdev": round(math.sqrt(max(variance, 0.0)), 2),
+            "min": round(row[3], 2),
+            "max": round(row[4], 2),
+            "p50": round(sketch.quantile(0.50), 2),
+            "p95": round(sketch.quantile(0.95), 2),
+            "p99": round(sketch.quantile(0.99), 2),
+            "tokens": int(row[5] or 0)
+        }
+
+    def daily_summary(self, model: str, days: int = 7) -> List[Dict[str, Any]]:
+        """Per-day aggregates for one model (local calendar days, newest first)"""
+        min_minute = int((time.time() - days * 86400) // 60)
+        with self.lock:
+            rows = self.db.execute(
+                """SELECT date(minute * 60, 'unixepoch', 'localtime') AS day,
+                          MIN(minute), MAX(minute),
+                          SUM(count), SUM(sum_latency), MAX(max_latency), SUM(sum_tokens)
+                   FROM rollup WHERE model = ? AND minute >= ?
+                   GROUP BY day ORDER BY day DESC""",
+                (model, min_minute)
+            ).fetchall()
+
+        result = []
+        for day, first_minute, last_minute, count, sum_latency, max_latency, tokens in rows:
+            sketch = self._sketch(model, first_minute, last_minute + 1)
+            result.append({
+                "day": day,
+                "count": count,
+                "avg": round(sum_latency / count, 2) if count else 0.0,
+                "p50": round(sketch.quantile(0.50), 2),
+                "p95": round(sketch.quantile(0.95), 2),
+                "max": round(max_latency, 2),
+                "tokens": int(tokens or 0)
+            })
+        return result
+
+_stores: Dict[str, AnalyticsStore] = {}
+_stores_lock = threading.Lock()
+
+def get_analytics_store(db_path: str, batch_size: int = 20, flush_interval: float = 5.0,
+                        raw_retention_days: float = 0.0):
+    """Process-wide store shared by every Streamlit session (None if disabled)"""
+    if not db_path:
+        return None
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = AnalyticsStore(db_path, batch_size, flush_interval, raw_retention_days)
+        return _stores[db_path]
@@ -0,0 +1,159 @@
+import math
+from typing import Dict
+
+class RunningStats:
+    """Welford running mean/variance plus min, max and sum in O(1) memory"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "RunningStats"):
+        """Combine with another RunningStats (Chan et al. parallel update)"""
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self._m2 = other.count, other.mean, other._m2
+            self.total, self.min, self.max = other.total, other.min, other.max
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self._m2 += other._m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance (same as statistics.variance)"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self) -> float:
+        return math.sqrt(max(self.variance, 0.0))
+
+class QuantileSketch:
+    """Mergeable log-bucket quantile sketch (DDSketch-style)
+
+    Positive values land in bucket ``ceil(log_gamma(v))``, so every quantile
+    is returned within ``relative_accuracy`` of the true value. Memory is
+    bounded by ``max_buckets``: when exceeded, the lowest buckets are collapsed,
+    which only affects accuracy of the smallest quantiles.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_buckets: int = 2048):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def bucket_key(self, value: float) -> int:
+        """Bucket index of a positive value"""
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, weight: int = 1):
+        if value <= 0:
+            self.count += weight
+            self.zero_count += weight
+            return
+        self.add_bucket(self.bucket_key(value), weight)
+
+    def add_bucket(self, key: int, count: int):
+        """Add pre-bucketed counts (e.g. read back from a rollup table)"""
+        self.count += count
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.buckets)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            self.buckets[target] += self.buckets.pop(key)
+
+    def merge(self, other: "QuantileSketch"):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def quantile(self, q: float) -> float:
+        """Approximate q-quantile (0 <= q <= 1)"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+class StreamingMetric:
+    """Running aggregates + quantile sketch for one metric"""
+
+    def __init__(self):
+        self.stats = RunningStats()
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float):
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other: "StreamingMetric"):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+
+    def __len__(self) -> int:
+        return self.stats.count
+
+    @property
+    def count(self) -> int:
+        return self.stats.count
+
+    @property
+    def mean(self) -> float:
+        return self.stats.mean
+
+    @property
+    def stdev(self) -> float:
+        return self.stats.stdev
+
+    @property
+    def total(self) -> float:
+        return self.stats.total
+
+    @property
+    def min(self) -> float:
+        return self.stats.min if self.stats.count else 0.0
+
+    @property
+    def max(self) -> float:
+        return self.stats.max if self.stats.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        return self.sketch.quantile(q)
@@ -1,24 +1,61 @@
-import statistics
 import re
+import time
+from collections import deque
 from typing import List, Dict
 from datetime import datetime
+from analytics.streaming_stats import StreamingMetric
 
 class AnalyticsTracker:
-    def __init__(self):
+    def __init__(self, max_log_entries: int = 200, store=None):
+        self.max_log_entries = max_log_entries
+        self.store = store  # optional durable AnalyticsStore shared by all sessions
         self.total_queries = 0
         self.openai_wins = 0
         self.llama3_wins = 0
-        self.openai_latencies = []
-        self.llama3_latencies = []
-        self.queries_log = []
+        
+        # Every metric is a running aggregate + quantile sketch (O(1) memory)
+        self.openai_latencies = StreamingMetric()
+        self.llama3_latencies = StreamingMetric()
+        self.queries_log = deque(maxlen=max_log_entries)
         self.start_time = datetime.now()
         
         # Advanced metrics
-        self.openai_answer_lengths = []
-        self.llama3_answer_lengths = []
-        self.openai_tokens_used = []
-        self.llama3_tokens_used = []
-        self.relevance_scores = []
+        self.openai_answer_lengths = StreamingMetric()
+        self.llama3_answer_lengths = StreamingMetric()
+        self.openai_tokens_used = StreamingMetric()
+        self.llama3_tokens_used = StreamingMetric()
+        self.relevance_scores = StreamingMetric()
+        
+        # Streaming metrics (only recorded for streamed answers)
+        self.openai_ttfts = StreamingMetric()
+        self.llama3_ttfts = StreamingMetric()
+        self.openai_inter_token_latencies = StreamingMetric()
+        self.llama3_inter_token_latencies = StreamingMetric()
+        
+        # Context packing (prompt tokens sent vs. saved by dedup/budget)
+        self.openai_context_tokens = StreamingMetric()
+        self.llama3_context_tokens = StreamingMetric()
+        self.openai_tokens_saved = StreamingMetric()
+        self.llama3_tokens_saved = StreamingMetric()
+        
+        # Fastest-answer routing
+        self.routed_counts = {"openrouter": 0, "llama3": 0}
+        self.routed_hedged = 0
+        self.routed_errors = 0
+        self.routed_latencies = StreamingMetric()
+        
+        # Semantic answer cache
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # Rerank cascade (queries answered from rank fusion alone, cross-encoder pairs scored)
+        self.rerank_queries = 0
+        self.rerank_skipped = 0
+        self.rerank_pairs = 0
+        self.rerank_full_pairs = 0
+        
+        # Per-stage timings from request traces (stage path -> seconds)
+        self.stage_latencies: Dict[str, StreamingMetric] = {}
     
     def add_query(self, query: str, openai_result: dict, llama3_result: dict):
         """Add query with comprehensive metrics"""
@@ -32,12 +69,12 @@ class AnalyticsTracker:
         llama3_tokens = llama3_result.get('tokens', 0)
         
         # Latency
-        self.openai_latencies.append(float(openai_latency))
-        self.llama3_latencies.append(float(llama3_latency))
+        self.openai_latencies.add(float(openai_latency))
+        self.llama3_latencies.add(float(llama3_latency))
         
         # Answer length
-        self.openai_answer_lengths.append(len(openai_answer))
-        self.llama3_answer_lengths.append(len(llama3_answer))
+        self.openai_answer_lengths.add(len(openai_answer))
+        self.llama3_answer_lengths.add(len(llama3_answer))
         
         # Token fallback if missing
         if openai_tokens <= 0:
@@ -45,14 +82,30 @@ class AnalyticsTracker:
         if llama3_tokens <= 0:
             llama3_tokens = len(llama3_answer) // 4
         
-        self.openai_tokens_used.append(openai_tokens)
-        self.llama3_tokens_used.append(llama3_tokens)
+        self.openai_tokens_used.add(openai_tokens)
+        self.llama3_tokens_used.add(llama3_tokens)
+        
+        # Time-to-first-token and inter-token latency (streaming mode)
+        if 'ttft' in openai_result:
+            self.openai_ttfts.add(float(openai_result['ttft']))
+            self.openai_inter_token_latencies.add(float(openai_result.get('inter_token_latency', 0)))
+        if 'ttft' in llama3_result:
+            self.llama3_ttfts.add(float(llama3_result['ttft']))
+            self.llama3_inter_token_latencies.add(float(llama3_result.get('inter_token_latency', 0)))
+        
+        # Context packing
+        if 'tokens_saved' in openai_result:
+            self.openai_context_tokens.add(openai_result.get('context_tokens', 0))
+            self.openai_tokens_saved.add(openai_result['tokens_saved'])
+        if 'tokens_saved' in llama3_result:
+            self.llama3_context_tokens.add(llama3_result.get('context_tokens', 0))
+            self.llama3_tokens_saved.add(llama3_result['tokens_saved'])
         
         # Relevance
         relevance = self._calculate_relevance(query, openai_answer, llama3_answer)
-        self.relevance_scores.append(relevance)
+        self.relevance_scores.add(relevance)
         
-        self.queries_log.append({
+        record = {
             'query': query,
             'openai_latency': openai_latency,
             'llama3_latency': llama3_latency,
@@ -60,10 +113,51 @@ class AnalyticsTracker:
             'llama3_length': len(llama3_answer),
             'openai_tokens': openai_tokens,
             'llama3_tokens': llama3_tokens,
+            'openai_ttft': openai_result.get('ttft'),
+            'llama3_ttft': llama3_result.get('ttft'),
             'timestamp': datetime.now(),
             'relevance': relevance
-        })
+        }
+        self.queries_log.append(record)
+        
+        if self.store is not None:
+            self.store.append(dict(record, ts=time.time(), timestamp=None))
+    
+    def record_routed(self, result: dict):
+        """Record a fastest-answer (routed) query"""
+        if result.get('cached'):
+            return
+        self.routed_counts[result['provider']] = self.routed_counts.get(result['provider'], 0) + 1
+        if result.get('hedged'):
+            self.routed_hedged += 1
+        if 'error' in result:
+            self.routed_errors += 1
+        self.routed_latencies.add(float(result.get('total_latency', result.get('latency', 0))))
     
+    def record_cache_lookup(self, hit: bool):
+        """Record a semantic answer cache hit or miss"""
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def record_trace(self, trace):
+        """Record every stage duration of a finished request trace"""
+        for span in trace.walk():
+            stage = span.path or "total"
+            if stage not in self.stage_latencies:
+                self.stage_latencies[stage] = StreamingMetric()
+            self.stage_latencies[stage].add(span.duration)
+            if span.name == "rerank_cascade":
+                self.record_rerank_cascade(span.attributes)
+
+    def record_rerank_cascade(self, attributes: dict):
+        """Record the rerank cascade decisions of one retrieval"""
+        self.rerank_queries += attributes.get('queries', 0)
+        self.rerank_skipped += attributes.get('skipped', 0)
+        self.rerank_pairs += attributes.get('pairs', 0)
+        self.rerank_full_pairs += attributes.get('full_pairs', 0)
+
     def record_vote(self, model: str):
         """Record user vote for better answer"""
         if model == "openai":
@@ -99,7 +193,7 @@ class AnalyticsTracker:
         """Average relevance score"""
         if not self.relevance_scores:
             return 0.0
-        return round(statistics.mean(self.relevance_scores), 1)
+        return round(self.relevance_scores.mean, 1)
 
     def get_accuracy(self, model: str) -> float:
         """Accuracy based on wins vs total queries"""
@@ -141,8 +235,8 @@ class AnalyticsTracker:
         if len(lengths) <= 1:
             return 0.0
 
-        std_dev = statistics.stdev(lengths)
-        avg = statistics.mean(lengths)
+        std_dev = lengths.stdev
+        avg = lengths.mean
 
         if avg <= 0:
             return 0.0
@@ -155,7 +249,7 @@ class AnalyticsTracker:
     def get_avg_answer_length(self, model: str) -> int:
         """Average answer length"""
         arr = self.openai_answer_lengths if model == "openai" else self.llama3_answer_lengths
-        return round(statistics.mean(arr)) if arr else 0
+        return round(arr.mean) if arr else 0
 
     def get_completeness_score(self, model: str) -> float:
         """Completeness score (0-100)"""
@@ -169,8 +263,8 @@ class AnalyticsTracker:
         if len(arr) <= 1:
             return 0.0
         
-        std_dev = statistics.stdev(arr)
-        avg = statistics.mean(arr)
+        std_dev = arr.stdev
+        avg = arr.mean
         if avg <= 0:
             return 0.0
         
@@ -183,22 +277,41 @@ class AnalyticsTracker:
     def get_avg_latency(self, model: str) -> float:
         """Average latency"""
         arr = self.openai_latencies if model == "openai" else self.llama3_latencies
-        return round(statistics.mean(arr), 2) if arr else 0.0
+        return round(arr.mean, 2) if arr else 0.0
 
     def get_median_latency(self, model: str) -> float:
-        """Median latency"""
+        """Median latency (sketch estimate, within 1%)"""
+        return self.get_latency_percentile(model, 50)
+
+    def get_latency_percentile(self, model: str, percentile: float) -> float:
+        """Latency percentile, e.g. 95 for p95 (sketch estimate, within 1%)"""
         arr = self.openai_latencies if model == "openai" else self.llama3_latencies
-        return round(statistics.median(arr), 2) if arr else 0.0
+        return round(arr.quantile(percentile / 100), 2) if arr else 0.0
+
+    def get_total_latency(self, model: str) -> float:
+        """Cumulative time spent waiting for the model"""
+        arr = self.openai_latencies if model == "openai" else self.llama3_latencies
+        return round(arr.total, 2)
 
     def get_max_latency(self, model: str) -> float:
         """Max latency"""
         arr = self.openai_latencies if model == "openai" else self.llama3_latencies
-        return round(max(arr), 2) if arr else 0.0
+        return round(arr.max, 2) if arr else 0.0
 
     def get_min_latency(self, model: str) -> float:
         """Min latency"""
         arr = self.openai_latencies if model == "openai" else self.llama3_latencies
-        return round(min(arr), 2) if arr else 0.0
+        return round(arr.min, 2) if arr else 0.0
+
+    def get_avg_ttft(self, model: str) -> float:
+        """Average time to first token"""
+        arr = self.openai_ttfts if model == "openai" else self.llama3_ttfts
+        return round(arr.mean, 3) if arr else 0.0
+
+    def get_avg_inter_token_latency(self, model: str) -> float:
+        """Average gap between streamed tokens (ms)"""
+        arr = self.openai_inter_token_latencies if model == "openai" else self.llama3_inter_token_latencies
+        return round(arr.mean * 1000, 1) if arr else 0.0
 
     def get_tokens_per_second(self, model: str) -> float:
         """Tokens per second"""
@@ -208,8 +321,8 @@ class AnalyticsTracker:
         if not tokens or not latencies:
             return 0.0
 
-        total_tokens = sum(tokens)
-        total_time = sum(latencies)
+        total_tokens = tokens.total
+        total_time = latencies.total
 
         if total_time <= 0:
             return 0.0
@@ -223,16 +336,72 @@ class AnalyticsTracker:
             return 0.0
         return round(self.total_queries / elapsed, 2)
 
+    def get_cache_hit_rate(self) -> float:
+        """Semantic answer cache hit rate"""
+        return self._safe_percent(self.cache_hits, self.cache_hits + self.cache_misses)
+
+    def get_rerank_summary(self) -> Dict:
+        """Share of retrievals that skipped the cross-encoder and of reranker pairs saved"""
+        return {
+            "queries": self.rerank_queries,
+            "skip_rate": self._safe_percent(self.rerank_skipped, self.rerank_queries),
+            "pairs_scored": self.rerank_pairs,
+            "pairs_saved_rate": self._safe_percent(self.rerank_full_pairs - self.rerank_pairs, self.rerank_full_pairs)
+        }
+
+    def get_routing_summary(self) -> Dict:
+        """Provider share, hedge rate and latency of fastest-answer queries"""
+        total = len(self.routed_latencies)
+        return {
+            "queries": total,
+            "openai_share": self._safe_percent(self.routed_counts.get("openrouter", 0), total),
+            "llama3_share": self._safe_percent(self.routed_counts.get("llama3", 0), total),
+            "hedge_rate": self._safe_percent(self.routed_hedged, total),
+            "error_rate": self._safe_percent(self.routed_errors, total),
+            "p50": round(self.routed_latencies.quantile(0.50), 2) if total else 0.0,
+            "p95": round(self.routed_latencies.quantile(0.95), 2) if total else 0.0
+        }
+
+    def get_stage_breakdown(self) -> List[Dict]:
+        """Per-stage latency percentiles in milliseconds (pipeline order)"""
+        rows = []
+        for stage, metric in self.stage_latencies.items():
+            rows.append({
+                "stage": stage,
+                "count": metric.count,
+                "avg_ms": round(metric.mean * 1000, 1),
+                "p50_ms": round(metric.quantile(0.50) * 1000, 1),
+                "p95_ms": round(metric.quantile(0.95) * 1000, 1),
+                "p99_ms": round(metric.quantile(0.99) * 1000, 1),
+                "max_ms": round(metric.max * 1000, 1)
+            })
+        return rows
+
     # ===== COST & EFFICIENCY =====
 
     def get_total_tokens(self, model: str) -> int:
         """Total tokens used"""
-        return sum(self.openai_tokens_used if model == "openai" else self.llama3_tokens_used)
+        return int((self.openai_tokens_used if model == "openai" else self.llama3_tokens_used).total)
 
     def get_avg_tokens_per_query(self, model: str) -> int:
         """Average tokens per query"""
         tokens = self.openai_tokens_used if model == "openai" else self.llama3_tokens_used
-        return round(statistics.mean(tokens)) if tokens else 0
+        return round(tokens.mean) if tokens else 0
+
+    def get_tokens_saved(self, model: str) -> int:
+        """Prompt tokens removed by context packing"""
+        return int((self.openai_tokens_saved if model == "openai" else self.llama3_tokens_saved).total)
+
+    def get_avg_context_tokens(self, model: str) -> int:
+        """Average packed context size per query"""
+        arr = self.openai_context_tokens if model == "openai" else self.llama3_context_tokens
+        return round(arr.mean) if arr else 0
+
+    def get_context_savings_rate(self, model: str) -> float:
+        """Share of retrieved context tokens not sent to the model"""
+        saved = self.get_tokens_saved(model)
+        sent = (self.openai_context_tokens if model == "openai" else self.llama3_context_tokens).total
+        return self._safe_percent(saved, saved + sent)
 
     def get_estimated_cost(self, model: str) -> float:
         """Estimated cost"""
@@ -247,8 +416,8 @@ class AnalyticsTracker:
         if not self.openai_latencies or not self.llama3_latencies:
             return "N/A"
         
-        avg_o = statistics.mean(self.openai_latencies)
-        avg_l = statistics.mean(self.llama3_latencies)
+        avg_o = self.openai_latencies.mean
+        avg_l = self.llama3_latencies.mean
 
         if avg_o <= 0 or avg_l <= 0:
             return "N/A"
@@ -262,5 +431,5 @@ class AnalyticsTracker:
 
     def reset(self):
         """Reset analytics"""
-        self.__init__()
+        self.__init__(self.max_log_entries, self.store)
 
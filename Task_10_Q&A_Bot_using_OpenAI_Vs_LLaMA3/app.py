@@ -1,17 +1,15 @@
 import streamlit as st
 import os
 import tempfile
-from pypdf import PdfReader
-from sentence_transformers import SentenceTransformer, CrossEncoder
 
-# Import from local modules
+# Import from local modules (light ones only: models, langchain, pypdf and the
+# pipeline modules are imported on the model loader thread while the UI renders)
+from utils.startup import get_model_loader
 from utils.config import config
-from utils.document_processor import simple_split, extract_document_info
-from utils.retriever import HybridRetriever
-from models.model_handler import ModelHandler
+from utils.tracing import tracer, span
 from analytics.tracker import AnalyticsTracker
+from analytics.store import get_analytics_store
 from ui.styles import get_custom_css
-from langchain_core.documents import Document
 
 # ==================== PAGE CONFIG ====================
 st.set_page_config(
@@ -28,58 +26,127 @@ st.markdown(get_custom_css(), unsafe_allow_html=True)
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 if 'analytics' not in st.session_state:
-    st.session_state.analytics = AnalyticsTracker()
-if 'chunks' not in st.session_state:
-    st.session_state.chunks = []
+    st.session_state.analytics = AnalyticsTracker(
+        store=get_analytics_store(
+            config.ANALYTICS_DB_PATH,
+            batch_size=config.ANALYTICS_BATCH_SIZE,
+            flush_interval=config.ANALYTICS_FLUSH_SECONDS,
+            raw_retention_days=config.ANALYTICS_RAW_RETENTION_DAYS
+        )
+    )
+if 'chunk_count' not in st.session_state:
+    st.session_state.chunk_count = 0
 if 'retriever' not in st.session_state:
     st.session_state.retriever = None
 if 'retriever_ready' not in st.session_state:
     st.session_state.retriever_ready = False
 if 'last_query' not in st.session_state:
     st.session_state.last_query = None
+if 'fastest_mode' not in st.session_state:
+    st.session_state.fastest_mode = False
 
 # ==================== LOAD MODELS ====================
-@st.cache_resource
 def load_models():
-    embedder = SentenceTransformer(config.EMBEDDING_MODEL)
-    reranker = CrossEncoder(config.RERANKER_MODEL)
-    model_handler = ModelHandler()
-    return embedder, reranker, model_handler
+    """Embedder, reranker and model handler (waits for the background loader if needed)"""
+    loader = get_model_loader()
+    if not loader.ready():
+        with st.spinner("⏳ Loading models..."):
+            return loader.result()
+    return loader.result()
+
+@st.cache_resource
+def load_embedding_cache():
+    if not config.EMBEDDING_CACHE_DIR:
+        return None
+    from utils.embedding_cache import EmbeddingCache
+    embedder, _, _ = load_models()
+    return EmbeddingCache.for_embedder(config.EMBEDDING_CACHE_DIR, embedder, config.EMBEDDING_MODEL)
+
+@st.cache_resource
+def load_corpus():
+    """Document library shared by every session (None = single-document mode)"""
+    if not config.CORPUS_DIR:
+        return None
+    from utils.corpus import Corpus
+    embedder, reranker, _ = load_models()
+    return Corpus(config.CORPUS_DIR, embedder, reranker, load_embedding_cache(), config.EMBEDDING_MODEL)
+
+@st.cache_resource
+def load_answer_cache():
+    if not config.ANSWER_CACHE_ENABLED:
+        return None
+    from utils.semantic_cache import SemanticCache
+    return SemanticCache(
+        threshold=config.ANSWER_CACHE_THRESHOLD,
+        max_entries=config.ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=config.ANSWER_CACHE_TTL,
+        db_path=config.ANSWER_CACHE_PATH
+    )
 
 # ==================== ANSWER GENERATION ====================
-def generate_answers(query: str, retriever, model_handler) -> dict:
-    """Generate answers from both models"""
+def stream_answers(query: str, retriever, model_handler, answer_cache=None) -> dict:
+    """Stream both answers into side-by-side columns as tokens arrive"""
+    from utils.qa_pipeline import (
+        SYSTEM_PROMPT, build_prompts, add_context_stats, no_results, lookup_cached_answer, store_answer
+    )
     
-    # Retrieve context
-    relevant_docs = retriever.retrieve(query, top_k=config.TOP_K_RETRIEVAL)
+    with st.spinner("🔍 Retrieving context..."):
+        query_embedding, cached = lookup_cached_answer(query, retriever, answer_cache)
+        if cached is not None:
+            return cached
+        with span("retrieval"):
+            relevant_docs = retriever.retrieve(query, top_k=config.TOP_K_RETRIEVAL, query_embedding=query_embedding)
     
     if not relevant_docs:
-        return {
-            "openrouter": {"answer": "No relevant information found.", "latency": 0, "sources": 0, "tokens": 0},
-            "llama3": {"answer": "No relevant information found.", "latency": 0, "sources": 0, "tokens": 0}
-        }
+        return no_results()
     
-    context_text = "\n\n---\n\n".join([doc.page_content for doc in relevant_docs])
+    prompts, stats = build_prompts(query, retriever, relevant_docs)
     
-    system_prompt = """You are an elite AI assistant specializing in document analysis. 
-Provide precise, professional, and well-structured responses based solely on the given context."""
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown('<div class="model-header openai-header">🤖 OpenAI (via OpenRouter)</div>', unsafe_allow_html=True)
+        openrouter_box = st.empty()
+    with col2:
+        st.markdown('<div class="model-header llama-header">🦙 LLaMA3</div>', unsafe_allow_html=True)
+        llama3_box = st.empty()
     
-    user_prompt = f"""Context:
-{context_text}
-
-Question: {query}
-
-Provide a clear, accurate answer based only on the context above."""
+    boxes = {"openrouter": openrouter_box, "llama3": llama3_box}
+    texts = {"openrouter": "", "llama3": ""}
+    results = {}
     
-    # Query both models
-    results = model_handler.query_both(system_prompt, user_prompt)
-    
-    # Add sources
-    results['openrouter']['sources'] = len(relevant_docs)
-    results['llama3']['sources'] = len(relevant_docs)
+    with span("generation", streaming=True):
+        for key, kind, payload in model_handler.stream_both(SYSTEM_PROMPT, prompts):
+            if kind == "token":
+                texts[key] += payload
+                boxes[key].markdown(texts[key] + "▌")
+            else:
+                results[key] = payload
+                boxes[key].markdown(payload["answer"])
     
+    add_context_stats(results, stats)
+    store_answer(retriever, answer_cache, query_embedding, results)
     return results
 
+MODEL_HEADERS = {
+    "openrouter": '<div class="model-header openai-header">🤖 OpenAI (via OpenRouter)</div>',
+    "llama3": '<div class="model-header llama-header">🦙 LLaMA3</div>'
+}
+
+def show_wait_estimate(model_handler, fastest: bool):
+    """Back-pressure notice when the shared provider queues are backed up"""
+    waits = [model_handler.scheduler.estimated_wait(key) for key in ("openrouter", "llama3")]
+    wait = min(waits) if fastest else max(waits)
+    if wait >= 2:
+        st.info(f"⏳ High demand right now — estimated wait ~{wait:.0f}s")
+
+def ttft_badge(result: dict) -> str:
+    """Time-to-first-token (or cache hit) badge for streamed answers"""
+    if result.get('cached'):
+        return '<span class="metric-badge latency-badge">♻️ cached</span> '
+    if 'ttft' not in result:
+        return ""
+    return f'<span class="metric-badge latency-badge">⏱️ TTFT {result["ttft"]}s</span> '
+
 # ==================== MAIN APP ====================
 def main():
     # ===== BIG BOLD CENTERED TITLE =====
@@ -113,8 +180,11 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Load models
-    embedder, reranker, model_handler = load_models()
+    # Models load on a background thread; only the sections that need them wait
+    loader = get_model_loader()
+    loader.report.mark("first_render")
+    models_ready = loader.ready()
+    corpus = load_corpus() if models_ready else None
     
     # ==================== SIDEBAR ====================
     with st.sidebar:
@@ -138,7 +208,15 @@ def main():
         with col1:
             st.metric("📈 Queries", st.session_state.analytics.total_queries)
         with col2:
-            st.metric("📄 Chunks", len(st.session_state.chunks))
+            st.metric("📄 Chunks", st.session_state.chunk_count)
+        if not models_ready:
+            st.caption("⏳ Warming up models in the background...")
+        
+        st.toggle(
+            "⚡ Fastest answer only",
+            key="fastest_mode",
+            help="Answer from whichever model is currently fastest (hedged) instead of comparing both"
+        )
         
         st.markdown("---")
         
@@ -146,42 +224,109 @@ def main():
         uploaded = st.file_uploader("Choose PDF", type=['pdf'])
         
         if uploaded and st.button("🚀 Process Document"):
+            from utils.ingestion import ingest_pdf
+            embedder, reranker, _ = load_models()
+            corpus = load_corpus()
             with st.spinner("Processing PDF..."):
                 try:
                     with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as f:
                         f.write(uploaded.read())
                         pdf_path = f.name
                     
-                    reader = PdfReader(pdf_path)
-                    docs = []
-                    for i, page in enumerate(reader.pages[:50]):
-                        text = page.extract_text()
-                        if text and len(text.strip()) > 50:
-                            docs.append(Document(
-                                page_content=text,
-                                metadata={"page": i+1}
-                            ))
+                    progress_bar = st.progress(0.0, text="Extracting pages...")
                     
-                    if not docs:
-                        st.error("No text found in PDF")
-                        st.stop()
+                    def show_progress(pages_done, total_pages, chunks_indexed):
+                        progress_bar.progress(
+                            pages_done / max(total_pages, 1),
+                            text=f"Indexed {pages_done}/{total_pages} pages ({chunks_indexed} chunks)"
+                        )
                     
-                    chunks = simple_split(docs, chunk_size=config.CHUNK_SIZE)
-                    st.session_state.chunks = chunks[:150]
-                    
-                    st.session_state.retriever = HybridRetriever(
-                        st.session_state.chunks,
-                        embedder,
-                        reranker
-                    )
-                    st.session_state.retriever_ready = True
-                    
-                    os.unlink(pdf_path)
-                    st.success(f"✅ Processed {len(chunks)} chunks!")
+                    if corpus is not None:
+                        # Library mode: the document gets its own persisted shard
+                        meta = corpus.add_document(pdf_path, name=uploaded.name, progress=show_progress)
+                        os.unlink(pdf_path)
+                        progress_bar.empty()
+                        
+                        if meta is None:
+                            st.error("No text found in PDF")
+                            st.stop()
+                        
+                        # An empty selection means all documents; otherwise add the new one
+                        if st.session_state.get("library_docs") and meta["doc_id"] not in st.session_state.library_docs:
+                            st.session_state.library_docs = st.session_state.library_docs + [meta["doc_id"]]
+                        st.success(f"✅ Added {meta['name']} ({meta['chunks']} chunks) to the library!")
+                    else:
+                        from utils.corpus import document_id
+                        from utils.index_registry import get_index_registry, index_key
+                        from utils.inference_backend import embedding_space
+                        
+                        # Shared with every session that opened the same PDF (built only once)
+                        lease = get_index_registry().acquire(
+                            index_key(document_id(pdf_path), **embedding_space(embedder, config.EMBEDDING_MODEL)),
+                            lambda: ingest_pdf(
+                                pdf_path,
+                                embedder,
+                                reranker,
+                                embedding_cache=load_embedding_cache(),
+                                progress=show_progress
+                            )
+                        )
+                        os.unlink(pdf_path)
+                        progress_bar.empty()
+                        
+                        if lease is None:
+                            st.error("No text found in PDF")
+                            st.stop()
+                        
+                        if st.session_state.get("index_lease") is not None:
+                            st.session_state.index_lease.release()
+                        st.session_state.index_lease = lease
+                        retriever = lease.retriever
+                        st.session_state.retriever = retriever
+                        st.session_state.chunk_count = len(retriever.chunks)
+                        st.session_state.retriever_ready = True
+                        
+                        st.success(f"✅ Processed {len(retriever.chunks)} chunks!")
                     
                 except Exception as e:
                     st.error(f"Error: {str(e)}")
         
+        # ===== DOCUMENT LIBRARY =====
+        library = {meta["doc_id"]: meta for meta in corpus.documents()} if corpus is not None else {}
+        if library:
+            st.markdown("### 📚 Library")
+            selected = st.multiselect(
+                "Documents (empty = all)",
+                list(library),
+                key="library_docs",
+                format_func=lambda doc_id: f"{library[doc_id]['name']} ({library[doc_id]['pages']} pages)"
+            )
+            with st.expander("🔎 Filters"):
+                page_from = st.number_input("From page", min_value=1, value=1, key="page_from")
+                page_to = st.number_input("To page (0 = last)", min_value=0, value=0, key="page_to")
+                uploaded_range = st.date_input("Uploaded between", value=(), key="uploaded_range")
+            
+            pages = None if page_from == 1 and page_to == 0 else (page_from, page_to or 10**9)
+            uploaded_from = uploaded_range[0] if len(uploaded_range) > 0 else None
+            uploaded_to = uploaded_range[1] if len(uploaded_range) > 1 else None
+            
+            view = corpus.select(
+                doc_ids=[doc_id for doc_id in selected if doc_id in library] or None,
+                pages=pages,
+                uploaded_from=uploaded_from,
+                uploaded_to=uploaded_to
+            )
+            # Keep the session's view (and its shard leases) while the selection is unchanged
+            from utils.corpus import CorpusView
+            previous = st.session_state.retriever
+            if isinstance(previous, CorpusView) and previous.fingerprint() == view.fingerprint():
+                view = previous
+            elif isinstance(previous, CorpusView):
+                previous.close()
+            st.session_state.retriever = view
+            st.session_state.chunk_count = view.chunk_count()
+            st.session_state.retriever_ready = st.session_state.chunk_count > 0
+        
         st.markdown("---")
         
         if st.button("🗑️ Clear Chat"):
@@ -216,6 +361,12 @@ def main():
     for msg in st.session_state.messages:
         if msg["role"] == "user":
             st.chat_message("user", avatar="👤").markdown(msg["content"])
+        elif "fastest" in msg:
+            result = msg["fastest"]
+            hedged = '<span class="metric-badge latency-badge">🔀 hedged</span> ' if result.get('hedged') else ""
+            st.markdown(MODEL_HEADERS[result["provider"]], unsafe_allow_html=True)
+            st.markdown(result["answer"])
+            st.markdown(f'<span class="metric-badge latency-badge">⚡ {result.get("total_latency", result["latency"])}s</span> {hedged}{ttft_badge(result)}<span class="metric-badge sources-badge">📄 {result.get("sources", 0)} sources</span>', unsafe_allow_html=True)
         else:
             col1, col2 = st.columns(2)
             
@@ -227,7 +378,7 @@ def main():
                 # Metrics and Vote Button
                 metric_col, vote_col = st.columns([4, 1])
                 with metric_col:
-                    st.markdown(f'<span class="metric-badge latency-badge">⚡ {msg["openrouter"]["latency"]}s</span> <span class="metric-badge sources-badge">📄 {msg["openrouter"]["sources"]} sources</span>', unsafe_allow_html=True)
+                    st.markdown(f'<span class="metric-badge latency-badge">⚡ {msg["openrouter"]["latency"]}s</span> {ttft_badge(msg["openrouter"])}<span class="metric-badge sources-badge">📄 {msg["openrouter"]["sources"]} sources</span>', unsafe_allow_html=True)
                 with vote_col:
                     if st.session_state.messages[-1] == msg:
                         if st.button("👍", key=f"vote_openai_{len(st.session_state.messages)}", help="Vote for OpenAI"):
@@ -245,7 +396,7 @@ def main():
                 # Metrics and Vote Button
                 metric_col, vote_col = st.columns([4, 1])
                 with metric_col:
-                    st.markdown(f'<span class="metric-badge latency-badge">⚡ {msg["llama3"]["latency"]}s</span> <span class="metric-badge sources-badge">📄 {msg["llama3"]["sources"]} sources</span>', unsafe_allow_html=True)
+                    st.markdown(f'<span class="metric-badge latency-badge">⚡ {msg["llama3"]["latency"]}s</span> {ttft_badge(msg["llama3"])}<span class="metric-badge sources-badge">📄 {msg["llama3"]["sources"]} sources</span>', unsafe_allow_html=True)
                 with vote_col:
                     if st.session_state.messages[-1] == msg:
                         if st.button("👍", key=f"vote_llama3_{len(st.session_state.messages)}", help="Vote for LLaMA3"):
@@ -266,10 +417,36 @@ def main():
             
             st.session_state.messages.append({"role": "user", "content": prompt})
             
-            with st.spinner("🔍 Querying both models..."):
-                results = generate_answers(prompt, st.session_state.retriever, model_handler)
+            from utils.qa_pipeline import generate_answers, generate_fastest_answer
+            _, _, model_handler = load_models()
+            answer_cache = load_answer_cache()
+            show_wait_estimate(model_handler, st.session_state.fastest_mode)
+            
+            if st.session_state.fastest_mode:
+                with tracer.trace("qa_request", routed=True) as trace:
+                    with st.spinner("⚡ Asking the fastest model..."):
+                        result = generate_fastest_answer(prompt, st.session_state.retriever, model_handler, answer_cache)
+                st.session_state.analytics.record_trace(trace)
+                if answer_cache is not None:
+                    st.session_state.analytics.record_cache_lookup(result.get('cached', False))
+                st.session_state.analytics.record_routed(result)
+                st.session_state.messages.append({"role": "assistant", "fastest": result})
+                st.rerun()
             
-            st.session_state.analytics.add_query(prompt, results['openrouter'], results['llama3'])
+            with tracer.trace("qa_request", streaming=config.STREAM_RESPONSES) as trace:
+                if config.STREAM_RESPONSES:
+                    results = stream_answers(prompt, st.session_state.retriever, model_handler, answer_cache)
+                else:
+                    with st.spinner("🔍 Querying both models..."):
+                        results = generate_answers(prompt, st.session_state.retriever, model_handler, answer_cache)
+            st.session_state.analytics.record_trace(trace)
+            
+            # Cached answers count as hits only, so latency stats stay provider-only
+            cache_hit = results['openrouter'].get('cached', False)
+            if answer_cache is not None:
+                st.session_state.analytics.record_cache_lookup(cache_hit)
+            if not cache_hit:
+                st.session_state.analytics.add_query(prompt, results['openrouter'], results['llama3'])
             
             st.session_state.messages.append({
                 "role": "assistant",
@@ -285,6 +462,11 @@ def main():
             print("=" * 50)
             
             st.rerun()
+    
+    # The page is on screen; wait for the models, then rerun so the sections that need them appear
+    if not models_ready:
+        load_models()
+        st.rerun()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+"""Headless batch Q&A over one PDF
+
+Ingests the PDF once, answers every question of a JSONL file with both models
+and appends one JSON line per question (answers, sources, stage timings,
+token counts) to the output file. Run from the Task_10 directory:
+
+    python batch_qa.py --pdf report.pdf --questions questions.jsonl --output answers.jsonl
+
+Input lines need a "question" field; "id" defaults to the line number and any
+other fields (e.g. "expected") are copied to the output. Re-running with the
+same output resumes: questions already answered by both models are skipped,
+failed ones are asked again. Requests go through the shared scheduler at batch
+priority, so ``--concurrency`` only needs to be high enough to keep the
+provider quotas (OPENROUTER_RPM / GROQ_RPM) busy.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Set
+
+from utils.config import config
+from utils.tracing import tracer
+
+# Result fields written per model (the answer cache and UI-only flags are left out)
+RESULT_FIELDS = ("model", "answer", "error", "busy", "circuit_open", "latency", "attempts",
+                 "tokens", "sources", "context_tokens", "tokens_saved")
+
+# ===== INPUT / RESUME =====
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    """Questions with a string id (line number when missing)"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("question"):
+                print(f"Skipping line {line_no}: no question")
+                continue
+            item["id"] = str(item.get("id", line_no))
+            questions.append(item)
+    return questions
+
+def is_complete(row: Dict[str, Any]) -> bool:
+    return "error" not in row and all("error" not in result for result in row["answers"].values())
+
+def load_finished(output_path: str) -> Set[str]:
+    """Ids answered by both models in a previous run
+
+    Failed rows are dropped from the file (rewritten atomically) so the retry
+    leaves a single line per question. A truncated last line from an
+    interrupted run is dropped too.
+    """
+    if not os.path.exists(output_path):
+        return set()
+
+    kept, finished = [], set()
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if is_complete(row) and row["id"] not in finished:
+                finished.add(row["id"])
+                kept.append(line if line.endswith("\n") else line + "\n")
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(kept)
+    os.replace(tmp_path, output_path)
+    return finished
+
+# ===== PIPELINE =====
+
+def load_pipeline(pdf_path: str, concurrency: int):
+    """Models, handler at batch priority and the ingested document"""
+    from models.model_handler import ModelHandler
+    from models.scheduler import PRIORITY_BATCH
+    from utils.embedding_cache import EmbeddingCache
+    from utils.ingestion import ingest_pdf
+    from utils.inference_backend import load_embedder, load_reranker
+
+    embedder = load_embedder(config.EMBEDDING_MODEL)
+    reranker = load_reranker(config.RERANKER_MODEL)
+    # Two provider calls per question in flight
+    model_handler = ModelHandler(priority=PRIORITY_BATCH, max_workers=2 * concurrency)
+
+    embedding_cache = None
+    if config.EMBEDDING_CACHE_DIR:
+        embedding_cache = EmbeddingCache.for_embedder(config.EMBEDDING_CACHE_DIR, embedder, config.EMBEDDING_MODEL)
+
+    def progress(pages_done, total_pages, chunks):
+        print(f"  {pages_done}/{total_pages} pages, {chunks} chunks", end="\r")
+
+    retriever = ingest_pdf(pdf_path, embedder, reranker, embedding_cache, progress=progress)
+    print()
+    return retriever, model_handler
+
+def answer_question(item: Dict[str, Any], retriever, model_handler) -> Dict[str, Any]:
+    """One output row: the input fields plus per-model results and stage timings"""
+    from utils.qa_pipeline import generate_answers
+
+    with tracer.trace("batch_question", question_id=item["id"]) as root:
+        results = generate_answers(item["question"], retriever, model_handler)
+
+    stages = {}
+    for s in root.walk():
+        if s is not root:
+            stages[s.path] = round(stages.get(s.path, 0) + s.duration * 1000, 3)
+
+    return dict(
+        item,
+        answers={
+            key: {field: result[field] for field in RESULT_FIELDS if field in result}
+            for key, result in results.items()
+        },
+        stages_ms=stages,
+        total_ms=round(root.duration * 1000, 3),
+        timestamp=time.strftime("%Y-%m-%dT%H:%M:%S")
+    )
+
+def run_batch(questions, retriever, model_handler, output_path: str, concurrency: int,
+              stop: threading.Event) -> Dict[str, Any]:
+    """Answer questions with at most `concurrency` in flight, appending rows as they finish"""
+    summary = {"answered": 0, "failed": 0, "tokens": {"openrouter": 0, "llama3": 0}}
+    pending = iter(questions)
+    in_flight = {}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as pool:
+        while True:
+            while not stop.is_set() and len(in_flight) < concurrency:
+                item = next(pending, None)
+                if item is None:
+                    break
+                in_flight[pool.submit(answer_question, item, retriever, model_handler)] = item
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    row = future.result()
+                except Exception as e:
+                    # Recorded as failed (retried on resume) instead of ending the batch
+                    row = dict(item, answers={}, error=str(e), timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"))
+                # Flushed per row so an interruption loses at most the questions in flight
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+
+                summary["answered" if is_complete(row) else "failed"] += 1
+                for key, result in row["answers"].items():
+                    summary["tokens"][key] += result.get("tokens", 0)
+
+            finished = summary["answered"] + summary["failed"]
+            elapsed = time.perf_counter() - start
+            print(f"  {finished}/{len(questions)} done, {summary['failed']} failed, "
+                  f"{finished / elapsed:.2f} q/s", end="\r")
+
+    summary["elapsed_s"] = round(time.perf_counter() - start, 3)
+    print()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL question file against one PDF with both models")
+    parser.add_argument("--pdf", required=True)
+    parser.add_argument("--questions", required=True, help="JSONL with a \"question\" (and optional \"id\") per line")
+    parser.add_argument("--output", required=True, help="JSONL answers file (appended to and resumed from)")
+    parser.add_argument("--concurrency", type=int, default=8, help="questions in flight at once")
+    parser.add_argument("--trace", action="store_true", help="also export each question's trace to TRACE_EXPORT_PATH")
+    args = parser.parse_args()
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.concurrency > config.SCHEDULER_MAX_QUEUE:
+        print(f"Note: concurrency above SCHEDULER_MAX_QUEUE ({config.SCHEDULER_MAX_QUEUE}) "
+              "only adds rejected (busy) requests")
+    if not args.trace:
+        tracer.export_path = ""
+
+    questions = load_questions(args.questions)
+    finished = load_finished(args.output)
+    todo = [q for q in questions if q["id"] not in finished]
+    print(f"{len(questions)} questions, {len(finished)} already answered, {len(todo)} to run")
+    if not todo:
+        return
+
+    print("Loading models and ingesting document...")
+    retriever, model_handler = load_pipeline(args.pdf, args.concurrency)
+    if retriever is None:
+        sys.exit("No extractable text in the PDF")
+
+    # First Ctrl-C stops submitting and lets questions in flight finish; the second aborts
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        if stop.is_set():
+            raise KeyboardInterrupt
+        print("\nStopping after the questions in flight (Ctrl-C again to abort)...")
+        stop.set()
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Answering {len(todo)} questions, {args.concurrency} at a time...")
+    summary = run_batch(todo, retriever, model_handler, args.output, args.concurrency, stop)
+
+    finished_now = summary["answered"] + summary["failed"]
+    print(f"\n{summary['answered']} answered, {summary['failed']} failed "
+          f"in {summary['elapsed_s']:.1f}s "
+          f"({finished_now / summary['elapsed_s'] if summary['elapsed_s'] else 0:.2f} q/s)")
+    print(f"Tokens: OpenRouter {summary['tokens']['openrouter']}, LLaMA3 {summary['tokens']['llama3']}")
+    if summary["failed"] or stop.is_set():
+        print("Re-run the same command to retry failed or remaining questions")
+    print(f"Answers written to {args.output}")
+
+if __name__ == "__main__":
+    main()
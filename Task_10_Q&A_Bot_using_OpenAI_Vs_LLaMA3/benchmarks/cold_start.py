@@ -0,0 +1,101 @@
+"""Cold-start time of the Q&A app, with and without the model warm-up
+
+Every run is a fresh interpreter, so imports and model loading are really
+cold. A run imports the modules app.py needs before its first render,
+waits for the background model loader and then times one real query shape
+(encode + rerank). Run from the Task_10 directory:
+
+    python -m benchmarks.cold_start --runs 3
+
+"first render" is when the page could be drawn (Streamlit's own import is
+not included), "models ready" is when questions can be answered, and
+"first query" is the first encode + rerank after that ("second query" is the
+same call again, i.e. the steady state).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import List, Dict, Any
+
+import numpy as np
+
+# Modules app.py imports at the top (everything else loads on the model loader thread)
+APP_IMPORTS = ("utils.config", "utils.tracing", "analytics.tracker", "analytics.store", "ui.styles")
+
+def child(warmup: bool) -> Dict[str, Any]:
+    """One cold start in this (fresh) process"""
+    import importlib
+    from utils.startup import get_model_loader, PROCESS_START
+    from utils.config import config
+
+    config.MODEL_WARMUP = warmup
+    for module in APP_IMPORTS:
+        importlib.import_module(module)
+    loader = get_model_loader()
+    loader.report.mark("first_render")
+    embedder, reranker, _ = loader.result()
+
+    query = "Which machine learning algorithms were compared?"
+    chunks = [f"Section {i}: the models compared were logistic regression, random forest and SVM." for i in range(12)]
+    query_times = []
+    for _ in range(2):
+        start = time.perf_counter()
+        embedder.encode([query], show_progress_bar=False)
+        reranker.predict([[query, chunk] for chunk in chunks])
+        query_times.append(time.perf_counter() - start)
+
+    report = loader.report.to_dict()
+    return {
+        "first_render_s": report["milestones_s"]["first_render"],
+        "models_ready_s": report["milestones_s"]["models_ready"],
+        "first_query_s": round(query_times[0], 3),
+        "second_query_s": round(query_times[1], 3),
+        "since_start_s": round(time.perf_counter() - PROCESS_START, 3),
+        "phases_s": report["phases_s"]
+    }
+
+def run_child(warmup: bool) -> Dict[str, Any]:
+    args = [sys.executable, "-m", "benchmarks.cold_start", "--child"] + ([] if warmup else ["--no-warmup"])
+    output = subprocess.run(args, capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    # The result is the last line; model loading logs come before it
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start time of the Q&A app")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per mode")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--no-warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(child(warmup=not args.no_warmup)))
+        return
+
+    results: Dict[str, List[Dict[str, Any]]] = {}
+    for mode, warmup in (("warm-up", True), ("no warm-up", False)):
+        results[mode] = []
+        for run in range(args.runs):
+            print(f"{mode} run {run + 1}/{args.runs}...")
+            results[mode].append(run_child(warmup))
+
+    print(f"\n{'mode':<12}{'first render':>14}{'models ready':>14}{'first query':>13}{'second query':>14}")
+    for mode, runs in results.items():
+        median = {key: float(np.median([run[key] for run in runs]))
+                  for key in ("first_render_s", "models_ready_s", "first_query_s", "second_query_s")}
+        print(f"{mode:<12}{median['first_render_s']:>13.2f}s{median['models_ready_s']:>13.2f}s"
+              f"{median['first_query_s'] * 1000:>11.0f}ms{median['second_query_s'] * 1000:>12.0f}ms")
+    print("\nPhases (last warm-up run): " +
+          ", ".join(f"{name} {seconds:.2f}s" for name, seconds in results["warm-up"][-1]["phases_s"].items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
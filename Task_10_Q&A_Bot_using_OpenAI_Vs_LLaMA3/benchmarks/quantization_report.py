@@ -0,0 +1,100 @@
+"""Recall / latency / memory tradeoff of the quantized vector indexes
+
+Compares exact float32 search with int8 and binary two-phase search
+(quantized scan + exact rescoring) at several rescore factors. Run from the
+Task_10 directory:
+
+    python -m benchmarks.quantization_report --n 100000
+    python -m benchmarks.quantization_report --embeddings corpus/<doc_id>/embeddings.npy
+
+Without ``--embeddings`` the vectors are synthetic: unit vectors around random
+cluster centres with per-point spread, so neighbourhoods are graded as with
+real sentence embeddings. Queries are noisy copies of stored vectors.
+"""
+import json
+import time
+import argparse
+from typing import List, Dict, Any
+import numpy as np
+from utils.vector_index import ExactIndex, QuantizedIndex
+
+def synthetic_embeddings(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    spread = rng.uniform(0.3, 1.0, size=(n, 1))
+    vectors = centres[rng.integers(clusters, size=n)] + spread * rng.normal(size=(n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+def make_queries(embeddings: np.ndarray, n_queries: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    queries = embeddings[rng.integers(len(embeddings), size=n_queries)]
+    queries = queries + noise * rng.normal(size=queries.shape) / np.sqrt(embeddings.shape[1])
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+def measure(index, queries: np.ndarray, top_k: int, truth: List[set]) -> Dict[str, Any]:
+    """Recall@k against exact search and single-query latency (the app's access pattern)"""
+    latencies, recalls = [], []
+    index.search(queries[0], top_k)  # warm-up (page-in of memory maps)
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids, _ = index.search(query, top_k)
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(expected & set(ids.tolist())) / len(expected))
+
+    ms = np.asarray(latencies) * 1000
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of quantized vector search")
+    parser.add_argument("--embeddings", help=".npy matrix of real embeddings (default: synthetic)")
+    parser.add_argument("--n", type=int, default=100000, help="synthetic vectors")
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-noise", type=float, default=0.5, help="relative noise added to query vectors")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--factors", default="1,4,8,16,32", help="rescore factors to try")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        embeddings = np.load(args.embeddings).astype(np.float32)
+    else:
+        embeddings = synthetic_embeddings(args.n, args.dim, args.clusters, args.seed)
+    queries = make_queries(embeddings, args.queries, args.query_noise, args.seed)
+    print(f"{len(embeddings)} vectors x {embeddings.shape[1]} dims, {len(queries)} queries, top-{args.top_k}")
+
+    exact = ExactIndex(embeddings)
+    truth = [set(ids.tolist()) for ids, _ in exact.search_batch(queries, args.top_k)]
+    float_bytes = embeddings.nbytes
+
+    rows = [dict(mode="exact", rescore_factor=None, bytes_per_vector=float_bytes / len(embeddings),
+                 compression=1.0, **measure(exact, queries, args.top_k, truth))]
+    for mode in ("int8", "binary"):
+        for factor in (int(f) for f in args.factors.split(",")):
+            index = QuantizedIndex(embeddings, mode=mode, rescore_factor=factor)
+            resident = index.memory_bytes()
+            rows.append(dict(mode=mode, rescore_factor=factor,
+                             bytes_per_vector=round(resident / len(embeddings), 1),
+                             compression=round(float_bytes / resident, 1),
+                             **measure(index, queries, args.top_k, truth)))
+
+    print(f"\n{'mode':<8}{'rescore':>8}{'B/vec':>9}{'x smaller':>11}{'recall@k':>10}{'p50 ms':>9}{'p95 ms':>9}")
+    for row in rows:
+        factor = "-" if row["rescore_factor"] is None else row["rescore_factor"]
+        print(f"{row['mode']:<8}{factor:>8}{row['bytes_per_vector']:>9.1f}{row['compression']:>11.1f}"
+              f"{row['recall']:>10.3f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"vectors": len(embeddings), "dim": int(embeddings.shape[1]),
+                       "queries": len(queries), "top_k": args.top_k, "results": rows}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
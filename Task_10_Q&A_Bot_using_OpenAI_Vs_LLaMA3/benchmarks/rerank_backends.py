@@ -0,0 +1,108 @@
+"""Reranker throughput and ranking parity per CPU inference backend
+
+Builds the real rerank workload (hybrid candidates of every benchmark question
+over the bundled report), scores it with each backend and compares against
+torch fp32: pairs/s, speedup, Spearman correlation per query, top-1 agreement
+and overlap of the final top-k. Run from the Task_10 directory:
+
+    python -m benchmarks.rerank_backends
+    python -m benchmarks.rerank_backends --backends torch,onnx-int8 --model cross-encoder/ms-marco-MiniLM-L-6-v2
+
+Model weights must already be in the local Hugging Face cache (or pass a local
+directory to --model / --embedding-model).
+"""
+import os
+import json
+import time
+import argparse
+from typing import List, Dict, Any
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import numpy as np
+from utils.config import config
+from utils.inference_backend import BACKENDS, build_reranker, load_cross_encoder, load_embedder, parity_report
+from benchmarks.run_benchmark import DEFAULT_PDF, DEFAULT_QUESTIONS, load_questions
+
+def rerank_workload(pdf_path: str, questions: List[str], embedding_model: str, top_k: int):
+    """(query, chunk) pairs exactly as the retriever hands them to the reranker, plus group sizes"""
+    from utils.ingestion import ingest_pdf
+
+    embedder = load_embedder(embedding_model, "torch")
+    retriever = ingest_pdf(pdf_path, embedder, None, embedding_cache=None)
+    if retriever is None:
+        raise SystemExit("No extractable text in the PDF")
+    candidates = retriever.candidates_batch(questions, retriever.encode_queries(questions), top_k)
+    pairs = [[question, doc.page_content] for question, docs in zip(questions, candidates) for doc in docs]
+    return pairs, [len(docs) for docs in candidates]
+
+def topk_overlap(reference: np.ndarray, candidate: np.ndarray, group_sizes: List[int], k: int) -> float:
+    """Mean share of the fp32 top-k kept by the candidate (what the LLM context actually sees)"""
+    overlaps, offset = [], 0
+    for size in group_sizes:
+        ref, cand = reference[offset:offset + size], candidate[offset:offset + size]
+        offset += size
+        keep = min(k, size)
+        overlaps.append(len(set(np.argsort(-ref)[:keep]) & set(np.argsort(-cand)[:keep])) / keep)
+    return round(float(np.mean(overlaps)), 4)
+
+def time_backend(reranker, pairs: List[List[str]], repeats: int):
+    """Best-of-`repeats` wall time of scoring the whole workload (after one warm-up batch)"""
+    reranker.predict(pairs[:reranker.batch_size])
+    best, scores = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        scores = reranker.predict(pairs)
+        best = min(best, time.perf_counter() - start)
+    return best, np.asarray(scores, dtype=np.float32)
+
+def main():
+    parser = argparse.ArgumentParser(description="Reranker speed and parity per inference backend")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--model", default=config.RERANKER_MODEL, help="CrossEncoder name or local directory")
+    parser.add_argument("--embedding-model", default=config.EMBEDDING_MODEL)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--top-k", type=int, default=config.TOP_K_RETRIEVAL, help="candidates per retriever")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    questions = [item["question"] for item in load_questions(args.questions)]
+    pairs, groups = rerank_workload(args.pdf, questions, args.embedding_model, args.top_k)
+    print(f"{len(pairs)} (query, chunk) pairs from {len(questions)} questions, "
+          f"max_length {config.RERANK_MAX_LENGTH}, batch {config.RERANK_BATCH_SIZE}")
+
+    cross_encoder = load_cross_encoder(args.model)
+    rows: List[Dict[str, Any]] = []
+    reference = None
+    for backend in ["torch"] + [b for b in args.backends.split(",") if b != "torch"]:
+        try:
+            reranker = build_reranker(cross_encoder, args.model, backend)
+        except (ImportError, ValueError) as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        elapsed, scores = time_backend(reranker, pairs, args.repeats)
+        if reference is None:
+            reference = (elapsed, scores)
+        rows.append(dict(
+            backend=backend,
+            pairs_per_s=round(len(pairs) / elapsed, 1),
+            speedup=round(reference[0] / elapsed, 2),
+            topk_overlap=topk_overlap(reference[1], scores, groups, config.RERANK_TOP_K),
+            **parity_report(reference[1], scores, groups)
+        ))
+
+    print(f"\n{'backend':<11}{'pairs/s':>9}{'speedup':>9}{'spearman':>10}{'top-1':>7}{'top-k':>7}{'max diff':>10}")
+    for row in rows:
+        print(f"{row['backend']:<11}{row['pairs_per_s']:>9.1f}{row['speedup']:>9.2f}{row['spearman']:>10.4f}"
+              f"{row['top1_agreement']:>7.2f}{row['topk_overlap']:>7.2f}{row['max_abs_diff']:>10.5f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"model": args.model, "pairs": len(pairs), "queries": len(questions),
+                       "max_length": config.RERANK_MAX_LENGTH, "results": rows}, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Offline end-to-end benchmark of the Q&A pipeline
+
+Starts two local stub LLM servers (one per provider), ingests the bundled
+cardiovascular report, runs a fixed question set and reports throughput and
+p50/p95/p99 per stage. Run from the Task_10 directory:
+
+    python -m benchmarks.run_benchmark --output results.json
+    python -m benchmarks.run_benchmark --output new.json --baseline results.json
+
+Embedding and reranker weights must already be in the local Hugging Face
+cache (the run sets HF_HUB_OFFLINE=1 unless it is set explicitly).
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+from dataclasses import asdict
+from typing import List, Dict, Any
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import numpy as np
+from utils.config import config
+from utils.tracing import tracer, span
+from utils.rerank_cascade import get_cascade
+from benchmarks.stub_server import PROFILES, start_stub_server
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PDF = os.path.join(
+    BENCH_DIR, "..", "..", "Task_8_GenAI Chatbot using local documents (RAG pipeline)",
+    "PREDICTION OF CARDIOVASCULAR DISEASE USING ML REPORT GROUP 13.pdf"
+)
+DEFAULT_QUESTIONS = os.path.join(BENCH_DIR, "questions.jsonl")
+
+# ===== HELPERS =====
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Count, mean and percentiles of durations in seconds (reported in ms)"""
+    if not values:
+        return {"count": 0}
+    ms = np.asarray(values) * 1000
+    return {
+        "count": len(values),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3)
+    }
+
+def collect_spans(root, durations: Dict[str, List[float]]):
+    """Append every span duration of a finished trace, keyed by path"""
+    for s in root.walk():
+        durations.setdefault(s.path or "total", []).append(s.duration)
+
+# ===== PIPELINE STAGES =====
+
+def start_stubs(openrouter_profile: str, llama3_profile: str, seed: int):
+    """Point both providers at local stub servers"""
+    openrouter_server, openrouter_url = start_stub_server(PROFILES[openrouter_profile], seed=seed)
+    llama3_server, llama3_url = start_stub_server(PROFILES[llama3_profile], seed=seed + 1)
+
+    config.OPENROUTER_BASE_URL = f"{openrouter_url}/v1"
+    config.GROQ_BASE_URL = llama3_url
+    config.OPENROUTER_API_KEY = "stub-key"
+    config.GROQ_API_KEY = "stub-key"
+    # The stubs have no quota; keep the scheduler from measuring its own rate limit
+    config.OPENROUTER_RPM = 0
+    config.GROQ_RPM = 0
+    return [openrouter_server, llama3_server]
+
+def load_models():
+    from models.model_handler import ModelHandler
+    from utils.inference_backend import load_embedder, load_reranker
+
+    embedder = load_embedder(config.EMBEDDING_MODEL)
+    reranker = load_reranker(config.RERANKER_MODEL)
+    return embedder, reranker, ModelHandler()
+
+def ingest(pdf_path: str, embedder, reranker):
+    """Extract, chunk and index the PDF inside one trace"""
+    from utils.ingestion import ingest_pdf
+
+    with tracer.trace("ingestion") as root:
+        # No embedding cache so every run measures real encoding work
+        retriever = ingest_pdf(pdf_path, embedder, reranker, embedding_cache=None)
+    pages = len(set(retriever.chunks.column("page")))
+    return retriever, root, pages, len(retriever.chunks)
+
+def run_questions(questions, retriever, model_handler, repeat: int):
+    from utils.qa_pipeline import generate_answers
+
+    durations: Dict[str, List[float]] = {}
+    model_latencies = {"openrouter": [], "llama3": []}
+    errors = {"openrouter": 0, "llama3": 0}
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for q in questions:
+            with tracer.trace("qa_request", question_id=q["id"]) as root:
+                results = generate_answers(q["question"], retriever, model_handler)
+            collect_spans(root, durations)
+            for key in model_latencies:
+                if "error" in results[key]:
+                    errors[key] += 1
+                else:
+                    model_latencies[key].append(results[key]["latency"])
+    elapsed = time.perf_counter() - start
+
+    return durations, model_latencies, errors, elapsed
+
+# ===== REPORTING =====
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print % change of p50/p95/p99 per stage against a baseline run"""
+    print(f"\nComparison against {baseline['meta']['commit']} (negative = faster)")
+    print(f"{'stage':<40}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for section in ("ingestion", "stages"):
+        for stage, stats in current[section].items():
+            old = baseline.get(section, {}).get(stage)
+            if not old or not old.get("count") or not stats.get("count"):
+                continue
+            deltas = []
+            for p in ("p50_ms", "p95_ms", "p99_ms"):
+                deltas.append(f"{(stats[p] - old[p]) / old[p] * 100:+.1f}%" if old[p] else "n/a")
+            print(f"{section + '/' + stage:<40}" + "".join(f"{d:>10}" for d in deltas))
+
+    old_qps = baseline.get("throughput_qps", 0)
+    if old_qps:
+        print(f"{'throughput_qps':<40}{(current['throughput_qps'] - old_qps) / old_qps * 100:+.1f}%")
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nIngestion: {report['ingestion_pages']} pages, {report['ingestion_chunks']} chunks")
+    print(f"{'stage':<40}{'count':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}")
+    for section in ("ingestion", "stages"):
+        for stage, stats in report[section].items():
+            if stats.get("count"):
+                print(f"{section + '/' + stage:<40}{stats['count']:>7}"
+                      f"{stats['p50_ms']:>11.1f}{stats['p95_ms']:>11.1f}{stats['p99_ms']:>11.1f}")
+    cascade = report["rerank_cascade"]
+    if cascade["queries"]:
+        print(f"\nRerank cascade: {cascade['skip_rate']:.0%} of retrievals skipped the cross-encoder, "
+              f"{cascade['pairs_saved']:.0%} of pairs saved")
+    print(f"\nThroughput: {report['throughput_qps']:.2f} questions/s over {report['questions']} questions")
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the Q&A pipeline")
+    parser.add_argument("--pdf", default=DEFAULT_PDF)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the question set")
+    parser.add_argument("--warmup", type=int, default=1, help="unrecorded questions before timing")
+    parser.add_argument("--openrouter-profile", choices=sorted(PROFILES), default="openrouter-like")
+    parser.add_argument("--llama3-profile", choices=sorted(PROFILES), default="groq-like")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    # Benchmark traces are summarized here, not appended to the app's trace log
+    tracer.export_path = ""
+    servers = start_stubs(args.openrouter_profile, args.llama3_profile, args.seed)
+    questions = load_questions(args.questions)
+
+    print("Loading models...")
+    load_start = time.perf_counter()
+    embedder, reranker, model_handler = load_models()
+    model_load = time.perf_counter() - load_start
+
+    print("Ingesting document...")
+    retriever, ingest_root, n_pages, n_chunks = ingest(args.pdf, embedder, reranker)
+    ingestion: Dict[str, List[float]] = {}
+    collect_spans(ingest_root, ingestion)
+
+    if args.warmup:
+        from utils.qa_pipeline import generate_answers
+        for q in questions[:args.warmup]:
+            generate_answers(q["question"], retriever, model_handler)
+
+    print(f"Running {len(questions) * args.repeat} questions...")
+    durations, model_latencies, errors, elapsed = run_questions(
+        questions, retriever, model_handler, args.repeat
+    )
+    for server in servers:
+        server.shutdown()
+
+    n_questions = len(questions) * args.repeat
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "profiles": {
+                "openrouter": {"name": args.openrouter_profile, **asdict(PROFILES[args.openrouter_profile])},
+                "llama3": {"name": args.llama3_profile, **asdict(PROFILES[args.llama3_profile])}
+            },
+            "config": {
+                "chunk_size": config.CHUNK_SIZE,
+                "top_k": config.TOP_K_RETRIEVAL,
+                "rerank_top_k": config.RERANK_TOP_K,
+                "vector_index": config.VECTOR_INDEX,
+                "embedding_model": config.EMBEDDING_MODEL,
+                "reranker_model": config.RERANKER_MODEL,
+                "inference_backend": config.INFERENCE_BACKEND,
+                "embedder_backend": getattr(embedder, "inference_backend", "torch"),
+                "reranker_backend": getattr(reranker, "backend", "torch"),
+                "rerank_cascade": config.RERANK_CASCADE
+            }
+        },
+        "model_load_s": round(model_load, 3),
+        "ingestion_pages": n_pages,
+        "ingestion_chunks": n_chunks,
+        "ingestion": {stage: summarize(values) for stage, values in ingestion.items()},
+        "stages": {stage: summarize(values) for stage, values in sorted(durations.items())},
+        "models": {
+            key: dict(summarize(values), errors=errors[key])
+            for key, values in model_latencies.items()
+        },
+        "rerank_cascade": get_cascade().summary(),
+        "questions": n_questions,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(n_questions / elapsed, 4) if elapsed > 0 else 0.0
+    }
+
+    print_report(report)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
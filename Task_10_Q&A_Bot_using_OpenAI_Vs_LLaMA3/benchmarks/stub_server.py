@@ -0,0 +1,166 @@
+"""Local OpenAI-compatible chat completions stub with configurable latency
+
+Serves POST .../chat/completions (both OpenAI/OpenRouter and Groq paths) with
+and without ``stream: true``. Run standalone:
+
+    python -m benchmarks.stub_server --port 8001 --profile groq-like
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from dataclasses import dataclass, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+@dataclass
+class StubProfile:
+    ttft: float = 0.3               # seconds before the first token
+    tokens_per_second: float = 60   # generation speed after the first token
+    answer_tokens: int = 120        # tokens per answer
+    jitter: float = 0.1             # +/- fraction applied to ttft and speed
+    error_rate: float = 0.0         # share of requests answered with HTTP 500
+
+PROFILES = {
+    "instant": StubProfile(ttft=0.0, tokens_per_second=0, answer_tokens=60, jitter=0.0),
+    "openrouter-like": StubProfile(ttft=0.8, tokens_per_second=60, answer_tokens=150, jitter=0.2),
+    "groq-like": StubProfile(ttft=0.15, tokens_per_second=250, answer_tokens=120, jitter=0.1),
+    "flaky": StubProfile(ttft=0.5, tokens_per_second=40, answer_tokens=100, jitter=0.5, error_rate=0.1),
+}
+
+WORDS = ("the model reports that cardiovascular risk depends on age blood pressure cholesterol "
+         "and lifestyle factors while the classifier reaches high accuracy on the test set").split()
+
+def make_handler(profile: StubProfile, seed: int = 0):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    def jittered(value: float) -> float:
+        with rng_lock:
+            return max(0.0, value * (1 + rng.uniform(-profile.jitter, profile.jitter)))
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+                return
+
+            with rng_lock:
+                failed = rng.random() < profile.error_rate
+            if failed:
+                time.sleep(jittered(profile.ttft))
+                self._send_json(500, {"error": {"message": "stub injected failure", "type": "server_error"}})
+                return
+
+            model = request.get("model", "stub")
+            prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+            tokens = [WORDS[i % len(WORDS)] + " " for i in range(profile.answer_tokens)]
+            delay = 1.0 / jittered(profile.tokens_per_second) if profile.tokens_per_second > 0 else 0.0
+            usage = {
+                "prompt_tokens": prompt_chars // 4,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_chars // 4 + len(tokens)
+            }
+            created = int(time.time())
+
+            time.sleep(jittered(profile.ttft))
+
+            if not request.get("stream"):
+                time.sleep(delay * max(0, len(tokens) - 1))
+                self._send_json(200, {
+                    "id": f"stub-{created}",
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": usage
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+
+            def send_event(payload):
+                self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(delay)
+                send_event(json.dumps({
+                    "id": f"stub-{created}",
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+                }))
+            send_event(json.dumps({
+                "id": f"stub-{created}",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage
+            }))
+            send_event("[DONE]")
+            self.close_connection = True
+
+    return StubHandler
+
+def start_stub_server(profile: StubProfile, port: int = 0, seed: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Start the stub in a daemon thread; returns (server, base URL)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(profile, seed))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub LLM server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="openrouter-like")
+    parser.add_argument("--ttft", type=float, help="override profile time-to-first-token (s)")
+    parser.add_argument("--tokens-per-second", type=float, help="override profile token rate")
+    parser.add_argument("--answer-tokens", type=int, help="override profile answer length")
+    parser.add_argument("--error-rate", type=float, help="override profile error rate")
+    args = parser.parse_args()
+
+    profile = StubProfile(**asdict(PROFILES[args.profile]))
+    for field in ("ttft", "tokens_per_second", "answer_tokens", "error_rate"):
+        value = getattr(args, field)
+        if value is not None:
+            setattr(profile, field, value)
+
+    server, base_url = start_stub_server(profile, args.port)
+    print(f"Stub LLM server on {base_url}/v1 with {profile}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,36 @@
 import time
-from typing import Dict, Any
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Any, Iterator, Tuple, Union
 from langchain_groq import ChatGroq
 from langchain_openai import ChatOpenAI
 from utils.config import config
+from models.router import LatencyRouter
+from models.resilience import (
+    get_breaker, call_with_retries, backoff_delay, is_retryable, is_rate_limited, retry_after,
+    LocalRejection, CircuitOpenError
+)
+from models.scheduler import get_scheduler, PRIORITY_INTERACTIVE
+from utils.tracing import span, propagate
 
 class ModelHandler:
-    def __init__(self):
+    def __init__(self, priority: int = PRIORITY_INTERACTIVE, max_workers: int = 8):
+        # Admission priority of this handler's calls in the shared scheduler
+        self.priority = priority
+        self.scheduler = get_scheduler()
+        
         # Initialize Groq (LLaMA3)
         if config.GROQ_API_KEY:
+            groq_options = {"groq_api_base": config.GROQ_BASE_URL} if config.GROQ_BASE_URL else {}
             self.llama3_client = ChatGroq(
                 groq_api_key=config.GROQ_API_KEY,
                 model_name=config.LLAMA3_MODEL,
                 temperature=0.3,
-                max_tokens=2048
+                max_tokens=2048,
+                request_timeout=config.GROQ_TIMEOUT,
+                max_retries=0,
+                **groq_options
             )
         else:
             self.llama3_client = None
@@ -21,36 +39,97 @@ class ModelHandler:
         if config.OPENROUTER_API_KEY:
             self.openrouter_client = ChatOpenAI(
                 api_key=config.OPENROUTER_API_KEY,
-                base_url="https://openrouter.ai/api/v1",
+                base_url=config.OPENROUTER_BASE_URL,
                 model=config.OPENROUTER_MODEL,
                 temperature=0.3,
-                max_tokens=2048
+                max_tokens=2048,
+                request_timeout=config.OPENROUTER_TIMEOUT,
+                max_retries=0
             )
         else:
             self.openrouter_client = None
+        
+        # Worker threads for querying providers concurrently
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="provider")
+        
+        # Per-attempt request timeouts (capped by what is left of PROVIDER_TIMEOUT)
+        self.timeouts = {"openrouter": config.OPENROUTER_TIMEOUT, "llama3": config.GROQ_TIMEOUT}
+        
+        # Circuit breakers are process-wide so every session skips a failing provider
+        self.breakers = {
+            key: get_breaker(key, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_COOLDOWN)
+            for key in ("openrouter", "llama3")
+        }
+        
+        # Live latency / error stats for fastest-answer routing
+        self.router = LatencyRouter(
+            self,
+            window=config.ROUTER_WINDOW,
+            min_samples=config.ROUTER_MIN_SAMPLES,
+            max_error_rate=config.ROUTER_MAX_ERROR_RATE,
+            hedge_percentile=config.ROUTER_HEDGE_PERCENTILE,
+            default_hedge_delay=config.ROUTER_DEFAULT_HEDGE_DELAY
+        )
     
     def _estimate_tokens(self, text: str) -> int:
         """Estimate token count (rough: 4 chars per token)"""
         return len(text) // 4
     
-    def query_openrouter(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
-        """Query OpenRouter model"""
-        if not self.openrouter_client:
-            return {
-                "error": "OpenRouter client not initialized",
-                "answer": "⚠️ OpenRouter API key missing",
-                "latency": 0,
-                "tokens": 0,
-                "model": "OpenRouter"
-            }
+    def _error_result(self, model_name: str, message: str, answer: str, latency: float = 0, **extra) -> Dict[str, Any]:
+        return dict({
+            "error": message,
+            "answer": answer,
+            "latency": latency,
+            "tokens": 0,
+            "model": model_name
+        }, **extra)
+    
+    def _call_provider(self, key: str, call, remaining: float):
+        """One provider attempt within `remaining` seconds: wait for a scheduler slot, feed 429s back
+        
+        ``call(timeout)`` gets the request timeout: the provider's own, or
+        less if the slot wait used up most of the remaining budget.
+        """
+        waited = self.scheduler.acquire(key, self.priority, timeout=min(self.scheduler.max_wait, remaining))
+        try:
+            return call(min(self.timeouts[key], max(remaining - waited, 0.001)))
+        except Exception as e:
+            if is_rate_limited(e):
+                self.scheduler.report_rate_limited(key, retry_after(e))
+            raise
+    
+    def _busy_result(self, model_name: str, error: Exception, **extra) -> Dict[str, Any]:
+        return self._error_result(model_name, str(error), f"⏳ {model_name} is busy (rate limit queue), please retry shortly",
+                                  busy=True, **extra)
+    
+    def _query(self, key: str, client, model_name: str, missing_msg: str,
+               system_prompt: str, user_prompt: str, deadline: float = None) -> Dict[str, Any]:
+        """Invoke one provider with retries, a latency budget and its circuit breaker
+        
+        The budget is PROVIDER_TIMEOUT, or what is left until ``deadline``
+        (set by callers that started the clock earlier, e.g. before the call
+        waited for a worker thread); scheduler waits and retries stay inside it.
+        """
+        if not client:
+            return self._error_result(model_name, f"{model_name} client not initialized", missing_msg)
         
         start_time = time.time()
+        budget = config.PROVIDER_TIMEOUT if deadline is None else deadline - start_time
+        if budget <= 0:
+            return self._error_result(model_name, "timeout", f"❌ Error: {model_name} timed out")
         
         try:
-            response = self.openrouter_client.invoke([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ])
+            response, attempts = call_with_retries(
+                lambda remaining: self._call_provider(key, lambda timeout: client.invoke([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ], timeout=timeout), remaining),
+                self.breakers[key],
+                budget=budget,
+                max_attempts=config.RETRY_MAX_ATTEMPTS,
+                base_delay=config.RETRY_BASE_DELAY,
+                max_delay=config.RETRY_MAX_DELAY
+            )
             
             answer = response.content if hasattr(response, 'content') else str(response)
             latency = round(time.time() - start_time, 2)
@@ -62,63 +141,238 @@ class ModelHandler:
                 "answer": answer,
                 "latency": latency,
                 "tokens": tokens,
-                "model": "OpenRouter"
+                "model": model_name,
+                "attempts": attempts
             }
+        except CircuitOpenError as e:
+            return self._error_result(model_name, str(e), f"⏸️ {model_name} is temporarily skipped (repeated failures)",
+                                      circuit_open=True)
+        except LocalRejection as e:
+            return self._busy_result(model_name, e)
         except Exception as e:
-            return {
-                "error": str(e),
-                "answer": f"❌ Error: {str(e)}",
-                "latency": round(time.time() - start_time, 2),
-                "tokens": 0,
-                "model": "OpenRouter"
-            }
+            return self._error_result(model_name, str(e), f"❌ Error: {str(e)}", round(time.time() - start_time, 2))
     
-    def query_llama3(self, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+    def query_openrouter(self, system_prompt: str, user_prompt: str, deadline: float = None) -> Dict[str, Any]:
+        """Query OpenRouter model"""
+        return self._query("openrouter", self.openrouter_client, "OpenRouter",
+                           "⚠️ OpenRouter API key missing", system_prompt, user_prompt, deadline)
+    
+    def query_llama3(self, system_prompt: str, user_prompt: str, deadline: float = None) -> Dict[str, Any]:
         """Query LLaMA3 via Groq"""
-        if not self.llama3_client:
-            return {
-                "error": "Groq client not initialized",
-                "answer": "⚠️ Groq API key missing",
-                "latency": 0,
-                "tokens": 0,
-                "model": "LLaMA3"
-            }
+        return self._query("llama3", self.llama3_client, "LLaMA3",
+                           "⚠️ Groq API key missing", system_prompt, user_prompt, deadline)
+    
+    @staticmethod
+    def _prompt_for(user_prompt: Union[str, Dict[str, str]], key: str) -> str:
+        """Shared prompt, or the model's own prompt when given per model key"""
+        return user_prompt[key] if isinstance(user_prompt, dict) else user_prompt
+    
+    def query_both(self, system_prompt: str, user_prompt: Union[str, Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+        """Query both models concurrently (each result keeps its own latency)
         
+        Both calls share one PROVIDER_TIMEOUT budget that ``_query`` enforces
+        (time spent waiting for a worker thread included); the wait here is
+        only a safety net for a client that ignores its timeout.
+        """
         start_time = time.time()
+        deadline = start_time + config.PROVIDER_TIMEOUT
+        queries = {"openrouter": self.query_openrouter, "llama3": self.query_llama3}
         
-        try:
-            response = self.llama3_client.invoke([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ])
-            
-            answer = response.content if hasattr(response, 'content') else str(response)
-            latency = round(time.time() - start_time, 2)
-            
-            # Estimate tokens
-            tokens = self._estimate_tokens(system_prompt + user_prompt + answer)
+        def call(key):
+            with span("provider_call", provider=key):
+                result = queries[key](system_prompt, self._prompt_for(user_prompt, key), deadline)
+            # Recorded by the worker, so a result that arrives after the safety net still counts
+            self.router.record(key, result)
+            return result
+        
+        # Each worker joins the caller's trace
+        futures = {key: self.executor.submit(propagate(call), key) for key in queries}
+        model_names = {"openrouter": "OpenRouter", "llama3": "LLaMA3"}
+        
+        results = {}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result(timeout=max(0, deadline + 5 - time.time()))
+            except FutureTimeout:
+                results[key] = {
+                    "error": "timeout",
+                    "answer": f"❌ Error: {model_names[key]} timed out",
+                    "latency": round(time.time() - start_time, 2),
+                    "tokens": 0,
+                    "model": model_names[key]
+                }
+        
+        return results
+    
+    def query_fastest(self, system_prompt: str, user_prompt: Union[str, Dict[str, str]]) -> Dict[str, Any]:
+        """Answer from whichever healthy provider is fastest (hedged, see LatencyRouter)"""
+        return self.router.route(system_prompt, user_prompt)
+    
+    # ===== STREAMING =====
+    
+    def _partial_result(self, model_name: str, message: str, parts, start_time: float,
+                        first_token_time: float, system_prompt: str, user_prompt: str) -> Dict[str, Any]:
+        """Error result of a stream that failed or stalled; tokens already shown are kept"""
+        partial = "".join(parts)
+        answer = f"{partial}\n\n⚠️ {model_name} stopped early ({message}), answer is incomplete" if partial else f"❌ Error: {message}"
+        return dict(
+            self._error_result(model_name, message, answer, round(time.time() - start_time, 2),
+                               ttft=round(first_token_time - start_time, 3) if first_token_time else 0,
+                               inter_token_latency=0),
+            tokens=self._estimate_tokens(system_prompt + user_prompt + partial) if partial else 0
+        )
+    
+    def _stream_model(self, key: str, client, model_name: str, missing_msg: str,
+                      system_prompt: str, user_prompt: str, emit, stop: threading.Event = None) -> Dict[str, Any]:
+        """Stream one model, calling emit(token) per chunk; returns the final result
+        
+        Failed attempts are retried (jittered, within PROVIDER_TIMEOUT) only
+        until the first token arrives, since shown tokens cannot be taken back.
+        Setting ``stop`` (the consumer gave up on the stream) ends it at the
+        next chunk.
+        """
+        stream_fields = {"ttft": 0, "inter_token_latency": 0}
+        if not client:
+            return self._error_result(model_name, f"{model_name} client not initialized", missing_msg, **stream_fields)
+        
+        breaker = self.breakers[key]
+        if not breaker.allow():
+            return self._error_result(model_name, f"{model_name} circuit open",
+                                      f"⏸️ {model_name} is temporarily skipped (repeated failures)",
+                                      circuit_open=True, **stream_fields)
+        
+        start_time = time.time()
+        deadline = start_time + config.PROVIDER_TIMEOUT
+        attempt = 0
+        
+        while True:
+            attempt += 1
+            first_token_time = None
+            last_token_time = None
+            gaps = []
+            parts = []
             
-            return {
-                "answer": answer,
-                "latency": latency,
-                "tokens": tokens,
-                "model": "LLaMA3"
-            }
-        except Exception as e:
-            return {
-                "error": str(e),
-                "answer": f"❌ Error: {str(e)}",
-                "latency": round(time.time() - start_time, 2),
-                "tokens": 0,
-                "model": "LLaMA3"
-            }
+            try:
+                remaining = max(deadline - time.time(), 0.001)
+                waited = self.scheduler.acquire(key, self.priority, timeout=min(self.scheduler.max_wait, remaining))
+                for chunk in client.stream([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ], timeout=min(self.timeouts[key], max(remaining - waited, 0.001))):
+                    if stop is not None and stop.is_set():
+                        # Already reported to the consumer as a timeout
+                        breaker.release()
+                        return self._partial_result(model_name, "stream abandoned", parts, start_time,
+                                                    first_token_time, system_prompt, user_prompt)
+                    token = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                    if not token:
+                        continue
+                    now = time.time()
+                    if first_token_time is None:
+                        first_token_time = now
+                    else:
+                        gaps.append(now - last_token_time)
+                    last_token_time = now
+                    parts.append(token)
+                    emit(token)
+                
+                breaker.record_success()
+                answer = "".join(parts)
+                end_time = time.time()
+                
+                return {
+                    "answer": answer,
+                    "latency": round(end_time - start_time, 2),
+                    "ttft": round((first_token_time or end_time) - start_time, 3),
+                    "inter_token_latency": round(sum(gaps) / len(gaps), 4) if gaps else 0,
+                    "tokens": self._estimate_tokens(system_prompt + user_prompt + answer),
+                    "model": model_name,
+                    "attempts": attempt
+                }
+            except LocalRejection as e:
+                breaker.release()
+                return self._busy_result(model_name, e, **stream_fields)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if is_rate_limited(e):
+                    # The scheduler backs off; throttling is not a provider failure
+                    self.scheduler.report_rate_limited(key, retry_after(e))
+                    breaker.release()
+                elif retryable:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                
+                delay = backoff_delay(attempt, config.RETRY_BASE_DELAY, config.RETRY_MAX_DELAY)
+                if (retryable and not parts and attempt < config.RETRY_MAX_ATTEMPTS
+                        and time.time() + delay < deadline and not (stop is not None and stop.is_set())
+                        and breaker.allow()):
+                    time.sleep(delay)
+                    continue
+                
+                return self._partial_result(model_name, str(e), parts, start_time,
+                                            first_token_time, system_prompt, user_prompt)
     
-    def query_both(self, system_prompt: str, user_prompt: str) -> Dict[str, Dict[str, Any]]:
-        """Query both models"""
-        openrouter_result = self.query_openrouter(system_prompt, user_prompt)
-        llama3_result = self.query_llama3(system_prompt, user_prompt)
-        
-        return {
-            "openrouter": openrouter_result,
-            "llama3": llama3_result
-        }
+    def stream_both(self, system_prompt: str, user_prompt: Union[str, Dict[str, str]]) -> Iterator[Tuple[str, str, Any]]:
+        """Stream both models concurrently
+        
+        Yields (key, "token", text) as tokens arrive and (key, "done", result)
+        once per model, where key is "openrouter" or "llama3". A model that
+        sends no token within PROVIDER_TIMEOUT (plus slack), or goes silent
+        for longer than its request timeout after streaming, is reported as
+        timed out with the tokens it sent, and its worker is told to stop.
+        """
+        events = queue.Queue()
+        model_names = {"openrouter": "OpenRouter", "llama3": "LLaMA3"}
+        stops = {key: threading.Event() for key in model_names}
+        
+        def run(key, client, model_name, missing_msg):
+            try:
+                with span("provider_stream", provider=key):
+                    result = self._stream_model(
+                        key, client, model_name, missing_msg, system_prompt, self._prompt_for(user_prompt, key),
+                        lambda token: events.put((key, "token", token)), stops[key]
+                    )
+            except Exception as e:
+                result = {"error": str(e), "answer": f"❌ Error: {str(e)}", "latency": 0,
+                          "ttft": 0, "inter_token_latency": 0, "tokens": 0, "model": model_name}
+            events.put((key, "done", result))
+        
+        self.executor.submit(propagate(run), "openrouter", self.openrouter_client, "OpenRouter", "⚠️ OpenRouter API key missing")
+        self.executor.submit(propagate(run), "llama3", self.llama3_client, "LLaMA3", "⚠️ Groq API key missing")
+        
+        # Safety net: the first token is due within the retry budget, later ones within an idle gap
+        start_time = time.time()
+        parts = {key: [] for key in model_names}
+        first_token = {}
+        expires = {key: start_time + config.PROVIDER_TIMEOUT + 5 for key in model_names}
+        pending = set(model_names)
+        try:
+            while pending:
+                try:
+                    event = events.get(timeout=max(0, min(expires[key] for key in pending) - time.time()))
+                except queue.Empty:
+                    now = time.time()
+                    for key in [key for key in pending if expires[key] <= now]:
+                        pending.discard(key)
+                        stops[key].set()
+                        result = self._partial_result(model_names[key], f"{model_names[key]} timed out", parts[key], start_time,
+                                                      first_token.get(key), system_prompt, self._prompt_for(user_prompt, key))
+                        self.router.record(key, result)
+                        yield key, "done", result
+                    continue
+                key, kind, payload = event
+                if key not in pending:
+                    continue
+                if kind == "token":
+                    parts[key].append(payload)
+                    first_token.setdefault(key, time.time())
+                    expires[key] = time.time() + self.timeouts[key] + 5
+                else:
+                    pending.discard(key)
+                    self.router.record(key, payload)
+                yield event
+        finally:
+            # Also reached when the caller stops iterating early
+            for stop in stops.values():
+                stop.set()
@@ -0,0 +1,173 @@
+import time
+import random
+import threading
+from typing import Dict, Any, Callable, List, Tuple
+
+class LocalRejection(Exception):
+    """Request refused locally, before reaching the provider (not a provider failure)"""
+
+class CircuitOpenError(LocalRejection):
+    """Raised instead of calling a provider whose breaker is open"""
+
+class CircuitBreaker:
+    """Skip a provider that keeps failing until a cool-down expires
+
+    closed -> open after ``failure_threshold`` consecutive failures;
+    open -> half-open once ``cooldown`` seconds have passed, letting a single
+    trial call through; the trial closes the breaker on success or re-opens
+    it on failure.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_in_flight = False
+
+    def _state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            return self._state()
+
+    def allow(self) -> bool:
+        """Whether a call may go out now (claims the half-open trial slot)"""
+        with self.lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a claimed trial slot without a verdict on the provider"""
+        with self.lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_flight:
+                    self.times_opened += 1
+                self.opened_at = time.time()
+            self._trial_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            state = self._state()
+            retry_in = 0.0
+            if state == "open":
+                retry_in = self.cooldown - (time.time() - self.opened_at)
+            return {
+                "provider": self.name,
+                "state": state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "retry_in": round(max(retry_in, 0.0), 1)
+            }
+
+def status_code(exc: Exception):
+    """HTTP status of a provider error, if the client exposes one"""
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def retry_after(exc: Exception):
+    """Seconds from a Retry-After header, if present"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def is_rate_limited(exc: Exception) -> bool:
+    """A provider 429: retryable, but the scheduler backs off instead of the breaker counting it"""
+    return status_code(exc) == 429 or "RateLimit" in type(exc).__name__
+
+def is_retryable(exc: Exception) -> bool:
+    """Timeouts, connection errors, 408/429 and 5xx are worth retrying"""
+    status = status_code(exc)
+    if status is not None:
+        return status in (408, 429) or status >= 500
+    name = type(exc).__name__
+    return any(kind in name for kind in ("Timeout", "Connection", "RateLimit", "ServiceUnavailable", "InternalServer"))
+
+def backoff_delay(attempt: int, base_delay: float = 0.5, max_delay: float = 4.0) -> float:
+    """Full-jitter exponential back-off before retry number `attempt`"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+def call_with_retries(fn: Callable[[float], Any], breaker: CircuitBreaker, budget: float,
+                      max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 4.0) -> Tuple[Any, int]:
+    """Call fn with full-jitter exponential backoff inside a total time budget
+
+    ``fn(remaining)`` gets the seconds left in the budget and must not run
+    longer (queueing included), so the last attempt cannot outlive the budget.
+    Returns (result, attempts). Gives up (re-raising the last error) when the
+    error is not retryable, attempts run out, the next back-off would end past
+    the budget, or the breaker opens. Rate limiting (429) is retried without
+    counting as a breaker failure: the scheduler already backs off, and a
+    provider throttling a burst is not down.
+    """
+    if not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} circuit open")
+
+    deadline = time.time() + budget
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            result = fn(max(0.0, deadline - time.time()))
+        except LocalRejection:
+            breaker.release()
+            raise
+        except Exception as e:
+            if not is_retryable(e):
+                # The provider answered; the request itself was rejected
+                breaker.record_success()
+                raise
+            if is_rate_limited(e):
+                breaker.release()
+            else:
+                breaker.record_failure()
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            if attempt >= max_attempts or time.time() + delay >= deadline or not breaker.allow():
+                raise
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return result, attempt
+
+# ===== PROCESS-WIDE REGISTRY =====
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(name: str, failure_threshold: int = 5, cooldown: float = 30.0) -> CircuitBreaker:
+    """Breaker shared by every session in this process"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, failure_threshold, cooldown)
+        return _breakers[name]
+
+def breaker_states() -> List[Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.snapshot() for breaker in breakers]
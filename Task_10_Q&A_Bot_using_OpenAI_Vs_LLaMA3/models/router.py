@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional
+import numpy as np
+from utils.config import config
+from utils.tracing import span, propagate
+
+PROVIDERS = ("openrouter", "llama3")
+MODEL_NAMES = {"openrouter": "OpenRouter", "llama3": "LLaMA3"}
+
+class ProviderHealth:
+    """Sliding window of recent latencies and outcomes for one provider"""
+
+    def __init__(self, window: int = 100):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self.lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+
+    @property
+    def samples(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency percentile over the window (None without samples)"""
+        with self.lock:
+            if not self.latencies:
+                return None
+            return float(np.percentile(list(self.latencies), p))
+
+    def error_rate(self) -> float:
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return 1 - sum(self.outcomes) / len(self.outcomes)
+
+class LatencyRouter:
+    """Send each question to the provider most likely to answer first
+
+    Providers are ranked by health (recent error rate, open circuit breaker)
+    and then by live p50 latency; a provider with too few samples is tried
+    first so both stay measured. If the chosen provider has not answered by its own p90
+    (``ROUTER_HEDGE_PERCENTILE``), or fails, a hedged request goes to the
+    other provider and whichever answers successfully first is returned.
+    """
+
+    def __init__(self, handler, window: int = 100, min_samples: int = 5,
+                 max_error_rate: float = 0.5, hedge_percentile: float = 90,
+                 default_hedge_delay: float = 3.0):
+        self.handler = handler
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.health = {key: ProviderHealth(window) for key in PROVIDERS}
+
+    def record(self, key: str, result: Dict[str, Any]):
+        """Feed one finished provider call (routed or side-by-side) into the stats"""
+        if result.get('busy') or result.get('circuit_open'):
+            return  # refused locally, says nothing about the provider's latency
+        self.health[key].record(float(result.get('latency', 0)), 'error' not in result)
+
+    def ranking(self) -> List[str]:
+        """Providers in the order they should be tried"""
+        def sort_key(key):
+            health = self.health[key]
+            unhealthy = (health.error_rate() > self.max_error_rate
+                         or self.handler.breakers[key].state == "open")
+            if health.samples < self.min_samples:
+                return (unhealthy, 0, health.samples)
+            return (unhealthy, 1, health.percentile(50))
+        return sorted(PROVIDERS, key=sort_key)
+
+    def hedge_delay(self, key: str) -> float:
+        """Seconds to wait on a provider before hedging to the other one"""
+        health = self.health[key]
+        if health.samples < self.min_samples:
+            return self.default_hedge_delay
+        return health.percentile(self.hedge_percentile)
+
+    def _submit(self, key: str, system_prompt: str, user_prompt: str, deadline: float):
+        query = self.handler.query_openrouter if key == "openrouter" else self.handler.query_llama3
+
+        def call():
+            with span("provider_call", provider=key):
+                result = query(system_prompt, user_prompt, deadline)
+            self.record(key, result)
+            return result
+        return self.handler.executor.submit(propagate(call))
+
+    def route(self, system_prompt: str, user_prompt) -> Dict[str, Any]:
+        """Fastest successful answer; the result names its `provider` and whether it was `hedged`"""
+        primary, secondary = self.ranking()
+        start_time = time.time()
+        # One budget for both providers, enforced by the calls themselves; the wait below is a safety net
+        budget_deadline = start_time + config.PROVIDER_TIMEOUT
+        deadline = budget_deadline + 5
+
+        futures = {
+            self._submit(primary, system_prompt, self.handler._prompt_for(user_prompt, primary), budget_deadline): primary
+        }
+        done, _ = wait(futures, timeout=self.hedge_delay(primary))
+        hedged = not done or 'error' in next(iter(done)).result()
+        if hedged:
+            futures[self._submit(secondary, system_prompt, self.handler._prompt_for(user_prompt, secondary), budget_deadline)] = secondary
+
+        pending = set(futures)
+        fallback = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                key, result = futures[future], future.result()
+                if 'error' not in result:
+                    return self._tag(result, key, hedged, start_time)
+                fallback = fallback or (key, result)
+
+        if fallback is not None:
+            return self._tag(fallback[1], fallback[0], hedged, start_time)
+        return self._tag({
+            "error": "timeout",
+            "answer": "❌ Error: no provider answered in time",
+            "latency": round(time.time() - start_time, 2),
+            "tokens": 0,
+            "model": MODEL_NAMES[primary]
+        }, primary, hedged, start_time)
+
+    @staticmethod
+    def _tag(result: Dict[str, Any], key: str, hedged: bool, start_time: float) -> Dict[str, Any]:
+        return dict(result, provider=key, hedged=hedged,
+                    total_latency=round(time.time() - start_time, 2))
@@ -0,0 +1,195 @@
+import time
+import heapq
+import itertools
+import threading
+from typing import Dict, Any, Optional
+from utils.config import config
+from models.resilience import LocalRejection
+
+# Lower value = served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+class SchedulerBusyError(LocalRejection):
+    """The provider's queue is full (back-pressure)"""
+
+class SchedulerTimeoutError(LocalRejection):
+    """Waited longer than the admission deadline for a provider slot"""
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity` banked"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_token(self) -> float:
+        """Seconds until one token is available (0 = now)"""
+        now = time.monotonic()
+        self._refill(now)
+        pause = max(0.0, self.paused_until - now)
+        if self.rate <= 0:
+            return pause
+        return max(pause, (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0)
+
+    def try_take(self) -> bool:
+        if self.time_until_token() > 0:
+            return False
+        if self.rate > 0:
+            self.tokens -= 1
+        return True
+
+    def drain(self, pause: float):
+        """Provider said 429: spend every banked token and stop for `pause` seconds"""
+        self.tokens = 0.0
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+class ProviderQueue:
+    """Bounded priority queue of callers waiting for one provider's rate limit"""
+
+    def __init__(self, name: str, requests_per_minute: float, burst: int, max_queue: int):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst)
+        self.max_queue = max_queue
+        self.heap = []
+        self.evicted = set()
+        self.admitted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+
+    def estimated_wait(self, ahead: Optional[int] = None) -> float:
+        """Seconds a new request would wait: queue ahead of it plus token refill"""
+        ahead = len(self.heap) if ahead is None else ahead
+        wait = self.bucket.time_until_token()
+        if self.bucket.rate > 0:
+            wait += ahead / self.bucket.rate
+        return wait
+
+class RequestScheduler:
+    """Process-wide admission control in front of every provider call
+
+    Each provider has a token bucket sized to its quota (requests per minute
+    with a small burst) and a bounded priority queue. Callers block in
+    ``acquire`` until they reach the head of the queue and a token is
+    available; interactive requests go ahead of batch ones. A full queue
+    rejects immediately (SchedulerBusyError, or displaces the least urgent
+    waiter for a more urgent request) instead of piling up retries,
+    and a provider 429 drains the bucket so waiting callers back off together.
+    """
+
+    def __init__(self, limits: Dict[str, float], burst: int = 5,
+                 max_queue: int = 50, max_wait: float = 30.0):
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self._seq = itertools.count()
+        self.queues = {
+            name: ProviderQueue(name, rpm, burst, max_queue)
+            for name, rpm in limits.items()
+        }
+
+    def acquire(self, provider: str, priority: int = PRIORITY_INTERACTIVE,
+                timeout: Optional[float] = None) -> float:
+        """Wait for a slot; returns seconds waited"""
+        q = self.queues[provider]
+        timeout = self.max_wait if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self.cond:
+            entry = (priority, next(self._seq))
+            if len(q.heap) >= q.max_queue:
+                # Full: a more urgent request displaces the newest, least urgent waiter
+                worst = max(q.heap)
+                if entry >= worst:
+                    q.rejected += 1
+                    raise SchedulerBusyError(
+                        f"{provider} queue full, estimated wait {q.estimated_wait():.0f}s"
+                    )
+                q.heap.remove(worst)
+                heapq.heapify(q.heap)
+                q.evicted.add(worst)
+                self.cond.notify_all()
+            heapq.heappush(q.heap, entry)
+
+            while True:
+                if entry in q.evicted:
+                    q.evicted.discard(entry)
+                    q.rejected += 1
+                    raise SchedulerBusyError(f"{provider} queue full, displaced by higher-priority requests")
+
+                now = time.monotonic()
+                at_head = q.heap[0] == entry
+                if at_head and q.bucket.try_take():
+                    heapq.heappop(q.heap)
+                    waited = now - start
+                    q.admitted += 1
+                    q.total_wait += waited
+                    self.cond.notify_all()
+                    return waited
+
+                if now >= deadline:
+                    q.heap.remove(entry)
+                    heapq.heapify(q.heap)
+                    q.rejected += 1
+                    self.cond.notify_all()
+                    raise SchedulerTimeoutError(f"{provider} slot not available within {timeout:.0f}s")
+
+                wake = deadline - now
+                if at_head:
+                    wake = min(wake, max(q.bucket.time_until_token(), 0.001))
+                self.cond.wait(timeout=wake)
+
+    def report_rate_limited(self, provider: str, retry_after: float = None):
+        """Feed a provider 429 back into the bucket"""
+        q = self.queues[provider]
+        with self.cond:
+            q.rate_limited += 1
+            pause = retry_after if retry_after else (1.0 / q.bucket.rate if q.bucket.rate > 0 else 1.0)
+            q.bucket.drain(pause)
+            self.cond.notify_all()
+
+    def estimated_wait(self, provider: str) -> float:
+        with self.cond:
+            return self.queues[provider].estimated_wait()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        """Queue depth, quota and wait signals per provider (for the UI)"""
+        with self.cond:
+            return {
+                name: {
+                    "queued": len(q.heap),
+                    "requests_per_minute": round(q.bucket.rate * 60, 1),
+                    "tokens_available": round(q.bucket.tokens, 2),
+                    "estimated_wait": round(q.estimated_wait(), 1),
+                    "admitted": q.admitted,
+                    "rejected": q.rejected,
+                    "rate_limited": q.rate_limited,
+                    "avg_wait": round(q.total_wait / q.admitted, 2) if q.admitted else 0.0
+                }
+                for name, q in self.queues.items()
+            }
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> RequestScheduler:
+    """Scheduler shared by every session and ModelHandler in this process"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler(
+                {"openrouter": config.OPENROUTER_RPM, "llama3": config.GROQ_RPM},
+                burst=config.SCHEDULER_BURST,
+                max_queue=config.SCHEDULER_MAX_QUEUE,
+                max_wait=config.SCHEDULER_MAX_WAIT
+            )
+        return _scheduler
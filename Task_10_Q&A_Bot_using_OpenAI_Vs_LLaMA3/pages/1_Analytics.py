@@ -1,5 +1,11 @@
 import streamlit as st
 from ui.styles import get_custom_css
+from utils.config import config
+from analytics.store import get_analytics_store
+from models.resilience import breaker_states
+from models.scheduler import get_scheduler
+from utils.startup import startup_report
+from utils.index_registry import get_index_registry
 
 # Page config
 st.set_page_config(
@@ -29,15 +35,81 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Durable store shared by every session (pre-aggregated per-minute rollups)
+store = get_analytics_store(
+    config.ANALYTICS_DB_PATH,
+    batch_size=config.ANALYTICS_BATCH_SIZE,
+    flush_interval=config.ANALYTICS_FLUSH_SECONDS,
+    raw_retention_days=config.ANALYTICS_RAW_RETENTION_DAYS
+)
+
+def render_history():
+    """Latency windows across all sessions and restarts"""
+    if store is None:
+        return
+    
+    st.markdown("## 🕒 Latency History (All Sessions)")
+    # Buffered records reach the store within ANALYTICS_FLUSH_SECONDS; flush now only on request
+    if st.button("🔄 Refresh", help="Write buffered queries to the store now"):
+        store.flush()
+    
+    windows = {"Last Hour": 3600, "Last 24 Hours": 86400, "Last 7 Days": 7 * 86400}
+    label = st.radio("Window", list(windows), horizontal=True)
+    openai_window = store.window_summary("openai", windows[label])
+    llama3_window = store.window_summary("llama3", windows[label])
+    
+    st.table({
+        "Metric": ["Queries", "Avg Latency", "p50", "p95", "p99", "Min", "Max", "Total Tokens"],
+        "🤖 OpenAI": [
+            f"{openai_window['count']}",
+            f"{openai_window['avg']}s",
+            f"{openai_window['p50']}s",
+            f"{openai_window['p95']}s",
+            f"{openai_window['p99']}s",
+            f"{openai_window['min']}s",
+            f"{openai_window['max']}s",
+            f"{openai_window['tokens']:,}"
+        ],
+        "🦙 LLaMA3": [
+            f"{llama3_window['count']}",
+            f"{llama3_window['avg']}s",
+            f"{llama3_window['p50']}s",
+            f"{llama3_window['p95']}s",
+            f"{llama3_window['p99']}s",
+            f"{llama3_window['min']}s",
+            f"{llama3_window['max']}s",
+            f"{llama3_window['tokens']:,}"
+        ]
+    })
+    
+    openai_days = {row["day"]: row for row in store.daily_summary("openai")}
+    llama3_days = {row["day"]: row for row in store.daily_summary("llama3")}
+    days = sorted(set(openai_days) | set(llama3_days), reverse=True)
+    if days:
+        st.markdown("#### 📅 Per Day")
+        empty = {"count": 0, "avg": 0.0, "p95": 0.0}
+        st.table({
+            "Day": days,
+            "Queries": [openai_days.get(d, llama3_days.get(d, empty))["count"] for d in days],
+            "🤖 Avg": [f"{openai_days.get(d, empty)['avg']}s" for d in days],
+            "🤖 p95": [f"{openai_days.get(d, empty)['p95']}s" for d in days],
+            "🦙 Avg": [f"{llama3_days.get(d, empty)['avg']}s" for d in days],
+            "🦙 p95": [f"{llama3_days.get(d, empty)['p95']}s" for d in days]
+        })
+    
+    st.markdown("---")
+
 # Check if analytics exists
 if 'analytics' not in st.session_state:
     st.error("⚠️ No analytics data available. Please run some queries first!")
+    render_history()
     st.stop()
 
 analytics = st.session_state.analytics
 
 if analytics.total_queries == 0:
     st.info("📊 Ask some questions to generate analytics data!")
+    render_history()
     st.stop()
 
 # ===== OVERVIEW =====
@@ -82,22 +154,30 @@ st.markdown("---")
 st.markdown("## ⚡ Speed & Performance")
 
 speed_data = {
-    "Metric": ["Avg Latency", "Median", "Min", "Max", "Tokens/sec", "Total Time"],
+    "Metric": ["Avg Latency", "Median", "p95", "p99", "Min", "Max", "Avg TTFT", "Inter-token", "Tokens/sec", "Total Time"],
     "🤖 OpenAI": [
         f"{analytics.get_avg_latency('openai')}s",
         f"{analytics.get_median_latency('openai')}s",
+        f"{analytics.get_latency_percentile('openai', 95)}s",
+        f"{analytics.get_latency_percentile('openai', 99)}s",
         f"{analytics.get_min_latency('openai')}s",
         f"{analytics.get_max_latency('openai')}s",
+        f"{analytics.get_avg_ttft('openai')}s",
+        f"{analytics.get_avg_inter_token_latency('openai')}ms",
         f"{analytics.get_tokens_per_second('openai'):.1f}",
-        f"{sum(analytics.openai_latencies):.2f}s" if analytics.openai_latencies else "0.00s"
+        f"{analytics.get_total_latency('openai'):.2f}s"
     ],
     "🦙 LLaMA3": [
         f"{analytics.get_avg_latency('llama3')}s",
         f"{analytics.get_median_latency('llama3')}s",
+        f"{analytics.get_latency_percentile('llama3', 95)}s",
+        f"{analytics.get_latency_percentile('llama3', 99)}s",
         f"{analytics.get_min_latency('llama3')}s",
         f"{analytics.get_max_latency('llama3')}s",
+        f"{analytics.get_avg_ttft('llama3')}s",
+        f"{analytics.get_avg_inter_token_latency('llama3')}ms",
         f"{analytics.get_tokens_per_second('llama3'):.1f}",
-        f"{sum(analytics.llama3_latencies):.2f}s" if analytics.llama3_latencies else "0.00s"
+        f"{analytics.get_total_latency('llama3'):.2f}s"
     ]
 }
 
@@ -105,19 +185,45 @@ st.table(speed_data)
 
 st.markdown("---")
 
+# ===== STAGE BREAKDOWN =====
+st.markdown("## 🧭 Stage Breakdown")
+
+stages = analytics.get_stage_breakdown()
+if stages:
+    st.table({
+        "Stage": [("  " * row["stage"].count("/")) + row["stage"].split("/")[-1] for row in stages],
+        "Count": [row["count"] for row in stages],
+        "Avg": [f"{row['avg_ms']}ms" for row in stages],
+        "p50": [f"{row['p50_ms']}ms" for row in stages],
+        "p95": [f"{row['p95_ms']}ms" for row in stages],
+        "p99": [f"{row['p99_ms']}ms" for row in stages],
+        "Max": [f"{row['max_ms']}ms" for row in stages]
+    })
+else:
+    st.info("No traced requests yet.")
+
+st.markdown("---")
+
+# ===== LATENCY HISTORY =====
+render_history()
+
 # ===== COST & EFFICIENCY =====
 st.markdown("## 💰 Cost & Efficiency")
 
 cost_data = {
-    "Metric": ["Total Tokens", "Avg Tokens/Query", "Estimated Cost"],
+    "Metric": ["Total Tokens", "Avg Tokens/Query", "Avg Context Tokens", "Context Tokens Saved", "Estimated Cost"],
     "🤖 OpenAI": [
         f"{analytics.get_total_tokens('openai'):,}",
         f"{analytics.get_avg_tokens_per_query('openai')}",
+        f"{analytics.get_avg_context_tokens('openai')}",
+        f"{analytics.get_tokens_saved('openai'):,} ({analytics.get_context_savings_rate('openai')}%)",
         f"${analytics.get_estimated_cost('openai'):.4f}"
     ],
     "🦙 LLaMA3": [
         f"{analytics.get_total_tokens('llama3'):,}",
         f"{analytics.get_avg_tokens_per_query('llama3')}",
+        f"{analytics.get_avg_context_tokens('llama3')}",
+        f"{analytics.get_tokens_saved('llama3'):,} ({analytics.get_context_savings_rate('llama3')}%)",
         "FREE"
     ]
 }
@@ -126,6 +232,125 @@ st.table(cost_data)
 
 st.markdown("---")
 
+# ===== ANSWER CACHE =====
+st.markdown("## ♻️ Answer Cache")
+
+col1, col2, col3 = st.columns(3)
+with col1:
+    st.metric("Cache Hits", analytics.cache_hits)
+with col2:
+    st.metric("Cache Misses", analytics.cache_misses)
+with col3:
+    st.metric("Hit Rate", f"{analytics.get_cache_hit_rate()}%")
+
+st.markdown("---")
+
+# ===== RERANK CASCADE =====
+rerank = analytics.get_rerank_summary()
+if rerank["queries"]:
+    st.markdown("## 🎯 Rerank Cascade")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Retrievals", rerank["queries"])
+    with col2:
+        st.metric("Cross-Encoder Skipped", f"{rerank['skip_rate']}%")
+    with col3:
+        st.metric("Pairs Saved", f"{rerank['pairs_saved_rate']}%")
+    
+    st.markdown("---")
+
+# ===== STARTUP =====
+startup = startup_report()
+if startup and startup["milestones_s"]:
+    st.markdown("## 🚀 Startup")
+    
+    milestones = startup["milestones_s"]
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("First Render", f"{milestones['first_render']}s" if "first_render" in milestones else "-")
+    with col2:
+        st.metric("Models Ready", f"{milestones['models_ready']}s" if "models_ready" in milestones else "⏳ loading")
+    with col3:
+        st.metric("Warm-up", f"{startup['phases_s']['warm_up']}s" if "warm_up" in startup["phases_s"] else "-")
+    st.table({
+        "Phase": list(startup["phases_s"]),
+        "Seconds": [f"{seconds:.2f}" for seconds in startup["phases_s"].values()]
+    })
+    
+    st.markdown("---")
+
+# ===== SHARED INDEXES =====
+registry = get_index_registry().stats()
+if registry["indexes"]:
+    st.markdown("## 🗂️ Shared Indexes")
+    
+    lookups = registry["hits"] + registry["misses"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Indexes", registry["indexes"], help=f"{registry['in_use']} in use by {registry['references']} holders")
+    with col2:
+        ceiling = f" / {registry['max_mb']:.0f}" if registry["max_mb"] else ""
+        st.metric("Memory (MB)", f"{registry['memory_mb']:.1f}{ceiling}")
+    with col3:
+        st.metric("Reuse Rate", f"{registry['hits'] / lookups * 100:.0f}%" if lookups else "-")
+    with col4:
+        st.metric("Evictions", registry["evictions"])
+    st.table({
+        "Index": [entry["key"] for entry in registry["entries"]],
+        "Holders": [entry["refs"] for entry in registry["entries"]],
+        "Memory (MB)": [f"{entry['memory_mb']:.2f}" for entry in registry["entries"]]
+    })
+    
+    st.markdown("---")
+
+# ===== PROVIDER HEALTH =====
+breakers = breaker_states()
+if breakers:
+    st.markdown("## 🛡️ Provider Health")
+    
+    state_labels = {"closed": "🟢 Healthy", "half_open": "🟡 Trial call", "open": "🔴 Skipped"}
+    model_labels = {"openrouter": "🤖 OpenAI", "llama3": "🦙 LLaMA3"}
+    st.table({
+        "Provider": [model_labels.get(b["provider"], b["provider"]) for b in breakers],
+        "Circuit": [state_labels[b["state"]] for b in breakers],
+        "Consecutive Failures": [b["consecutive_failures"] for b in breakers],
+        "Times Opened": [b["times_opened"] for b in breakers],
+        "Retry In": [f"{b['retry_in']}s" if b["state"] == "open" else "-" for b in breakers]
+    })
+    
+    queues = get_scheduler().status()
+    st.markdown("#### 🚦 Request Queue (all sessions)")
+    st.table({
+        "Provider": [model_labels.get(name, name) for name in queues],
+        "Quota": [f"{q['requests_per_minute']}/min" if q["requests_per_minute"] else "unlimited" for q in queues.values()],
+        "Queued": [q["queued"] for q in queues.values()],
+        "Est. Wait": [f"{q['estimated_wait']}s" for q in queues.values()],
+        "Avg Wait": [f"{q['avg_wait']}s" for q in queues.values()],
+        "Admitted": [q["admitted"] for q in queues.values()],
+        "Rejected": [q["rejected"] for q in queues.values()],
+        "429s": [q["rate_limited"] for q in queues.values()]
+    })
+    
+    st.markdown("---")
+
+# ===== FASTEST-ANSWER ROUTING =====
+routing = analytics.get_routing_summary()
+if routing["queries"]:
+    st.markdown("## ⚡ Fastest-Answer Routing")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Routed Queries", routing["queries"])
+    with col2:
+        st.metric("Served by OpenAI / LLaMA3", f"{routing['openai_share']}% / {routing['llama3_share']}%")
+    with col3:
+        st.metric("Hedged", f"{routing['hedge_rate']}%")
+    with col4:
+        st.metric("p50 / p95", f"{routing['p50']}s / {routing['p95']}s")
+    
+    st.markdown("---")
+
 # ===== PERFORMANCE WINNER =====
 st.markdown("## 🏆 Performance Winner")
 
@@ -217,7 +442,7 @@ comparison_data = {
         f"{analytics.get_max_latency('openai')}s",
         f"{analytics.get_median_latency('openai')}s",
         f"{analytics.get_tokens_per_second('openai'):.1f}",
-        f"{sum(analytics.openai_latencies):.2f}s" if analytics.openai_latencies else "0.00s",
+        f"{analytics.get_total_latency('openai'):.2f}s",
         f"{analytics.get_total_tokens('openai'):,}",
         f"{analytics.get_avg_tokens_per_query('openai')}",
         f"{analytics.openai_wins}",
@@ -233,7 +458,7 @@ comparison_data = {
         f"{analytics.get_max_latency('llama3')}s",
         f"{analytics.get_median_latency('llama3')}s",
         f"{analytics.get_tokens_per_second('llama3'):.1f}",
-        f"{sum(analytics.llama3_latencies):.2f}s" if analytics.llama3_latencies else "0.00s",
+        f"{analytics.get_total_latency('llama3'):.2f}s",
         f"{analytics.get_total_tokens('llama3'):,}",
         f"{analytics.get_avg_tokens_per_query('llama3')}",
         f"{analytics.llama3_wins}",
@@ -256,14 +481,35 @@ with st.expander("📖 Metrics Explanation"):
     
     ### Speed & Performance Metrics
     - **Avg/Median/Min/Max Latency**: Response time statistics
+    - **p95/p99**: Tail latency from a streaming quantile sketch (within 1%)
+    - **Latency History**: Windowed stats across all sessions, read from the SQLite rollups
+    - **Stage Breakdown**: Time spent in each pipeline stage (embedding, search, BM25, rerank, prompt, generation)
+    - **Avg TTFT**: Time until the first streamed token appears (perceived latency)
+    - **Inter-token**: Average gap between streamed tokens
     - **Tokens/sec**: Generation speed (higher is better)
     - **Total Time**: Cumulative time spent generating responses
     
     ### Cost & Efficiency Metrics
     - **Total Tokens**: Sum of all tokens used
     - **Avg Tokens/Query**: Average tokens per query
+    - **Avg Context Tokens**: Retrieved context actually sent per query (after packing)
+    - **Context Tokens Saved**: Context dropped as near-duplicate or over the model's token budget
     - **Estimated Cost**: API cost (OpenAI ~$0.0001 per 1k tokens, LLaMA3 is FREE)
     
+    ### Provider Health
+    - **Circuit**: A model that fails repeatedly (timeouts, connection errors, 5xx; 429s only pause its queue) is skipped until its cool-down expires, then one trial call decides whether it is healthy again
+    - **Retry In**: Seconds until the trial call is allowed
+    - **Request Queue**: Provider calls from every session share a per-provider quota (`OPENROUTER_RPM`, `GROQ_RPM`); calls wait in a bounded priority queue (interactive before batch) and are rejected when it is full; a 429 from the provider pauses the queue
+    
+    ### Fastest-Answer Routing
+    - **Served by**: Which model answered routed queries (the faster healthy one by live p50)
+    - **Hedged**: Queries where the first model passed its p90 latency (or failed) and the other model was asked too
+    - **p50 / p95**: End-to-end latency of routed answers
+    
+    ### Answer Cache
+    - **Hits/Misses**: Questions answered from the semantic cache vs. sent to both models
+    - **Hit Rate**: Share of questions served from the cache (no provider tokens spent)
+    
     ### User Preference
     - **Votes**: Number of times users selected this model as better
     - Shows which model users prefer based on answer quality
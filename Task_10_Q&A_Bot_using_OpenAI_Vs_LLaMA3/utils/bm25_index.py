@@ -0,0 +1,248 @@
+import math
+import threading
+from typing import List, Dict, Tuple
+import numpy as np
+
+def tokenize(text: str) -> List[str]:
+    """Same tokenization the retriever has always used for BM25"""
+    return text.lower().split()
+
+class InvertedBM25:
+    """Sparse inverted-index BM25 with incremental add/remove
+
+    Each term owns a postings pair (doc ids, term frequencies) stored as NumPy
+    arrays, and the per-document length norm ``k1 * (1 - b + b * len / avgdl)``
+    is precomputed, so a query only touches the postings of its own terms.
+    Documents are appended or tombstoned without rebuilding the index.
+    Updates and the lazy postings merge run under a lock, so concurrent
+    queries (several sessions or batch workers) share one index safely.
+
+    IDF uses the non-negative ``log(1 + (N - n + 0.5) / (n + 0.5))`` form, so
+    very common terms never subtract from a score.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+
+        self.vocab: Dict[str, int] = {}
+        self.df: List[int] = []
+
+        # Postings: compacted arrays plus a pending buffer for new documents
+        self._post_ids: List[np.ndarray] = []
+        self._post_tfs: List[np.ndarray] = []
+        self._pending: List[List[Tuple[int, int]]] = []
+
+        # Per-document columns (indexed by doc id)
+        self.doc_len = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self._doc_terms: List[np.ndarray] = []
+
+        self.n_docs = 0
+        self.total_len = 0
+        self._norm = np.zeros(0, dtype=np.float32)
+        self._norm_dirty = True
+        self._dead_postings = 0
+        self._live_postings = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of doc id slots (including removed documents)"""
+        return len(self.doc_len)
+
+    def memory_bytes(self) -> int:
+        """Approximate heap size: postings (id, tf, per-document term list) plus
+        per-term (vocabulary entry, array headers) and per-document overheads"""
+        postings = (self._live_postings + self._dead_postings) * (8 + 4 + 4)
+        return postings + len(self.vocab) * 300 + len(self.doc_len) * 130
+
+    # ===== UPDATES =====
+
+    def add_documents(self, texts: List[str]) -> List[int]:
+        """Index new documents, returning their doc ids"""
+        with self._lock:
+            return self._add_documents(texts)
+
+    def _add_documents(self, texts: List[str]) -> List[int]:
+        start = len(self.doc_len)
+        lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for offset, text in enumerate(texts):
+            doc_id = start + offset
+            counts: Dict[int, int] = {}
+            tokens = tokenize(text)
+            for token in tokens:
+                term_id = self.vocab.get(token)
+                if term_id is None:
+                    term_id = len(self.vocab)
+                    self.vocab[token] = term_id
+                    self.df.append(0)
+                    self._post_ids.append(np.zeros(0, dtype=np.int64))
+                    self._post_tfs.append(np.zeros(0, dtype=np.float32))
+                    self._pending.append([])
+                counts[term_id] = counts.get(term_id, 0) + 1
+
+            for term_id, tf in counts.items():
+                self._pending[term_id].append((doc_id, tf))
+                self.df[term_id] += 1
+            self._doc_terms.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            self._live_postings += len(counts)
+
+            lengths[offset] = len(tokens)
+            self.total_len += len(tokens)
+
+        self.doc_len = np.concatenate([self.doc_len, lengths])
+        self.alive = np.concatenate([self.alive, np.ones(len(texts), dtype=bool)])
+        self.n_docs += len(texts)
+        self._norm_dirty = True
+        return list(range(start, start + len(texts)))
+
+    def remove_documents(self, doc_ids: List[int]):
+        """Tombstone documents; their postings are dropped on the next compaction"""
+        with self._lock:
+            for doc_id in doc_ids:
+                if doc_id < 0 or doc_id >= len(self.alive) or not self.alive[doc_id]:
+                    continue
+                self.alive[doc_id] = False
+                for term_id in self._doc_terms[doc_id]:
+                    self.df[term_id] -= 1
+                self._dead_postings += len(self._doc_terms[doc_id])
+                self._live_postings -= len(self._doc_terms[doc_id])
+                self._doc_terms[doc_id] = np.zeros(0, dtype=np.int32)
+                self.total_len -= int(self.doc_len[doc_id])
+                self.n_docs -= 1
+            self._norm_dirty = True
+
+    def _postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Merge pending postings into the term's arrays"""
+        pending = self._pending[term_id]
+        if pending:
+            ids, tfs = zip(*pending)
+            self._post_ids[term_id] = np.concatenate([self._post_ids[term_id], np.asarray(ids, dtype=np.int64)])
+            self._post_tfs[term_id] = np.concatenate([self._post_tfs[term_id], np.asarray(tfs, dtype=np.float32)])
+            self._pending[term_id] = []
+        return self._post_ids[term_id], self._post_tfs[term_id]
+
+    def _refresh(self):
+        """Recompute length norms and compact postings after updates"""
+        if not self._norm_dirty:
+            return
+        avgdl = self.total_len / self.n_docs if self.n_docs else 1.0
+        avgdl = avgdl or 1.0
+        self._norm = (self.k1 * (1 - self.b + self.b * self.doc_len / avgdl)).astype(np.float32)
+
+        # Drop tombstoned postings once they make up a quarter of the index
+        if self._dead_postings and self._dead_postings * 3 > self._live_postings:
+            for term_id in range(len(self.vocab)):
+                ids, tfs = self._postings(term_id)
+                keep = self.alive[ids]
+                self._post_ids[term_id] = ids[keep]
+                self._post_tfs[term_id] = tfs[keep]
+            self._dead_postings = 0
+        self._norm_dirty = False
+
+    # ===== SCORING =====
+
+    def _idf(self, term_id: int) -> float:
+        n = self.df[term_id]
+        return math.log(1 + (self.n_docs - n + 0.5) / (n + 0.5))
+
+    def score(self, tokens: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse BM25: (doc ids, scores) for documents containing a query term"""
+        all_ids, all_scores = [], []
+        with self._lock:
+            self._refresh()
+            for token in tokens:
+                term_id = self.vocab.get(token)
+                if term_id is None or self.df[term_id] <= 0:
+                    continue
+                ids, tfs = self._postings(term_id)
+                if self._dead_postings:
+                    keep = self.alive[ids]
+                    ids, tfs = ids[keep], tfs[keep]
+                contrib = self._idf(term_id) * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+                all_ids.append(ids)
+                all_scores.append(contrib)
+
+        if not all_ids:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        ids = np.concatenate(all_ids)
+        contribs = np.concatenate(all_scores)
+        doc_ids, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contribs, minlength=len(doc_ids))
+        return doc_ids, scores.astype(np.float32)
+
+    def search(self, tokens: List[str], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k doc ids and scores, best first"""
+        doc_ids, scores = self.score(tokens)
+        if top_k <= 0:
+            return doc_ids[:0], scores[:0]
+        if len(doc_ids) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+            doc_ids, scores = doc_ids[part], scores[part]
+        order = np.argsort(-scores)
+        return doc_ids[order], scores[order]
+
+    def get_scores(self, tokens: List[str]) -> np.ndarray:
+        """Dense score vector over all doc id slots (BM25Okapi-compatible)"""
+        doc_ids, scores = self.score(tokens)
+        dense = np.zeros(len(self.doc_len), dtype=np.float32)
+        dense[doc_ids] = scores
+        return dense
+
+    # ===== PERSISTENCE =====
+
+    def save(self, path: str):
+        """Write the index to one .npz file (live postings flattened with offsets)"""
+        with self._lock:
+            terms = sorted(self.vocab, key=self.vocab.get)
+            ids_list, tfs_list = [], []
+            for term_id in range(len(terms)):
+                ids, tfs = self._postings(term_id)
+                keep = self.alive[ids]
+                ids_list.append(ids[keep])
+                tfs_list.append(tfs[keep])
+            offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(ids) for ids in ids_list])
+            np.savez(
+                path,
+                # Tokens never contain whitespace, so newline-joined UTF-8 is unambiguous
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+                offsets=offsets,
+                post_ids=np.concatenate(ids_list) if ids_list else np.zeros(0, dtype=np.int64),
+                post_tfs=np.concatenate(tfs_list) if tfs_list else np.zeros(0, dtype=np.float32),
+                doc_len=self.doc_len,
+                alive=self.alive,
+                params=np.array([self.k1, self.b], dtype=np.float64)
+            )
+
+    @classmethod
+    def load(cls, path: str) -> "InvertedBM25":
+        """Index written by save()"""
+        data = np.load(path)
+        k1, b = data["params"]
+        index = cls(float(k1), float(b))
+
+        text = data["terms"].tobytes().decode("utf-8")
+        terms = text.split("\n") if text else []
+        offsets, post_ids, post_tfs = data["offsets"], data["post_ids"], data["post_tfs"]
+
+        index.vocab = {term: term_id for term_id, term in enumerate(terms)}
+        index.df = np.diff(offsets).tolist()
+        index._post_ids = [post_ids[offsets[t]:offsets[t + 1]] for t in range(len(terms))]
+        index._post_tfs = [post_tfs[offsets[t]:offsets[t + 1]] for t in range(len(terms))]
+        index._pending = [[] for _ in terms]
+
+        index.doc_len = data["doc_len"]
+        index.alive = data["alive"]
+        index.n_docs = int(index.alive.sum())
+        index.total_len = int(index.doc_len[index.alive].sum())
+        index._live_postings = len(post_ids)
+
+        # Per-document term lists (needed by remove_documents), inverted from the postings
+        term_of = np.repeat(np.arange(len(terms), dtype=np.int32), np.diff(offsets))
+        order = np.argsort(post_ids, kind="stable")
+        bounds = np.searchsorted(post_ids[order], np.arange(len(index.doc_len) + 1))
+        index._doc_terms = [term_of[order[bounds[d]:bounds[d + 1]]] for d in range(len(index.doc_len))]
+        return index
@@ -0,0 +1,216 @@
+import json
+import threading
+import weakref
+from typing import Any, Dict, Iterable, Iterator, List, Union
+from langchain_core.documents import Document
+import numpy as np
+
+# Marks a missing value in an integer column
+_NA = np.iinfo(np.int64).min
+
+class _Column:
+    """Append-only NumPy array that doubles its capacity as it grows"""
+
+    def __init__(self, dtype, fill):
+        self.fill = fill
+        self.data = np.full(16, fill, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values: np.ndarray):
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.full(max(needed, 2 * len(self.data)), self.fill, dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.data[:self.size]
+
+def _lookup_key(value: Any):
+    """Dictionary key of a metadata value (unhashable values by their JSON)"""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("json", json.dumps(value, sort_keys=True, default=str))
+
+class ChunkStore:
+    """Chunks as one UTF-8 text buffer, NumPy offsets and columnar metadata
+
+    Chunk i is ``buffer[offsets[i]:offsets[i + 1]]``. Integer metadata (page,
+    start, end) is stored as int64 columns; any other value as int32 codes
+    into the column's distinct values (e.g. one ``source`` string shared by
+    every chunk). ``store[i]`` builds a ``Document`` view on demand; a view is
+    cached while anyone holds it, so the same chunk is the same object within
+    a query (rank fusion and ``position`` rely on that). Views are snapshots:
+    changing their metadata does not change the store.
+    """
+
+    def __init__(self, documents: Iterable[Document] = ()):
+        self._text = bytearray()
+        self._offsets = _Column(np.int64, 0)
+        self._offsets.extend(np.zeros(1, dtype=np.int64))
+        self._ints: Dict[str, _Column] = {}
+        self._codes: Dict[str, _Column] = {}
+        self._values: Dict[str, List[Any]] = {}
+        self._value_codes: Dict[str, Dict[Any, int]] = {}
+        self._keys: List[str] = []
+        self._views: "weakref.WeakValueDictionary[int, Document]" = weakref.WeakValueDictionary()
+        self._view_positions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.extend(documents)
+
+    # ===== WRITING =====
+
+    def extend(self, documents: Iterable[Document]) -> range:
+        """Append chunks; returns their positions"""
+        return self.extend_rows((doc.page_content, doc.metadata) for doc in documents)
+
+    def extend_rows(self, rows: Iterable) -> range:
+        """Append (text, metadata) rows without building Documents"""
+        start = len(self)
+        texts, metadatas = [], []
+        for text, metadata in rows:
+            texts.append(text.encode("utf-8"))
+            metadatas.append(metadata or {})
+        if not texts:
+            return range(start, start)
+
+        lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+        self._offsets.extend(self._offsets.values[-1] + np.cumsum(lengths))
+        self._text.extend(b"".join(texts))
+
+        batch_keys = dict.fromkeys(key for metadata in metadatas for key in metadata)
+        for key in self._keys + [key for key in batch_keys if key not in self._ints and key not in self._codes]:
+            self._append_column(key, [metadata.get(key, _NA) for metadata in metadatas], start)
+        return range(start, len(self))
+
+    def _append_column(self, key: str, values: List[Any], start: int):
+        if key not in self._keys:
+            self._keys.append(key)
+        all_ints = all(type(value) is int for value in values)
+        if key not in self._codes and all_ints and key in self._ints:
+            self._ints[key].extend(np.asarray(values, dtype=np.int64))
+            return
+        if key not in self._codes and all_ints and key not in self._ints:
+            column = self._ints[key] = _Column(np.int64, _NA)
+            column.extend(np.full(start, _NA, dtype=np.int64))
+            column.extend(np.asarray(values, dtype=np.int64))
+            return
+        if key in self._ints:
+            # A non-integer value: switch the column to coded values
+            ints = self._ints.pop(key).values
+            self._new_coded(key, 0)
+            self._codes[key].extend(self._encode(key, [_NA if v == _NA else int(v) for v in ints]))
+        elif key not in self._codes:
+            self._new_coded(key, start)
+        self._codes[key].extend(self._encode(key, values))
+
+    def _new_coded(self, key: str, start: int):
+        self._codes[key] = _Column(np.int32, -1)
+        self._codes[key].extend(np.full(start, -1, dtype=np.int32))
+        self._values[key] = []
+        self._value_codes[key] = {}
+
+    def _encode(self, key: str, values: List[Any]) -> np.ndarray:
+        """Codes of the values (-1 = missing), registering new distinct values"""
+        distinct, lookup = self._values[key], self._value_codes[key]
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, value in enumerate(values):
+            if type(value) is int and value == _NA:
+                codes[i] = -1
+                continue
+            lookup_key = _lookup_key(value)
+            if lookup_key not in lookup:
+                lookup[lookup_key] = len(distinct)
+                distinct.append(value)
+            codes[i] = lookup[lookup_key]
+        return codes
+
+    def set_column(self, key: str, value: Any):
+        """Give every chunk the same metadata value (e.g. the document id); existing views keep theirs"""
+        self._ints.pop(key, None)
+        self._codes.pop(key, None)
+        if key not in self._keys:
+            self._keys.append(key)
+        self._append_column(key, [value] * len(self), 0)
+
+    # ===== READING =====
+
+    def __len__(self) -> int:
+        return self._offsets.size - 1
+
+    def text(self, i: int) -> str:
+        offsets = self._offsets.data
+        return self._text[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+    def texts(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def metadata(self, i: int) -> Dict[str, Any]:
+        metadata = {}
+        for key in self._keys:
+            if key in self._ints:
+                value = self._ints[key].data[i]
+                if value != _NA:
+                    metadata[key] = int(value)
+            else:
+                code = self._codes[key].data[i]
+                if code >= 0:
+                    metadata[key] = self._values[key][code]
+        return metadata
+
+    def column(self, key: str, default: Any = None) -> np.ndarray:
+        """One metadata field for every chunk (``default`` where a chunk has none)"""
+        if key in self._ints:
+            values = self._ints[key].values.copy()
+            missing = values == _NA
+            if missing.any():
+                if type(default) is not int:
+                    values = values.astype(object)
+                values[missing] = default
+            return values
+        if key in self._codes:
+            lookup = np.empty(len(self._values[key]) + 1, dtype=object)
+            for code, value in enumerate(self._values[key] + [default]):
+                lookup[code] = value
+            return lookup[self._codes[key].values]
+        return np.full(len(self), default, dtype=object)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[Document, List[Document]]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i) + (len(self) if i < 0 else 0)
+        if not 0 <= i < len(self):
+            raise IndexError(f"chunk {i} out of range")
+        with self._lock:
+            view = self._views.get(i)
+            if view is None:
+                view = Document(page_content=self.text(i), metadata=self.metadata(i))
+                self._views[i] = view
+                positions = self._view_positions
+                positions[id(view)] = i
+                # References the dict only, so a view doesn't keep the store alive
+                weakref.finalize(view, positions.pop, id(view), None)
+            return view
+
+    def __iter__(self) -> Iterator[Document]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def position(self, doc: Document) -> int:
+        """Position of a view handed out by this store"""
+        i = self._view_positions.get(id(doc))
+        if i is None or self._views.get(i) is not doc:
+            raise KeyError("Document is not a chunk of this store")
+        return i
+
+    def memory_bytes(self) -> int:
+        """Text buffer, offsets and metadata columns"""
+        columns = sum(column.data.nbytes for column in list(self._ints.values()) + list(self._codes.values()))
+        distinct = sum(len(str(value)) + 50 for values in self._values.values() for value in values)
+        return len(self._text) + self._offsets.data.nbytes + columns + distinct
@@ -7,6 +7,35 @@ class Config:
     # Model Configuration
     OPENROUTER_MODEL: str = "openai/gpt-oss-20b:free"
     LLAMA3_MODEL: str = "llama-3.3-70b-versatile"
+    PROVIDER_TIMEOUT: float = 60.0
+    STREAM_RESPONSES: bool = True
+    
+    # Provider endpoints (override to point at a local OpenAI-compatible stub)
+    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
+    GROQ_BASE_URL: str = ""
+    
+    # Resilience (per-attempt timeouts; jittered retries within PROVIDER_TIMEOUT; circuit breaker)
+    OPENROUTER_TIMEOUT: float = 30.0
+    GROQ_TIMEOUT: float = 15.0
+    RETRY_MAX_ATTEMPTS: int = 3
+    RETRY_BASE_DELAY: float = 0.5
+    RETRY_MAX_DELAY: float = 4.0
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_COOLDOWN: float = 30.0
+    
+    # Request Scheduler (process-wide; requests/minute per provider, 0 = unlimited)
+    OPENROUTER_RPM: float = 20
+    GROQ_RPM: float = 30
+    SCHEDULER_BURST: int = 5
+    SCHEDULER_MAX_QUEUE: int = 50
+    SCHEDULER_MAX_WAIT: float = 30.0
+    
+    # Fastest-answer routing (sliding window stats; hedge after the primary's p90)
+    ROUTER_WINDOW: int = 100
+    ROUTER_MIN_SAMPLES: int = 5
+    ROUTER_MAX_ERROR_RATE: float = 0.5
+    ROUTER_HEDGE_PERCENTILE: float = 90
+    ROUTER_DEFAULT_HEDGE_DELAY: float = 3.0
     
     # RAG Configuration
     CHUNK_SIZE: int = 800
@@ -14,10 +43,78 @@ class Config:
     TOP_K_RETRIEVAL: int = 6
     RERANK_TOP_K: int = 3
     
+    # Rerank Cascade (reciprocal rank fusion first; the cross-encoder runs only when the semantic and BM25
+    # top-k disagree and no chunk dominates, on the shortest fused prefix keeping RERANK_RECALL_TARGET of its picks)
+    RERANK_CASCADE: bool = True
+    RRF_K: int = 60
+    RERANK_SKIP_AGREEMENT: float = 1.0
+    RERANK_DOMINANCE_MARGIN: float = 0.15
+    RERANK_RECALL_TARGET: float = 0.95
+    RERANK_CALIBRATION_QUERIES: int = 20
+    RERANK_CALIBRATION_RATE: float = 0.1
+    
+    # Context Packing (prompt token budget per model, MMR trade-off, near-duplicate cut-off)
+    CONTEXT_BUDGET_OPENROUTER: int = 1500
+    CONTEXT_BUDGET_LLAMA3: int = 1000
+    CONTEXT_MMR_LAMBDA: float = 0.7
+    CONTEXT_DEDUP_THRESHOLD: float = 0.92
+    
+    # Ingestion (process-pool page extraction, indexed batch by batch; 0 workers = one per CPU)
+    INGEST_WORKERS: int = 0
+    INGEST_BATCH_PAGES: int = 16
+    
     # Embedding Model
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
     RERANKER_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
     
+    # CPU Inference ("torch" fp32, "int8" dynamic quantization, "onnx" / "onnx-int8" via onnxruntime;
+    # 0 threads = library default; max lengths in tokens; falls back to fp32 below the parity threshold)
+    INFERENCE_BACKEND: str = "torch"
+    INFERENCE_THREADS: int = 0
+    EMBED_MAX_LENGTH: int = 256
+    RERANK_MAX_LENGTH: int = 256
+    RERANK_BATCH_SIZE: int = 32
+    ONNX_CACHE_DIR: str = "./onnx_models"
+    PARITY_MIN_CORRELATION: float = 0.99
+    
+    # Startup (models load on a background thread while the UI renders; warm-up = one dummy encode and rerank)
+    MODEL_WARMUP: bool = True
+    
+    # Embedding Cache (set to "" to disable)
+    EMBEDDING_CACHE_DIR: str = "./embedding_cache"
+    
+    # Vector Index ("exact", "ivf", "hnsw", or quantized "int8"/"binary"; exact is used below VECTOR_INDEX_MIN_SIZE)
+    VECTOR_INDEX: str = "exact"
+    VECTOR_INDEX_MIN_SIZE: int = 1000
+    VECTOR_RESCORE_FACTOR: int = 16
+    IVF_NLIST: int = 0
+    IVF_NPROBE: int = 8
+    HNSW_M: int = 16
+    HNSW_EF_SEARCH: int = 64
+    
+    # Document Library (one persisted shard per uploaded PDF; "" keeps a single in-memory document)
+    CORPUS_DIR: str = "./corpus"
+    
+    # Shared Index Registry (sessions share one read-only index per document; idle ones are evicted LRU above the ceiling, 0 = no ceiling)
+    INDEX_REGISTRY_MAX_MB: int = 1024
+    
+    # Semantic Answer Cache (ANSWER_CACHE_PATH="" keeps it in memory only)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    ANSWER_CACHE_TTL: float = 3600.0
+    ANSWER_CACHE_PATH: str = ""
+    
+    # Durable Analytics (SQLite, shared by all sessions; "" disables; raw rows past the retention are pruned, rollups kept; 0 keeps all)
+    ANALYTICS_DB_PATH: str = "./analytics.sqlite"
+    ANALYTICS_BATCH_SIZE: int = 20
+    ANALYTICS_FLUSH_SECONDS: float = 5.0
+    ANALYTICS_RAW_RETENTION_DAYS: float = 30.0
+    
+    # Tracing (JSONL export of per-request stage timings; "" disables export; the file is rotated to <path>.1 at TRACE_EXPORT_MAX_MB)
+    TRACE_EXPORT_PATH: str = "./traces.jsonl"
+    TRACE_EXPORT_MAX_MB: float = 50.0
+    
     # ChromaDB
     CHROMA_PATH: str = "./chroma_db"
     COLLECTION_NAME: str = "qa_bot_chunks"
@@ -36,5 +133,9 @@ def load_secrets():
         config.OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
         config.GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 
+    # Endpoint overrides (e.g. the offline benchmark stub server)
+    config.OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", config.OPENROUTER_BASE_URL)
+    config.GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", config.GROQ_BASE_URL)
+
 # Load secrets on import
 load_secrets()
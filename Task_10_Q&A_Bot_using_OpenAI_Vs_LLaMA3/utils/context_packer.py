@@ -0,0 +1,61 @@
+from typing import List, Dict, Any, Tuple
+from langchain_core.documents import Document
+import numpy as np
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token, same estimate as the tracker)"""
+    return max(1, len(text) // 4)
+
+def pack_context(docs: List[Document], doc_embeddings: np.ndarray, budget_tokens: int,
+                 mmr_lambda: float = 0.7, dedup_threshold: float = 0.92) -> Tuple[List[Document], Dict[str, Any]]:
+    """Select reranked chunks for the prompt within a token budget
+
+    ``docs`` must be in reranker order. Each step picks the chunk with the best
+    maximal-marginal-relevance score (rank-based relevance minus similarity to
+    chunks already picked). Chunks at least ``dedup_threshold`` similar to a
+    picked chunk are dropped as near-duplicates, and chunks that no longer fit
+    the budget are skipped (the first pick is always kept).
+    """
+    stats = {"candidates": len(docs), "chunks_used": 0, "candidate_tokens": 0, "context_tokens": 0,
+             "tokens_saved": 0, "duplicates_dropped": 0, "over_budget": 0}
+    if not docs:
+        return [], stats
+
+    tokens = [estimate_tokens(doc.page_content) for doc in docs]
+    stats["candidate_tokens"] = sum(tokens)
+
+    vectors = np.asarray(doc_embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+    similarity = vectors @ vectors.T
+
+    n = len(docs)
+    relevance = 1.0 - np.arange(n) / n
+    max_sim = np.zeros(n, dtype=np.float32)
+    remaining = set(range(n))
+    selected = []
+    used = 0
+
+    while remaining:
+        best, best_score = None, -np.inf
+        for i in remaining:
+            score = mmr_lambda * relevance[i] - (1 - mmr_lambda) * max_sim[i]
+            if score > best_score:
+                best, best_score = i, score
+        remaining.discard(best)
+
+        if max_sim[best] >= dedup_threshold:
+            stats["duplicates_dropped"] += 1
+            continue
+        if selected and used + tokens[best] > budget_tokens:
+            stats["over_budget"] += 1
+            continue
+
+        selected.append(best)
+        used += tokens[best]
+        np.maximum(max_sim, similarity[best], out=max_sim)
+
+    stats["chunks_used"] = len(selected)
+    stats["context_tokens"] = used
+    stats["tokens_saved"] = stats["candidate_tokens"] - used
+    return [docs[i] for i in selected], stats
@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import Counter
+from datetime import date, datetime
+from typing import List, Dict, Any, Optional, Tuple, Union
+from langchain_core.documents import Document
+import numpy as np
+from utils.bm25_index import InvertedBM25
+from utils.chunk_store import ChunkStore
+from utils.embedding_cache import EmbeddingCache
+from utils.document_processor import count_pdf_pages
+from utils.ingestion import ingest_pdf
+from utils.index_registry import IndexLease, get_index_registry, index_key
+from utils.inference_backend import embedding_space
+from utils.config import config
+from utils.retriever import HybridRetriever, rerank_candidates, union_candidates
+from utils.rerank_cascade import get_cascade
+from utils.tracing import span
+
+DateLike = Union[date, datetime, str]
+
+def document_id(pdf_path: str) -> str:
+    """Content hash of a PDF (uploading the same file again reuses its shard)"""
+    h = hashlib.sha1()
+    with open(pdf_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+def _as_date(value: DateLike) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+class Corpus:
+    """Library of documents, each with its own persisted index shard
+
+    A shard directory (``<root>/<doc_id>/``) holds the document's chunks
+    (``chunks.jsonl``), their embeddings (``embeddings.npy``), its BM25 index
+    (``bm25.npz``) and ``meta.json`` (name, pages, chunks, chunks per page,
+    upload time and the embedding space: model, inference backend and input
+    cap). Shards from another embedding space are skipped, since their vectors
+    can't be compared with the current embedder's; uploading the document
+    again rebuilds them. Adding a document writes one new shard and never touches
+    the others; shards are loaded lazily the first time a query selects them,
+    into the shared index registry, so sessions selecting the same document
+    share one copy. The manifest is re-read whenever the library directory
+    changes, so shards written by another process (the batch CLI, another
+    app worker) show up without a restart.
+    """
+
+    def __init__(self, root_dir: str, embedder, reranker,
+                 embedding_cache: EmbeddingCache = None, embedding_model: str = ""):
+        self.root_dir = root_dir
+        self.embedder = embedder
+        self.reranker = reranker
+        self.embedding_cache = embedding_cache
+        self.embedding_model = embedding_model
+        self.space = embedding_space(embedder, embedding_model)
+        os.makedirs(root_dir, exist_ok=True)
+
+        self.info: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._skipped = set()
+        self._recover_shards()
+        self._refresh()
+
+    def _shard_dir(self, doc_id: str) -> str:
+        return os.path.join(self.root_dir, doc_id)
+
+    def _shard_key(self, doc_id: str) -> str:
+        return index_key(doc_id, corpus=os.path.abspath(self.root_dir), **self.space)
+
+    def _recover_shards(self):
+        """Restore shards a crash left renamed aside mid-swap (see _write_shard); drop stale copies"""
+        for name in os.listdir(self.root_dir):
+            if not name.startswith(".old-"):
+                continue
+            old_dir = os.path.join(self.root_dir, name)
+            shard_dir = self._shard_dir(name.split("-")[1])
+            try:
+                if os.path.exists(shard_dir):
+                    shutil.rmtree(old_dir, ignore_errors=True)
+                else:
+                    os.rename(old_dir, shard_dir)
+                    print(f"Restored shard {os.path.basename(shard_dir)} after an interrupted write")
+            except OSError as e:
+                print(f"Could not recover {name}: {e}")
+
+    def _refresh(self):
+        """Re-read the manifest if the library directory changed (shards added, replaced or removed)"""
+        try:
+            mtime = os.stat(self.root_dir).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._manifest_mtime:
+            self._manifest_mtime = mtime
+            self._load_manifest()
+
+    def _load_manifest(self):
+        """Read meta.json of every complete shard on disk"""
+        info = {}
+        for name in sorted(os.listdir(self.root_dir)):
+            meta_path = os.path.join(self.root_dir, name, "meta.json")
+            if name.startswith(".") or not os.path.exists(meta_path):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            shard_space = {key: meta.get(key) for key in self.space}
+            if self.embedding_model and shard_space != self.space:
+                if name not in self._skipped:
+                    self._skipped.add(name)
+                    print(f"Skipping shard {name}: embedded with {shard_space}, current embedder is {self.space}")
+                continue
+            info[meta["doc_id"]] = meta
+        with self._lock:
+            self.info = info
+
+    # ===== LIBRARY =====
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """Metadata of every document, newest first"""
+        self._refresh()
+        with self._lock:
+            return sorted(self.info.values(), key=lambda meta: meta["uploaded_at"], reverse=True)
+
+    def add_document(self, pdf_path: str, name: str = None, progress=None) -> Optional[Dict[str, Any]]:
+        """Ingest a PDF into its own shard; returns its metadata (None without text)"""
+        doc_id = document_id(pdf_path)
+        self._refresh()
+        with self._lock:
+            if doc_id in self.info:
+                return self.info[doc_id]
+
+        pages = count_pdf_pages(pdf_path)
+        retriever = ingest_pdf(pdf_path, self.embedder, self.reranker, self.embedding_cache,
+                               progress=progress, total_pages=pages)
+        if retriever is None:
+            return None
+
+        name = name or os.path.basename(pdf_path)
+        retriever.chunks.set_column("doc_id", doc_id)
+        retriever.chunks.set_column("source", name)
+
+        meta = {
+            "doc_id": doc_id,
+            "name": name,
+            "pages": pages,
+            "chunks": len(retriever.documents),
+            "page_chunks": {str(page): n for page, n in sorted(Counter(retriever.chunks.column("page", 0).tolist()).items())},
+            "uploaded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **self.space
+        }
+        with span("shard_write", chunks=len(retriever.documents)):
+            self._write_shard(doc_id, retriever, meta)
+
+        # Already in memory: cache it (idle) instead of reloading it on first query
+        get_index_registry().add(self._shard_key(doc_id), retriever)
+        with self._lock:
+            self.info[doc_id] = meta
+        return meta
+
+    def _write_shard(self, doc_id: str, retriever: HybridRetriever, meta: Dict[str, Any]):
+        """Write into a temporary directory and rename it, so a shard is never half-written
+
+        An existing shard (e.g. from another embedding space) is renamed aside
+        first and deleted only after the new one is in place, so readers never
+        see it half-deleted and a crash leaves a copy that the next start
+        restores.
+        """
+        tmp_dir = os.path.join(self.root_dir, f".tmp-{doc_id}-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        with open(os.path.join(tmp_dir, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for i, text in enumerate(retriever.chunks.texts()):
+                f.write(json.dumps({"text": text, "metadata": retriever.chunks.metadata(i)}, ensure_ascii=False) + "\n")
+        np.save(os.path.join(tmp_dir, "embeddings.npy"), np.asarray(retriever.doc_embeddings, dtype=np.float32))
+        retriever.bm25.save(os.path.join(tmp_dir, "bm25.npz"))
+        # meta.json last: its presence marks a complete shard
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        shard_dir = self._shard_dir(doc_id)
+        old_dir = os.path.join(self.root_dir, f".old-{doc_id}-{os.getpid()}")
+        shutil.rmtree(old_dir, ignore_errors=True)
+        try:
+            os.rename(shard_dir, old_dir)
+        except FileNotFoundError:
+            pass
+        os.rename(tmp_dir, shard_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def remove_document(self, doc_id: str):
+        with self._lock:
+            self.info.pop(doc_id, None)
+        get_index_registry().discard(self._shard_key(doc_id))
+        shutil.rmtree(self._shard_dir(doc_id), ignore_errors=True)
+
+    def acquire_shard(self, doc_id: str) -> IndexLease:
+        """Lease on one document's retriever (loaded from disk unless another session has it)"""
+        return get_index_registry().acquire(self._shard_key(doc_id), lambda: self._load_shard(doc_id))
+
+    def _load_shard(self, doc_id: str) -> HybridRetriever:
+        shard_dir = self._shard_dir(doc_id)
+        with span("shard_load", doc_id=doc_id):
+            chunks = ChunkStore()
+            with open(os.path.join(shard_dir, "chunks.jsonl"), "r", encoding="utf-8") as f:
+                chunks.extend_rows((row["text"], row["metadata"]) for row in map(json.loads, f))
+            # Memory-mapped: pages are read on demand instead of loading every shard up front
+            embeddings = np.load(os.path.join(shard_dir, "embeddings.npy"), mmap_mode="r")
+            bm25 = InvertedBM25.load(os.path.join(shard_dir, "bm25.npz"))
+        return HybridRetriever.from_parts(chunks, embeddings, bm25,
+                                          self.embedder, self.reranker, self.embedding_cache)
+
+    # ===== QUERYING =====
+
+    def select(self, doc_ids: List[str] = None, pages: Tuple[int, int] = None,
+               uploaded_from: DateLike = None, uploaded_to: DateLike = None) -> "CorpusView":
+        """Retriever over the documents matching a metadata filter
+
+        ``doc_ids`` limits the documents (None = all), ``pages`` is an inclusive
+        page range applied to every selected document, and ``uploaded_from`` /
+        ``uploaded_to`` are inclusive upload dates.
+        """
+        self._refresh()
+        with self._lock:
+            selected = []
+            for doc_id, meta in self.info.items():
+                if doc_ids is not None and doc_id not in doc_ids:
+                    continue
+                uploaded = _as_date(meta["uploaded_at"])
+                if uploaded_from is not None and uploaded < _as_date(uploaded_from):
+                    continue
+                if uploaded_to is not None and uploaded > _as_date(uploaded_to):
+                    continue
+                selected.append(doc_id)
+        return CorpusView(self, sorted(selected), pages)
+
+class CorpusView:
+    """Retriever over the corpus shards selected by a metadata filter
+
+    Has the HybridRetriever query interface (retrieve, retrieve_batch,
+    encode_queries, embeddings_for, fingerprint), so the Q&A pipeline works
+    unchanged. A query fans out to the selected shards for candidates and the
+    merged candidates go through the rerank cascade (one CrossEncoder call).
+    The view holds registry leases on the shards it has used until
+    ``close()`` (or the end of a ``with`` block); a closed view can still be
+    queried and leases the shards again.
+    """
+
+    def __init__(self, corpus: Corpus, doc_ids: List[str], pages: Tuple[int, int] = None):
+        self.corpus = corpus
+        self.doc_ids = doc_ids
+        self.pages = pages
+        self.embedder = corpus.embedder
+        self.reranker = corpus.reranker
+        self._masks: Dict[str, Optional[np.ndarray]] = {}
+        self._leases: Dict[str, IndexLease] = {}
+
+    def close(self):
+        """Release the shards this view holds, so idle ones can be evicted"""
+        leases, self._leases = self._leases, {}
+        for lease in leases.values():
+            lease.release()
+
+    def __enter__(self) -> "CorpusView":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _shard(self, doc_id: str) -> HybridRetriever:
+        if doc_id not in self._leases:
+            self._leases[doc_id] = self.corpus.acquire_shard(doc_id)
+        return self._leases[doc_id].retriever
+
+    def _manifest_chunks(self, doc_id: str) -> int:
+        """Selected chunks of one document according to its manifest (nothing is loaded)
+
+        Shards written before per-page counts were recorded count all their
+        chunks under a page filter (an upper bound).
+        """
+        meta = self.corpus.info.get(doc_id, {})
+        page_chunks = meta.get("page_chunks")
+        if self.pages is None or page_chunks is None:
+            return meta.get("chunks", 0)
+        return sum(n for page, n in page_chunks.items() if self.pages[0] <= int(page) <= self.pages[1])
+
+    def _selected_shards(self) -> List[Tuple[HybridRetriever, Optional[np.ndarray]]]:
+        """(shard, allowed-chunk mask or None) per selected document with matching chunks
+
+        Loads (leases) the shards, so only the query path calls it.
+        """
+        shards = []
+        for doc_id in self.doc_ids:
+            if not self._manifest_chunks(doc_id):
+                continue
+            shard = self._shard(doc_id)
+            if doc_id not in self._masks:
+                mask = None
+                if self.pages is not None:
+                    page_numbers = shard.chunks.column("page", 0)
+                    mask = (page_numbers >= self.pages[0]) & (page_numbers <= self.pages[1])
+                self._masks[doc_id] = mask
+            mask = self._masks[doc_id]
+            if mask is None or mask.any():
+                shards.append((shard, mask))
+        return shards
+
+    @property
+    def documents(self) -> List[Document]:
+        """Selected chunks across all selected documents"""
+        docs = []
+        for shard, mask in self._selected_shards():
+            docs.extend(shard.chunks if mask is None else [shard.chunks[i] for i in np.flatnonzero(mask)])
+        return docs
+
+    def chunk_count(self) -> int:
+        """Number of selected chunks, from the manifest (no shard is loaded)"""
+        return sum(self._manifest_chunks(doc_id) for doc_id in self.doc_ids)
+
+    def fingerprint(self) -> str:
+        """Shards are immutable and named by content hash, so the selection identifies the content"""
+        key = json.dumps({"docs": self.doc_ids, "pages": self.pages})
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        return np.asarray(self.embedder.encode(queries, show_progress_bar=False))
+
+    def embeddings_for(self, docs: List[Document]) -> np.ndarray:
+        return np.stack([
+            self._shard(doc.metadata["doc_id"]).embeddings_for([doc])[0]
+            for doc in docs
+        ]) if docs else np.zeros((0, 0), dtype=np.float32)
+
+    def retrieve(self, query: str, top_k: int = 6, query_embedding: np.ndarray = None) -> List[Document]:
+        query_embeddings = None if query_embedding is None else np.asarray(query_embedding).reshape(1, -1)
+        return self.retrieve_batch([query], top_k=top_k, query_embeddings=query_embeddings)[0]
+
+    def retrieve_batch(self, queries: List[str], top_k: int = 6,
+                       query_embeddings: np.ndarray = None) -> List[List[Document]]:
+        """Per-shard semantic and BM25 hits, merged by score and reranked together"""
+        if not queries:
+            return []
+        if query_embeddings is None:
+            with span("query_embedding", queries=len(queries)):
+                query_embeddings = self.encode_queries(queries)
+
+        semantic, bm25 = [[] for _ in queries], [[] for _ in queries]
+        shards = self._selected_shards()
+        with span("shard_search", shards=len(shards)):
+            for shard, mask in shards:
+                shard_semantic, shard_bm25 = shard.ranked_candidates_batch(queries, query_embeddings, top_k, mask)
+                for i in range(len(queries)):
+                    semantic[i].extend(shard_semantic[i])
+                    bm25[i].extend(shard_bm25[i])
+        # Cosine scores share one embedder; BM25 scores use per-shard statistics, close enough to merge
+        semantic = [sorted(hits, key=lambda hit: -hit[1])[:top_k] for hits in semantic]
+        bm25 = [sorted(hits, key=lambda hit: -hit[1])[:top_k] for hits in bm25]
+        if config.RERANK_CASCADE:
+            return get_cascade().rerank(self.reranker, queries, semantic, bm25, top_k)
+        return rerank_candidates(self.reranker, queries, union_candidates(semantic, bm25), top_k)
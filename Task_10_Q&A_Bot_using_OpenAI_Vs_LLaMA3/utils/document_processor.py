@@ -1,33 +1,98 @@
 import re
-from typing import List
+from bisect import bisect_left, bisect_right
+from typing import List, Iterable, Iterator, Tuple
 from langchain_core.documents import Document
 
-def simple_split(documents: List[Document], chunk_size: int = 800) -> List[Document]:
-    """Split documents into chunks"""
-    chunks = []
-    for doc in documents:
-        text = doc.page_content
-        sentences = re.split(r'[.!?]\s+', text)
-        current_chunk = ""
+SENTENCE_END = re.compile(r'[.!?]\s+')
+
+def iter_chunk_spans(text: str, chunk_size: int = 800, overlap: int = 100) -> Iterator[Tuple[int, int]]:
+    """Yield (start, end) offsets of sentence-aligned chunks in one pass
+
+    A chunk ends at the last sentence boundary in the second half of its
+    ``chunk_size`` window (else the last space in that half, else a hard cut). The next chunk starts at the first sentence
+    boundary (else space) inside the last ``overlap`` characters, so
+    consecutive chunks share up to ``overlap`` characters.
+    """
+    n = len(text)
+    # Offsets where a new sentence starts
+    boundaries = [m.end() for m in SENTENCE_END.finditer(text)]
+    start = 0
+    
+    while start < n:
+        while start < n and text[start].isspace():
+            start += 1
+        if start >= n:
+            return
         
-        for sentence in sentences:
-            if len(current_chunk) + len(sentence) < chunk_size:
-                current_chunk += sentence + ". "
+        limit = start + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            i = bisect_right(boundaries, limit) - 1
+            if i >= 0 and boundaries[i] > start + chunk_size // 2:
+                end = boundaries[i]
             else:
-                if current_chunk.strip():
-                    chunks.append(Document(
-                        page_content=current_chunk.strip(),
-                        metadata=doc.metadata
-                    ))
-                current_chunk = sentence + ". "
+                space = text.rfind(" ", start + chunk_size // 2, limit)
+                end = space if space != -1 else limit
         
-        if current_chunk.strip():
-            chunks.append(Document(
-                page_content=current_chunk.strip(),
-                metadata=doc.metadata
-            ))
+        chunk_end = end
+        while chunk_end > start and text[chunk_end - 1].isspace():
+            chunk_end -= 1
+        yield start, chunk_end
+        
+        if end >= n:
+            return
+        
+        # Step back by at most `overlap` characters (and never past the middle
+        # of the chunk, so every step advances and the pass stays linear)
+        next_start = end
+        if overlap > 0:
+            lower = max(end - overlap, start + (end - start) // 2 + 1)
+            i = bisect_left(boundaries, lower)
+            if i < len(boundaries) and boundaries[i] < end:
+                next_start = boundaries[i]
+            else:
+                space = text.find(" ", lower, end)
+                if space != -1:
+                    next_start = space + 1
+        start = next_start
+
+def iter_chunks(documents: Iterable[Document], chunk_size: int = 800, overlap: int = 100) -> Iterator[Document]:
+    """Lazily chunk documents; metadata records each chunk's offsets in its page"""
+    for doc in documents:
+        text = doc.page_content
+        for start, end in iter_chunk_spans(text, chunk_size, overlap):
+            yield Document(
+                page_content=text[start:end],
+                metadata={**doc.metadata, "start": start, "end": end}
+            )
+
+def simple_split(documents: List[Document], chunk_size: int = 800, overlap: int = 100) -> List[Document]:
+    """Split documents into chunks"""
+    return list(iter_chunks(documents, chunk_size, overlap))
+
+def count_pdf_pages(pdf_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(pdf_path).pages)
+
+def extract_page_range(pdf_path: str, start: int, end: int) -> List[Document]:
+    """Extract pages [start, end) that have real text (runs in worker processes)"""
+    from pypdf import PdfReader
     
-    return chunks
+    reader = PdfReader(pdf_path)
+    docs = []
+    for i in range(start, min(end, len(reader.pages))):
+        text = reader.pages[i].extract_text()
+        if text and len(text.strip()) > 50:
+            docs.append(Document(
+                page_content=text,
+                metadata={"page": i+1}
+            ))
+    return docs
+
+def load_pdf_pages(pdf_path: str, max_pages: int = None) -> List[Document]:
+    """Extract one Document per PDF page that has real text"""
+    return extract_page_range(pdf_path, 0, max_pages or count_pdf_pages(pdf_path))
 
 def extract_document_info(documents: List[Document]) -> dict:
     """Extract title and chapters from documents"""
@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+from typing import List, Dict, Tuple
+import numpy as np
+
+class EmbeddingCache:
+    """On-disk embedding store keyed by (embedding space, chunk text hash)
+
+    Every embedding model, inference backend and input cap (see
+    ``embedding_space``) gets its own directory of append-only shards, so
+    vectors from a quantized model or a different truncation are never mixed
+    with fp32 ones. A shard is a
+    ``shard_NNNNN.npy`` matrix plus a ``shard_NNNNN.json`` list of the text
+    hashes of its rows. Shards are memory-mapped on load, so a cache hit costs
+    a hash lookup and a page-in instead of a forward pass.
+
+    Shard names are claimed with a hard link, which fails instead of
+    overwriting: concurrent writers (sessions of one process, or several
+    processes sharing the directory) each end up with their own shard.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, inference_backend: str = "torch", max_length: int = 0):
+        self.model_name = model_name
+        self.inference_backend = inference_backend
+        self.max_length = max_length
+        safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', f"{model_name}__{inference_backend}__{max_length}")
+        self.model_dir = os.path.join(cache_dir, safe_name)
+        os.makedirs(self.model_dir, exist_ok=True)
+
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._shards: Dict[int, np.ndarray] = {}
+        self._next_shard = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    @classmethod
+    def for_embedder(cls, cache_dir: str, embedder, model_name: str = None) -> "EmbeddingCache":
+        """Cache for the embedding space the loaded embedder actually produces"""
+        from utils.inference_backend import embedding_space
+        space = embedding_space(embedder, model_name)
+        return cls(cache_dir, space["embedding_model"], space["inference_backend"], space["embed_max_length"])
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Stable content hash of a chunk"""
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _shard_paths(self, shard_id: int) -> Tuple[str, str]:
+        base = os.path.join(self.model_dir, f"shard_{shard_id:05d}")
+        return base + ".npy", base + ".json"
+
+    def _load_index(self):
+        """Read the hash lists of every shard already on disk"""
+        for name in sorted(os.listdir(self.model_dir)):
+            match = re.fullmatch(r'shard_(\d+)\.json', name)
+            if not match:
+                continue
+            shard_id = int(match.group(1))
+            npy_path, json_path = self._shard_paths(shard_id)
+            if not os.path.exists(npy_path):
+                continue
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    hashes = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for row, h in enumerate(hashes):
+                self._index.setdefault(h, (shard_id, row))
+            self._next_shard = max(self._next_shard, shard_id + 1)
+
+    def _shard(self, shard_id: int) -> np.ndarray:
+        with self._lock:
+            if shard_id not in self._shards:
+                npy_path, _ = self._shard_paths(shard_id)
+                self._shards[shard_id] = np.load(npy_path, mmap_mode="r")
+            return self._shards[shard_id]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get_many(self, hashes: List[str]) -> Dict[int, np.ndarray]:
+        """Return {position: vector} for every hash already cached"""
+        with self._lock:
+            locations = {pos: self._index.get(h) for pos, h in enumerate(hashes)}
+        return {
+            pos: self._shard(loc[0])[loc[1]]
+            for pos, loc in locations.items() if loc is not None
+        }
+
+    def put_many(self, hashes: List[str], vectors: np.ndarray):
+        """Append new vectors as a fresh shard (never overwrites an existing one)"""
+        with self._lock:
+            new_rows = [i for i, h in enumerate(hashes) if h not in self._index]
+        if not new_rows:
+            return
+
+        # De-duplicate identical chunks inside the batch
+        seen = {}
+        for i in new_rows:
+            seen.setdefault(hashes[i], i)
+        keep = list(seen.values())
+        matrix = np.ascontiguousarray(np.asarray(vectors)[keep], dtype=np.float32)
+        shard_hashes = [hashes[i] for i in keep]
+
+        fd, tmp_npy = tempfile.mkstemp(dir=self.model_dir, suffix=".npy.tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, matrix)
+        fd, tmp_json = tempfile.mkstemp(dir=self.model_dir, suffix=".json.tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(shard_hashes, f)
+
+        try:
+            with self._lock:
+                shard_id = self._claim_shard(tmp_npy, tmp_json)
+                for row, h in enumerate(shard_hashes):
+                    self._index.setdefault(h, (shard_id, row))
+        finally:
+            os.unlink(tmp_npy)
+            os.unlink(tmp_json)
+
+    def _claim_shard(self, tmp_npy: str, tmp_json: str) -> int:
+        """Link the written files to the first free shard id (caller holds the lock)
+
+        The matrix is linked first: a shard only becomes visible once its
+        hash list exists. ``os.link`` raises if the name is taken (e.g. by
+        another process), in which case the next id is tried.
+        """
+        while True:
+            shard_id = self._next_shard
+            self._next_shard += 1
+            npy_path, json_path = self._shard_paths(shard_id)
+            try:
+                os.link(tmp_npy, npy_path)
+            except FileExistsError:
+                continue
+            try:
+                os.link(tmp_json, json_path)
+            except FileExistsError:
+                # Stale hash list of a half-written shard: leave it, use another id
+                os.unlink(npy_path)
+                continue
+            return shard_id
+
+def encode_with_cache(embedder, texts: List[str], cache: "EmbeddingCache" = None,
+                      batch_size: int = 32) -> np.ndarray:
+    """Encode texts, only running the model on chunks the cache has not seen"""
+    if cache is None:
+        return np.asarray(
+            embedder.encode(texts, batch_size=batch_size, show_progress_bar=False),
+            dtype=np.float32
+        )
+
+    hashes = [cache.text_hash(t) for t in texts]
+    found = cache.get_many(hashes)
+    missing = [i for i in range(len(texts)) if i not in found]
+
+    if missing:
+        new_vectors = np.asarray(
+            embedder.encode([texts[i] for i in missing], batch_size=batch_size, show_progress_bar=False),
+            dtype=np.float32
+        )
+        cache.put_many([hashes[i] for i in missing], new_vectors)
+        for i, vec in zip(missing, new_vectors):
+            found[i] = vec
+        # Only when the model had to run (all-hit lookups happen on every query)
+        print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack([found[i] for i in range(len(texts))]).astype(np.float32, copy=False)
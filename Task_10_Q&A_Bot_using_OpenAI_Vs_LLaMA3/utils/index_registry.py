@@ -0,0 +1,188 @@
+import json
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Any, Optional
+from utils.config import config
+
+def index_key(content_hash: str, **extra) -> str:
+    """Registry key: the document's content plus every setting that changes the built index"""
+    settings = {
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+        "embedding_model": config.EMBEDDING_MODEL,
+        "inference_backend": config.INFERENCE_BACKEND,
+        "vector_index": config.VECTOR_INDEX,
+        **extra
+    }
+    digest = hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return f"{content_hash}:{digest}"
+
+class _Entry:
+    """One shared index: its retriever, reference count and estimated size"""
+
+    def __init__(self, key: str):
+        self.key = key
+        self.retriever = None
+        self.refs = 0
+        self.nbytes = 0
+        self.error: Optional[BaseException] = None
+        self.ready = threading.Event()
+
+class IndexLease:
+    """A holder's reference to a shared index
+
+    Release it with ``release()`` (or a ``with`` block); a lease that is
+    garbage-collected (e.g. with an expired Streamlit session) releases
+    itself.
+    """
+
+    def __init__(self, registry: "IndexRegistry", entry: _Entry):
+        self.key = entry.key
+        self.retriever = entry.retriever
+        self._finalizer = weakref.finalize(self, registry._release, entry)
+
+    def release(self):
+        """Drop the reference (idempotent)"""
+        self._finalizer()
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+    def __enter__(self) -> "IndexLease":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+class IndexRegistry:
+    """Process-wide cache of read-only retrievers shared by every session
+
+    ``acquire(key, build)`` returns a lease on the retriever for ``key``,
+    calling ``build`` only if no session has built it yet (concurrent
+    requests for the same key wait for the one build). Released indexes stay
+    cached; once the estimated total exceeds ``max_bytes`` the least recently
+    used idle ones are evicted. Indexes in use are never evicted, so memory
+    grows with the distinct documents open, not with the sessions.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def acquire(self, key: str, build: Callable[[], Any]) -> Optional[IndexLease]:
+        """Lease on the shared retriever for ``key`` (None if ``build`` returned None)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._entries[key] = _Entry(key)
+                self._counters["misses"] += 1
+            else:
+                self._counters["hits"] += 1
+            # Pinned while building/waiting so eviction can't drop it
+            entry.refs += 1
+            self._entries.move_to_end(key)
+
+        if owner:
+            try:
+                retriever = build()
+                if retriever is not None:
+                    retriever.freeze()
+                    entry.nbytes = retriever.memory_bytes()
+                entry.retriever = retriever
+            except BaseException as e:
+                entry.error = e
+            with self._lock:
+                if entry.retriever is None:
+                    self._drop(entry)
+                else:
+                    self._evict()
+            entry.ready.set()
+            if entry.error is not None:
+                raise entry.error
+        else:
+            entry.ready.wait()
+            if entry.retriever is None:
+                with self._lock:
+                    entry.refs -= 1
+                if entry.error is not None:
+                    raise RuntimeError(f"Building index {key} failed: {entry.error}") from entry.error
+        return None if entry.retriever is None else IndexLease(self, entry)
+
+    def add(self, key: str, retriever) -> bool:
+        """Register an index built elsewhere as idle (False if the key is already cached)"""
+        with self._lock:
+            if key in self._entries:
+                return False
+        lease = self.acquire(key, lambda: retriever)
+        if lease is not None:
+            lease.release()
+        return True
+
+    def discard(self, key: str):
+        """Forget an index (holders keep their reference until they release it)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.ready.is_set():
+                self._drop(entry)
+
+    def _drop(self, entry: _Entry):
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+
+    def _release(self, entry: _Entry):
+        with self._lock:
+            entry.refs -= 1
+            if self._entries.get(entry.key) is entry:
+                # Recency counts from the last holder letting go
+                self._entries.move_to_end(entry.key)
+                self._evict()
+
+    def _evict(self):
+        """Evict idle indexes, least recently used first, until under the ceiling (caller holds the lock)"""
+        if self.max_bytes <= 0:
+            return
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for entry in list(self._entries.values()):
+            if total <= self.max_bytes:
+                return
+            if entry.refs == 0 and entry.ready.is_set():
+                self._drop(entry)
+                total -= entry.nbytes
+                self._counters["evictions"] += 1
+                print(f"Index registry: evicted {entry.key} ({entry.nbytes / 2**20:.1f} MB)")
+        if total > self.max_bytes:
+            print(f"Index registry: {total / 2**20:.0f} MB in use exceeds the "
+                  f"{self.max_bytes / 2**20:.0f} MB ceiling (nothing idle to evict)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = [entry for entry in self._entries.values() if entry.ready.is_set()]
+            return {
+                "indexes": len(entries),
+                "in_use": sum(1 for entry in entries if entry.refs > 0),
+                "references": sum(entry.refs for entry in entries),
+                "memory_mb": round(sum(entry.nbytes for entry in entries) / 2**20, 2),
+                "max_mb": round(self.max_bytes / 2**20, 2),
+                **self._counters,
+                "entries": [
+                    {"key": entry.key, "refs": entry.refs, "memory_mb": round(entry.nbytes / 2**20, 2)}
+                    for entry in reversed(entries)
+                ]
+            }
+
+# Process-wide registry shared by every session and page
+_registry: Optional[IndexRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_index_registry() -> IndexRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = IndexRegistry(config.INDEX_REGISTRY_MAX_MB * 2**20)
+        return _registry
@@ -0,0 +1,313 @@
+import os
+import re
+import copy
+import inspect
+from typing import List, Dict, Any, Callable, Iterator
+import numpy as np
+from utils.config import config
+
+# "torch" = plain fp32, "int8" = PyTorch dynamic quantization,
+# "onnx" / "onnx-int8" = ONNX Runtime graph (fp32 / int8 weights)
+BACKENDS = ("torch", "int8", "onnx", "onnx-int8")
+
+# Scored by fp32 and by the optimised backend at load time; the backend is
+# only used when it ranks these the same way (PARITY_MIN_CORRELATION)
+CALIBRATION_QUERIES = {
+    "What dataset was used to train the model?": [
+        "The model was trained on the UCI heart disease dataset with 303 patient records.",
+        "Training used a random forest with 100 trees and a maximum depth of 8.",
+        "The hospital cafeteria serves lunch between noon and two o'clock.",
+        "Patient records were split 80/20 into training and test sets.",
+    ],
+    "How accurate is the classifier?": [
+        "The classifier reached 88% accuracy and an F1 score of 0.86 on the test set.",
+        "Accuracy improved after normalising cholesterol and blood pressure features.",
+        "The report was written by a group of five students.",
+        "Logistic regression was used as the baseline model.",
+    ],
+    "Which risk factors matter most?": [
+        "Age, chest pain type and maximum heart rate were the most important features.",
+        "Feature importance was computed with permutation tests on held-out data.",
+        "Smoking status was not recorded in the dataset.",
+        "The appendix lists the software versions used for the experiments.",
+    ],
+}
+
+# ===== HELPERS =====
+
+def set_threads(threads: int):
+    """Intra-op threads for PyTorch (0 keeps the library default)"""
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+def length_sorted_batches(lengths: List[int], batch_size: int) -> Iterator[np.ndarray]:
+    """Index batches of similar length, so each batch pads to a short maximum"""
+    order = np.argsort(lengths, kind="stable")
+    for start in range(0, len(order), batch_size):
+        yield order[start:start + batch_size]
+
+def _ranks(values: np.ndarray) -> np.ndarray:
+    return np.argsort(np.argsort(values)).astype(np.float64)
+
+def parity_report(reference: np.ndarray, candidate: np.ndarray, group_sizes: List[int]) -> Dict[str, Any]:
+    """How closely candidate scores reproduce the fp32 ranking
+
+    Spearman correlation is averaged over groups (one group = one query's
+    candidates, i.e. what the reranker actually orders); top-1 agreement is
+    the share of groups whose best candidate is unchanged.
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    candidate = np.asarray(candidate, dtype=np.float64)
+    correlations, top1 = [], []
+    offset = 0
+    for size in group_sizes:
+        ref, cand = reference[offset:offset + size], candidate[offset:offset + size]
+        offset += size
+        if size > 1:
+            correlations.append(np.corrcoef(_ranks(ref), _ranks(cand))[0, 1])
+        top1.append(ref.argmax() == cand.argmax())
+    return {
+        "spearman": round(float(np.mean(correlations)), 4) if correlations else 1.0,
+        "top1_agreement": round(float(np.mean(top1)), 4),
+        "max_abs_diff": round(float(np.abs(reference - candidate).max()), 5) if len(reference) else 0.0
+    }
+
+def calibration_pairs():
+    pairs = [[query, passage] for query, passages in CALIBRATION_QUERIES.items() for passage in passages]
+    return pairs, [len(passages) for passages in CALIBRATION_QUERIES.values()]
+
+# ===== ONNX EXPORT =====
+
+def _onnx_path(model_name: str, kind: str, quantized: bool) -> str:
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+    return os.path.join(config.ONNX_CACHE_DIR, f"{safe_name}.{kind}{'.int8' if quantized else ''}.onnx")
+
+def onnx_session(model_name: str, hf_model, tokenizer, kind: str, quantized: bool = False):
+    """ONNX Runtime session for a Hugging Face model (exported once, then cached on disk)"""
+    import onnxruntime as ort
+
+    path = _onnx_path(model_name, kind, quantized)
+    if not os.path.exists(path):
+        import torch
+
+        os.makedirs(config.ONNX_CACHE_DIR, exist_ok=True)
+        fp32_path = _onnx_path(model_name, kind, False)
+        if not os.path.exists(fp32_path):
+            print(f"Exporting {model_name} to ONNX...")
+            encoded = tokenizer(["query"], ["passage text"], return_tensors="pt")
+            # Graph inputs follow forward()'s parameter order, not the tokenizer's key order
+            names = [name for name in inspect.signature(hf_model.forward).parameters if name in encoded]
+            sample = {name: encoded[name] for name in names}
+            dynamic = {name: {0: "batch", 1: "sequence"} for name in names}
+            dynamic["output"] = {0: "batch"} if kind == "classifier" else {0: "batch", 1: "sequence"}
+            tmp_path = fp32_path + ".tmp"
+            # Legacy TorchScript exporter: the dynamo exporter needs onnxscript and breaks on some HF models
+            export_kwargs = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+            with torch.no_grad():
+                torch.onnx.export(hf_model.eval(), (sample,), tmp_path, input_names=names,
+                                  output_names=["output"], dynamic_axes=dynamic, opset_version=14,
+                                  **export_kwargs)
+            os.replace(tmp_path, fp32_path)
+        if quantized:
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+
+            tmp_path = path + ".tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, path)
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if config.INFERENCE_THREADS > 0:
+        options.intra_op_num_threads = config.INFERENCE_THREADS
+    return ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+def _run_session(session, encoded: Dict[str, np.ndarray]) -> np.ndarray:
+    names = {i.name for i in session.get_inputs()}
+    feed = {name: value.astype(np.int64) for name, value in encoded.items() if name in names}
+    return session.run(None, feed)[0]
+
+# ===== RERANKER =====
+
+class Reranker:
+    """CrossEncoder front-end with length-sorted batching over a pluggable scorer
+
+    ``predict(pairs)`` keeps the CrossEncoder signature, so the retriever is
+    unaware of the backend. ``parity`` holds the load-time check against fp32.
+    """
+
+    def __init__(self, score_batch: Callable[[List[List[str]]], np.ndarray],
+                 backend: str, batch_size: int = 32):
+        self.score_batch = score_batch
+        self.backend = backend
+        self.batch_size = batch_size
+        self.parity = None
+
+    def predict(self, pairs, batch_size: int = None, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        pairs = [list(pair) for pair in pairs]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        lengths = [len(query) + len(passage) for query, passage in pairs]
+        for idx in length_sorted_batches(lengths, batch_size or self.batch_size):
+            scores[idx] = self.score_batch([pairs[i] for i in idx])
+        return scores
+
+def _torch_scorer(cross_encoder):
+    def score(batch):
+        return cross_encoder.predict(batch, batch_size=len(batch), show_progress_bar=False, convert_to_numpy=True)
+    return score
+
+def _onnx_scorer(cross_encoder, session):
+    import torch
+
+    def score(batch):
+        queries = [query.strip() for query, _ in batch]
+        passages = [passage.strip() for _, passage in batch]
+        encoded = cross_encoder.tokenizer(queries, passages, padding=True, truncation="longest_first",
+                                          max_length=cross_encoder.max_length, return_tensors="np")
+        logits = torch.from_numpy(_run_session(session, encoded))
+        # Same activation CrossEncoder.predict applies (sigmoid for single-label models)
+        scores = cross_encoder.default_activation_function(logits)
+        if scores.shape[1] == 1:
+            scores = scores[:, 0]
+        return scores.numpy()
+    return score
+
+def build_reranker(cross_encoder, model_name: str, backend: str) -> Reranker:
+    """Reranker for one backend without the parity check (raises ImportError if unavailable)"""
+    if backend == "torch":
+        scorer = _torch_scorer(cross_encoder)
+    elif backend == "int8":
+        import torch
+        quantized = copy.copy(cross_encoder)
+        quantized.model = torch.quantization.quantize_dynamic(cross_encoder.model, {torch.nn.Linear},
+                                                              dtype=torch.qint8)
+        scorer = _torch_scorer(quantized)
+    elif backend in ("onnx", "onnx-int8"):
+        session = onnx_session(model_name, cross_encoder.model, cross_encoder.tokenizer,
+                               "classifier", quantized=backend == "onnx-int8")
+        scorer = _onnx_scorer(cross_encoder, session)
+    else:
+        raise ValueError(f"Unknown inference backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    return Reranker(scorer, backend, config.RERANK_BATCH_SIZE)
+
+def load_cross_encoder(model_name: str):
+    from sentence_transformers import CrossEncoder
+
+    set_threads(config.INFERENCE_THREADS)
+    return CrossEncoder(model_name, max_length=config.RERANK_MAX_LENGTH, device="cpu")
+
+def load_reranker(model_name: str, backend: str = None) -> Reranker:
+    """CrossEncoder on the configured CPU backend, falling back to fp32 if parity fails"""
+    backend = backend or config.INFERENCE_BACKEND
+    cross_encoder = load_cross_encoder(model_name)
+    reference = build_reranker(cross_encoder, model_name, "torch")
+    if backend == "torch":
+        return reference
+
+    try:
+        candidate = build_reranker(cross_encoder, model_name, backend)
+    except (ImportError, ValueError) as e:
+        print(f"{backend} backend unavailable ({e}), using torch fp32")
+        return reference
+
+    pairs, groups = calibration_pairs()
+    candidate.parity = parity_report(reference.predict(pairs), candidate.predict(pairs), groups)
+    if candidate.parity["spearman"] < config.PARITY_MIN_CORRELATION or candidate.parity["top1_agreement"] < 1.0:
+        print(f"{backend} reranker failed the parity check {candidate.parity}, using torch fp32")
+        return reference
+    print(f"Reranker backend: {backend} (parity {candidate.parity})")
+    return candidate
+
+# ===== EMBEDDER =====
+
+class OnnxEmbedder:
+    """SentenceTransformer replacement (Transformer + Pooling [+ Normalize]) on ONNX Runtime"""
+
+    def __init__(self, sentence_transformer, session):
+        self.tokenizer = sentence_transformer.tokenizer
+        self.max_seq_length = sentence_transformer.max_seq_length
+        self.session = session
+        pooling = sentence_transformer[1]
+        self.pooling = "cls" if pooling.pooling_mode_cls_token else "mean"
+        self.normalize = any(type(module).__name__ == "Normalize" for module in sentence_transformer)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        embeddings = [None] * len(sentences)
+        for idx in length_sorted_batches([len(s) for s in sentences], batch_size):
+            encoded = self.tokenizer([sentences[i] for i in idx], padding=True, truncation=True,
+                                     max_length=self.max_seq_length, return_tensors="np")
+            hidden = _run_session(self.session, encoded)
+            if self.pooling == "cls":
+                vectors = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize:
+                vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+            for i, vector in zip(idx, vectors):
+                embeddings[i] = vector
+        if not sentences:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        result = np.stack(embeddings).astype(np.float32)
+        return result[0] if single else result
+
+def load_embedder(model_name: str, backend: str = None):
+    """SentenceTransformer on the configured CPU backend, falling back to fp32 if parity fails"""
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or config.INFERENCE_BACKEND
+    set_threads(config.INFERENCE_THREADS)
+    reference = SentenceTransformer(model_name, device="cpu")
+    reference.max_seq_length = min(reference.max_seq_length or config.EMBED_MAX_LENGTH, config.EMBED_MAX_LENGTH)
+    # Recorded on the model (benchmarks report the backend actually in use)
+    reference.inference_backend = "torch"
+    if backend == "torch":
+        return reference
+
+    try:
+        if backend == "int8":
+            import torch
+            candidate = torch.quantization.quantize_dynamic(reference, {torch.nn.Linear}, dtype=torch.qint8)
+        elif backend in ("onnx", "onnx-int8"):
+            modules = [type(module).__name__ for module in reference]
+            if modules[:2] != ["Transformer", "Pooling"] or not set(modules[2:]) <= {"Normalize"}:
+                print(f"ONNX embedder supports Transformer+Pooling(+Normalize) only, got {modules}; using torch fp32")
+                return reference
+            session = onnx_session(model_name, reference[0].auto_model, reference.tokenizer,
+                                   "encoder", quantized=backend == "onnx-int8")
+            candidate = OnnxEmbedder(reference, session)
+        else:
+            raise ValueError(f"Unknown inference backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    except (ImportError, ValueError) as e:
+        print(f"{backend} backend unavailable ({e}), using torch fp32")
+        return reference
+
+    # Embeddings are compared directly: every calibration passage must keep its direction
+    passages = [passage for passages in CALIBRATION_QUERIES.values() for passage in passages]
+    expected = reference.encode(passages, normalize_embeddings=True, show_progress_bar=False)
+    actual = np.asarray(candidate.encode(passages, show_progress_bar=False), dtype=np.float32)
+    actual = actual / np.maximum(np.linalg.norm(actual, axis=1, keepdims=True), 1e-12)
+    min_cosine = float((expected * actual).sum(axis=1).min())
+    if min_cosine < config.PARITY_MIN_CORRELATION:
+        print(f"{backend} embedder failed the parity check (min cosine {min_cosine:.4f}), using torch fp32")
+        return reference
+    print(f"Embedder backend: {backend} (min cosine vs fp32 {min_cosine:.4f})")
+    candidate.inference_backend = backend
+    return candidate
+
+def embedding_space(embedder, model_name: str = None) -> Dict[str, Any]:
+    """Settings that determine an embedder's vectors: the backend actually in use (after any fp32 fallback) and the input cap
+
+    Vectors from different spaces must not be mixed, so persisted embeddings
+    (embedding cache, corpus shards) and shared indexes are keyed by it.
+    """
+    return {
+        "embedding_model": model_name or config.EMBEDDING_MODEL,
+        "inference_backend": getattr(embedder, "inference_backend", "torch"),
+        "embed_max_length": int(getattr(embedder, "max_seq_length", None) or config.EMBED_MAX_LENGTH)
+    }
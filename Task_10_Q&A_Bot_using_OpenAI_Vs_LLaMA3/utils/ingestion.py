@@ -0,0 +1,94 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Iterator, Callable, Optional
+from langchain_core.documents import Document
+import numpy as np
+from utils.config import config
+from utils.document_processor import count_pdf_pages, extract_page_range, iter_chunks
+from utils.retriever import HybridRetriever
+from utils.bm25_index import InvertedBM25
+from utils.chunk_store import ChunkStore
+from utils.embedding_cache import EmbeddingCache, encode_with_cache
+from utils.tracing import span
+
+def iter_page_batches(pdf_path: str, batch_pages: int = 16, workers: int = 0,
+                      total_pages: int = None) -> Iterator[List[Document]]:
+    """Yield extracted pages batch by batch, in page order
+
+    Page ranges are extracted in a process pool. At most two batches per
+    worker are in flight, so the extracted page text waiting to be consumed
+    is bounded by the batch size rather than the document size. Pass
+    ``total_pages`` if already known (saves parsing the PDF again).
+    """
+    total = total_pages or count_pdf_pages(pdf_path)
+    ranges = [(start, min(start + batch_pages, total)) for start in range(0, total, batch_pages)]
+    workers = min(workers or os.cpu_count() or 1, len(ranges))
+
+    # Small documents are not worth the pool start-up cost
+    if workers <= 1:
+        for start, end in ranges:
+            yield extract_page_range(pdf_path, start, end)
+        return
+
+    # spawn: forking a process that runs Streamlit/model threads is not safe
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque(ranges)
+        in_flight = deque()
+        while pending or in_flight:
+            while pending and len(in_flight) < 2 * workers:
+                start, end = pending.popleft()
+                in_flight.append(pool.submit(extract_page_range, pdf_path, start, end))
+            yield in_flight.popleft().result()
+
+def ingest_pdf(pdf_path: str, embedder, reranker,
+               embedding_cache: EmbeddingCache = None,
+               progress: Optional[Callable[[int, int, int], None]] = None,
+               batch_pages: int = None, workers: int = None,
+               total_pages: int = None) -> Optional[HybridRetriever]:
+    """Extract, chunk and index a whole PDF batch by batch
+
+    Each batch is embedded and BM25-indexed as it arrives; the embeddings
+    are stacked once at the end, where the vector index is built. Only the
+    page text is bounded by the batch size: the index itself (chunk text,
+    postings and embeddings) grows with the document, and stacking briefly
+    holds the embeddings twice.
+    ``progress(pages_done, total_pages, chunks_indexed)`` is called after every
+    batch. Returns None when the PDF has no extractable text.
+    """
+    batch_pages = batch_pages or config.INGEST_BATCH_PAGES
+    workers = config.INGEST_WORKERS if workers is None else workers
+    total_pages = total_pages or count_pdf_pages(pdf_path)
+
+    chunk_store = ChunkStore()
+    bm25 = InvertedBM25()
+    embedding_blocks = []
+    pages_done = 0
+    batches = iter_page_batches(pdf_path, batch_pages, workers, total_pages)
+    while True:
+        with span("extract"):
+            pages = next(batches, None)
+        if pages is None:
+            break
+        pages_done = min(pages_done + batch_pages, total_pages)
+
+        with span("chunk"):
+            chunks = list(iter_chunks(pages, config.CHUNK_SIZE, config.CHUNK_OVERLAP))
+
+        with span("index", chunks=len(chunks)):
+            if chunks:
+                texts = [chunk.page_content for chunk in chunks]
+                embedding_blocks.append(encode_with_cache(embedder, texts, embedding_cache))
+                bm25.add_documents(texts)
+                chunk_store.extend(chunks)
+
+        if progress is not None:
+            progress(pages_done, total_pages, len(chunk_store))
+
+    if not len(chunk_store):
+        return None
+    with span("index_build"):
+        return HybridRetriever.from_parts(chunk_store, np.concatenate(embedding_blocks), bm25,
+                                          embedder, reranker, embedding_cache)
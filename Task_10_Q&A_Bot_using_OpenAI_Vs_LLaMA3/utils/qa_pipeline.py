@@ -0,0 +1,124 @@
+from utils.config import config
+from utils.tracing import span, traced
+from utils.context_packer import pack_context
+
+# Q&A pipeline shared by the Streamlit app, the benchmark harness and batch jobs
+
+SYSTEM_PROMPT = """You are an elite AI assistant specializing in document analysis. 
+Provide precise, professional, and well-structured responses based solely on the given context."""
+
+@traced("prompt_assembly")
+def build_prompt(query: str, relevant_docs) -> str:
+    """Build the user prompt from retrieved context"""
+    context_text = "\n\n---\n\n".join([doc.page_content for doc in relevant_docs])
+    
+    return f"""Context:
+{context_text}
+
+Question: {query}
+
+Provide a clear, accurate answer based only on the context above."""
+
+def build_prompts(query: str, retriever, relevant_docs):
+    """Pack the reranked chunks into each model's token budget
+
+    Returns ({model key: user prompt}, {model key: packing stats}).
+    """
+    budgets = {
+        "openrouter": config.CONTEXT_BUDGET_OPENROUTER,
+        "llama3": config.CONTEXT_BUDGET_LLAMA3
+    }
+    with span("context_packing"):
+        embeddings = retriever.embeddings_for(relevant_docs)
+        packed = {
+            key: pack_context(relevant_docs, embeddings, budget,
+                              mmr_lambda=config.CONTEXT_MMR_LAMBDA,
+                              dedup_threshold=config.CONTEXT_DEDUP_THRESHOLD)
+            for key, budget in budgets.items()
+        }
+    
+    prompts, stats = {}, {}
+    for key, (docs, packing) in packed.items():
+        prompts[key] = build_prompt(query, docs)
+        stats[key] = packing
+    return prompts, stats
+
+def add_context_stats(results: dict, stats: dict):
+    """Record sources and packing savings on each model result"""
+    for key, result in results.items():
+        result['sources'] = stats[key]['chunks_used']
+        result['context_tokens'] = stats[key]['context_tokens']
+        result['tokens_saved'] = stats[key]['tokens_saved']
+
+def no_results() -> dict:
+    return {
+        "openrouter": {"answer": "No relevant information found.", "latency": 0, "sources": 0, "tokens": 0},
+        "llama3": {"answer": "No relevant information found.", "latency": 0, "sources": 0, "tokens": 0}
+    }
+
+def lookup_cached_answer(query: str, retriever, answer_cache):
+    """Embed the query and look it up in the semantic answer cache"""
+    with span("query_embedding"):
+        query_embedding = retriever.encode_queries([query])[0]
+    if answer_cache is None:
+        return query_embedding, None
+    
+    with span("cache_lookup"):
+        cached = answer_cache.get(retriever.fingerprint(), query_embedding)
+    if cached is None:
+        return query_embedding, None
+    return query_embedding, {key: dict(result, cached=True) for key, result in cached.items()}
+
+def store_answer(retriever, answer_cache, query_embedding, results: dict):
+    """Cache successful answers only"""
+    if answer_cache is None or any('error' in result for result in results.values()):
+        return
+    answer_cache.put(retriever.fingerprint(), query_embedding, results)
+
+def generate_answers(query: str, retriever, model_handler, answer_cache=None) -> dict:
+    """Generate answers from both models"""
+    
+    query_embedding, cached = lookup_cached_answer(query, retriever, answer_cache)
+    if cached is not None:
+        return cached
+    
+    # Retrieve context
+    with span("retrieval"):
+        relevant_docs = retriever.retrieve(query, top_k=config.TOP_K_RETRIEVAL, query_embedding=query_embedding)
+    
+    if not relevant_docs:
+        return no_results()
+    
+    prompts, stats = build_prompts(query, retriever, relevant_docs)
+    
+    # Query both models
+    with span("generation"):
+        results = model_handler.query_both(SYSTEM_PROMPT, prompts)
+    
+    # Add sources and context savings
+    add_context_stats(results, stats)
+    
+    store_answer(retriever, answer_cache, query_embedding, results)
+    return results
+
+def generate_fastest_answer(query: str, retriever, model_handler, answer_cache=None) -> dict:
+    """Single answer from the fastest healthy provider (no side-by-side comparison)"""
+    
+    query_embedding, cached = lookup_cached_answer(query, retriever, answer_cache)
+    if cached is not None:
+        key = model_handler.router.ranking()[0]
+        return dict(cached[key], provider=key, hedged=False)
+    
+    with span("retrieval"):
+        relevant_docs = retriever.retrieve(query, top_k=config.TOP_K_RETRIEVAL, query_embedding=query_embedding)
+    
+    if not relevant_docs:
+        return dict(no_results()["llama3"], provider="llama3", hedged=False)
+    
+    prompts, stats = build_prompts(query, retriever, relevant_docs)
+    
+    with span("generation", routed=True):
+        result = model_handler.query_fastest(SYSTEM_PROMPT, prompts)
+    
+    add_context_stats({result['provider']: result}, stats)
+    return result
@@ -0,0 +1,142 @@
+import random
+import threading
+from collections import deque
+from typing import List, Dict, Any, Tuple
+from langchain_core.documents import Document
+import numpy as np
+from utils.config import config
+from utils.tracing import span
+
+# One retriever's ranked hits for a query: [(chunk, score)], best first
+Ranking = List[Tuple[Document, float]]
+
+def reciprocal_rank_fusion(rankings: List[Ranking], k: int = 60) -> List[Document]:
+    """Chunks ordered by sum(1 / (k + rank)) over the rankings they appear in"""
+    scores: Dict[int, float] = {}
+    docs: Dict[int, Document] = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking):
+            scores[id(doc)] = scores.get(id(doc), 0.0) + 1.0 / (k + rank + 1)
+            docs[id(doc)] = doc
+    # Stable sort: ties keep first-seen (semantic) order
+    return [docs[key] for key in sorted(scores, key=lambda key: -scores[key])]
+
+class RecallCalibrator:
+    """Fused-list positions of the cross-encoder's top-k picks on fully reranked queries
+
+    ``depth(top_k)`` is the shortest fused prefix that would have contained
+    RERANK_RECALL_TARGET of those picks, i.e. the smallest candidate set the
+    cross-encoder needs to see to keep that recall.
+    """
+
+    def __init__(self, window: int = 2000):
+        self.positions: Dict[int, deque] = {}
+        self.queries: Dict[int, int] = {}
+        self.window = window
+        self._lock = threading.Lock()
+
+    def record(self, top_k: int, positions: List[int]):
+        with self._lock:
+            self.positions.setdefault(top_k, deque(maxlen=self.window)).extend(positions)
+            self.queries[top_k] = self.queries.get(top_k, 0) + 1
+
+    def samples(self, top_k: int) -> int:
+        with self._lock:
+            return self.queries.get(top_k, 0)
+
+    def depth(self, top_k: int, recall_target: float) -> int:
+        with self._lock:
+            positions = np.asarray(self.positions.get(top_k, ()), dtype=np.int64)
+        if not len(positions):
+            return 0
+        return max(top_k, int(np.quantile(positions, recall_target, method="higher")) + 1)
+
+class RerankCascade:
+    """Rank fusion first, the cross-encoder only where the fused ranking is ambiguous
+
+    A query skips the cross-encoder when its semantic and BM25 top-k agree
+    (overlap >= RERANK_SKIP_AGREEMENT) or when both put the same chunk first
+    and its similarity leads the runner-up by RERANK_DOMINANCE_MARGIN; the
+    fused (RRF) ranking is returned as is. Other queries are reranked on the
+    calibrated fused prefix. Until RERANK_CALIBRATION_QUERIES ambiguous queries
+    have been seen, and for a RERANK_CALIBRATION_RATE sample afterwards, the
+    whole candidate set is reranked to (re)calibrate that prefix.
+    """
+
+    def __init__(self):
+        self.calibrator = RecallCalibrator()
+        self.stats = {"queries": 0, "skipped": 0, "pairs": 0, "full_pairs": 0}
+        self._lock = threading.Lock()
+
+    def decide(self, semantic: Ranking, bm25: Ranking, top_k: int) -> str:
+        """"agree", "dominant" or "ambiguous" """
+        if not semantic or not bm25:
+            return "ambiguous"
+        semantic_top = {id(doc) for doc, _ in semantic[:top_k]}
+        bm25_top = {id(doc) for doc, _ in bm25[:top_k]}
+        if len(semantic_top & bm25_top) / max(len(semantic_top), len(bm25_top)) >= config.RERANK_SKIP_AGREEMENT:
+            return "agree"
+        if semantic[0][0] is bm25[0][0] and (
+                len(semantic) == 1 or semantic[0][1] - semantic[1][1] >= config.RERANK_DOMINANCE_MARGIN):
+            return "dominant"
+        return "ambiguous"
+
+    def _rerank_depth(self, top_k: int) -> int:
+        """Candidates to rerank (0 = all, for calibration)"""
+        if self.calibrator.samples(top_k) < config.RERANK_CALIBRATION_QUERIES:
+            return 0
+        if random.random() < config.RERANK_CALIBRATION_RATE:
+            return 0
+        return self.calibrator.depth(top_k, config.RERANK_RECALL_TARGET)
+
+    def rerank(self, reranker, queries: List[str], semantic: List[Ranking], bm25: List[Ranking],
+               top_k: int) -> List[List[Document]]:
+        """Top-k chunks per query with one cross-encoder call for the ambiguous ones"""
+        results: List[List[Document]] = []
+        pending: List[Tuple[int, List[Document], bool]] = []
+        full_pairs = 0
+        with span("rerank_cascade", queries=len(queries)) as cascade_span:
+            with span("rank_fusion"):
+                for i, (query_semantic, query_bm25) in enumerate(zip(semantic, bm25)):
+                    fused = reciprocal_rank_fusion([query_semantic, query_bm25], config.RRF_K)
+                    full_pairs += len(fused)
+                    results.append(fused[:top_k])
+                    if self.decide(query_semantic, query_bm25, top_k) == "ambiguous":
+                        depth = self._rerank_depth(top_k)
+                        pending.append((i, fused[:depth] if depth else fused, not depth))
+
+            pairs = [[queries[i], doc.page_content] for i, candidates, _ in pending for doc in candidates]
+            if pairs:
+                with span("rerank", pairs=len(pairs)):
+                    scores = np.asarray(reranker.predict(pairs))
+                offset = 0
+                for i, candidates, calibrating in pending:
+                    ranked = scores[offset:offset + len(candidates)].argsort()[::-1]
+                    offset += len(candidates)
+                    results[i] = [candidates[j] for j in ranked[:top_k]]
+                    if calibrating:
+                        # Fused positions of the chunks the cross-encoder picked
+                        self.calibrator.record(top_k, [int(j) for j in ranked[:top_k]])
+
+            skipped = len(queries) - len(pending)
+            if cascade_span is not None:
+                cascade_span.attributes.update(skipped=skipped, pairs=len(pairs), full_pairs=full_pairs)
+        with self._lock:
+            self.stats["queries"] += len(queries)
+            self.stats["skipped"] += skipped
+            self.stats["pairs"] += len(pairs)
+            self.stats["full_pairs"] += full_pairs
+        return results
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["skip_rate"] = round(stats["skipped"] / stats["queries"], 4) if stats["queries"] else 0.0
+        stats["pairs_saved"] = round(1 - stats["pairs"] / stats["full_pairs"], 4) if stats["full_pairs"] else 0.0
+        return stats
+
+# Process-wide cascade: the calibration is a property of the reranker, shared by every retriever
+_cascade = RerankCascade()
+
+def get_cascade() -> RerankCascade:
+    return _cascade
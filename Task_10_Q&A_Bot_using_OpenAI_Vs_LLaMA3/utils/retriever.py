@@ -1,51 +1,222 @@
-from typing import List
+import hashlib
+from typing import List, Optional, Tuple, Union
 from langchain_core.documents import Document
-from rank_bm25 import BM25Okapi
 import numpy as np
+from utils.config import config
+from utils.embedding_cache import EmbeddingCache, encode_with_cache
+from utils.vector_index import build_vector_index
+from utils.bm25_index import InvertedBM25, tokenize
+from utils.chunk_store import ChunkStore
+from utils.tracing import span
+from utils.rerank_cascade import Ranking, get_cascade
 
 class HybridRetriever:
     """Combines semantic and keyword-based retrieval (no ChromaDB needed)"""
     
-    def __init__(self, documents: List[Document], embedder, reranker):
-        self.documents = documents
-        self.embedder = embedder
-        self.reranker = reranker
+    def __init__(self, documents: Union[List[Document], ChunkStore], embedder, reranker,
+                 embedding_cache: EmbeddingCache = None):
+        self._init_state(documents, embedder, reranker, embedding_cache)
+        texts = list(self.chunks.texts())
         
-        # BM25 for keyword search
-        tokenized_docs = [doc.page_content.lower().split() for doc in documents]
-        self.bm25 = BM25Okapi(tokenized_docs)
+        # BM25 for keyword search (sparse inverted index)
+        self.bm25 = InvertedBM25()
+        self.bm25.add_documents(texts)
         
         # Embed documents for semantic search
         print("Encoding documents for semantic search...")
-        self.doc_embeddings = embedder.encode(
-            [doc.page_content for doc in documents],
-            show_progress_bar=False
-        )
-        print(f"Embedded {len(documents)} documents")
-    
-    def retrieve(self, query: str, top_k: int = 6) -> List[Document]:
-        """Hybrid retrieval with reranking"""
-        
-        # Semantic search
-        query_embedding = self.embedder.encode([query])[0]
-        semantic_scores = self.doc_embeddings @ query_embedding
-        semantic_top_indices = semantic_scores.argsort()[-top_k:][::-1]
+        self.doc_embeddings = encode_with_cache(embedder, texts, embedding_cache)
+        print(f"Embedded {len(texts)} documents")
         
-        # Keyword search (BM25)
-        tokenized_query = query.lower().split()
-        bm25_scores = self.bm25.get_scores(tokenized_query)
-        bm25_top_indices = bm25_scores.argsort()[-top_k:][::-1]
+        self.rebuild_vector_index()
+    
+    def _init_state(self, documents: Union[List[Document], ChunkStore], embedder, reranker,
+                    embedding_cache: EmbeddingCache = None):
+        # Chunks live in one compact store; Documents are built only for results
+        self.chunks = documents if isinstance(documents, ChunkStore) else ChunkStore(documents)
+        self.embedder = embedder
+        self.reranker = reranker
         
-        # Combine results
-        combined_indices = list(set(semantic_top_indices) | set(bm25_top_indices))
-        candidates = [self.documents[i] for i in combined_indices]
+        self.embedding_cache = embedding_cache
+        self.removed = set()
+        self.read_only = False
+        self._fingerprint = None
+    
+    @property
+    def documents(self) -> ChunkStore:
+        """Indexed chunks (a sequence of Document views)"""
+        return self.chunks
+    
+    @classmethod
+    def from_parts(cls, documents: Union[List[Document], ChunkStore], doc_embeddings: np.ndarray, bm25: InvertedBM25,
+                   embedder, reranker, embedding_cache: EmbeddingCache = None) -> "HybridRetriever":
+        """Retriever over chunks that are already embedded and BM25-indexed (e.g. a persisted shard)"""
+        retriever = cls.__new__(cls)
+        retriever._init_state(documents, embedder, reranker, embedding_cache)
+        retriever.bm25 = bm25
+        retriever.doc_embeddings = np.asanyarray(doc_embeddings, dtype=np.float32)
+        retriever.rebuild_vector_index()
+        return retriever
+    
+    def rebuild_vector_index(self):
+        """(Re)build the vector index for semantic search (exact search is the fallback)"""
+        self.vector_index = build_vector_index(
+            self.doc_embeddings,
+            kind=config.VECTOR_INDEX,
+            min_size=config.VECTOR_INDEX_MIN_SIZE,
+            nlist=config.IVF_NLIST,
+            nprobe=config.IVF_NPROBE,
+            m=config.HNSW_M,
+            ef_search=config.HNSW_EF_SEARCH,
+            rescore_factor=config.VECTOR_RESCORE_FACTOR
+        )
+        # Quantized indexes keep their own (memory-mapped) copy; don't hold a second one
+        self.doc_embeddings = self.vector_index.embeddings
+    
+    def add_documents(self, documents: List[Document]) -> List[int]:
+        """Index more chunks without rebuilding BM25 or re-encoding old chunks"""
+        self._check_writable()
+        if not documents:
+            return []
+        texts = [doc.page_content for doc in documents]
+        new_embeddings = encode_with_cache(self.embedder, texts, self.embedding_cache)
         
-        if not candidates:
+        ids = self.bm25.add_documents(texts)
+        self.vector_index.add(new_embeddings)
+        self.doc_embeddings = self.vector_index.embeddings
+        self.chunks.extend(documents)
+        self._fingerprint = None
+        return ids
+    
+    def remove_documents(self, doc_ids: List[int]):
+        """Drop chunks from both searches (ids stay stable)"""
+        self._check_writable()
+        self.bm25.remove_documents(doc_ids)
+        self.removed.update(int(i) for i in doc_ids)
+        self._fingerprint = None
+    
+    def freeze(self) -> "HybridRetriever":
+        """Make the index read-only (it is shared between sessions)"""
+        self.read_only = True
+        if isinstance(self.doc_embeddings, np.ndarray) and self.doc_embeddings.flags.writeable:
+            self.doc_embeddings.flags.writeable = False
+        return self
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This index is shared read-only; build a new one to change its chunks")
+    
+    def memory_bytes(self) -> int:
+        """Approximate resident size: vectors, BM25 postings and chunk text (memory-mapped data excluded)"""
+        return self.vector_index.memory_bytes() + self.bm25.memory_bytes() + self.chunks.memory_bytes()
+    
+    def fingerprint(self) -> str:
+        """Content hash of the indexed chunks (changes when chunks are added/removed)"""
+        if self._fingerprint is None:
+            h = hashlib.sha1()
+            for i, text in enumerate(self.chunks.texts()):
+                if i not in self.removed:
+                    h.update(EmbeddingCache.text_hash(text).encode("ascii"))
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+    
+    def embeddings_for(self, docs: List[Document]) -> np.ndarray:
+        """Stored embeddings of indexed chunks (e.g. retrieval results)"""
+        return self.doc_embeddings[[self.chunks.position(doc) for doc in docs]]
+    
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries with the retriever's embedder"""
+        return np.asarray(self.embedder.encode(queries, show_progress_bar=False))
+    
+    def retrieve(self, query: str, top_k: int = 6, query_embedding: np.ndarray = None) -> List[Document]:
+        """Hybrid retrieval with reranking"""
+        query_embeddings = None if query_embedding is None else np.asarray(query_embedding).reshape(1, -1)
+        return self.retrieve_batch([query], top_k=top_k, query_embeddings=query_embeddings)[0]
+    
+    def retrieve_batch(self, queries: List[str], top_k: int = 6,
+                       query_embeddings: np.ndarray = None) -> List[List[Document]]:
+        """Hybrid retrieval for many queries with one encode and one rerank call"""
+        if not queries:
             return []
         
-        # Rerank with CrossEncoder
-        pairs = [[query, doc.page_content] for doc in candidates]
-        rerank_scores = self.reranker.predict(pairs)
-        ranked_indices = rerank_scores.argsort()[::-1][:top_k]
+        if query_embeddings is None:
+            with span("query_embedding", queries=len(queries)):
+                query_embeddings = self.encode_queries(queries)
+        semantic, bm25 = self.ranked_candidates_batch(queries, query_embeddings, top_k)
+        if config.RERANK_CASCADE:
+            return get_cascade().rerank(self.reranker, queries, semantic, bm25, top_k)
+        return rerank_candidates(self.reranker, queries, union_candidates(semantic, bm25), top_k)
+    
+    def candidates_batch(self, queries: List[str], query_embeddings: np.ndarray, top_k: int,
+                         allowed: Optional[np.ndarray] = None) -> List[List[Document]]:
+        """Union of the semantic and BM25 top-k per query, before reranking"""
+        return union_candidates(*self.ranked_candidates_batch(queries, query_embeddings, top_k, allowed))
+    
+    def ranked_candidates_batch(self, queries: List[str], query_embeddings: np.ndarray, top_k: int,
+                                allowed: Optional[np.ndarray] = None) -> Tuple[List[Ranking], List[Ranking]]:
+        """Semantic and BM25 top-k per query as [(chunk, score)], best first
+        
+        ``allowed`` is an optional boolean mask over chunk positions (metadata
+        filters); masked searches score only the allowed chunks exactly.
+        """
+        # Semantic search (one matrix-matrix product)
+        with span("semantic_search", index=self.vector_index.kind if allowed is None else "filtered"):
+            if allowed is None:
+                search_k = top_k + len(self.removed)
+                semantic_hits = self.vector_index.search_batch(query_embeddings, search_k)
+            else:
+                positions = np.flatnonzero(allowed)
+                scores = np.asarray(query_embeddings, dtype=np.float32) @ self.doc_embeddings[positions].T
+                semantic_hits = []
+                for row in scores:
+                    order = np.argsort(-row)[:top_k + len(self.removed)]
+                    semantic_hits.append((positions[order], row[order]))
         
-        return [candidates[i] for i in ranked_indices if i < len(candidates)]
+        # Keyword search (BM25) per query
+        semantic_rankings, bm25_rankings = [], []
+        with span("bm25"):
+            for query, (semantic_idx, semantic_scores) in zip(queries, semantic_hits):
+                semantic_rankings.append([
+                    (self.chunks[i], float(score))
+                    for i, score in zip(semantic_idx, semantic_scores) if i not in self.removed
+                ][:top_k])
+                if allowed is None:
+                    bm25_idx, bm25_scores = self.bm25.search(tokenize(query), top_k)
+                else:
+                    doc_ids, scores = self.bm25.score(tokenize(query))
+                    keep = allowed[doc_ids]
+                    doc_ids, scores = doc_ids[keep], scores[keep]
+                    order = np.argsort(-scores)[:top_k]
+                    bm25_idx, bm25_scores = doc_ids[order], scores[order]
+                bm25_rankings.append([(self.chunks[i], float(score)) for i, score in zip(bm25_idx, bm25_scores)])
+        return semantic_rankings, bm25_rankings
+
+def union_candidates(semantic: List[Ranking], bm25: List[Ranking]) -> List[List[Document]]:
+    """Distinct chunks of both rankings per query (semantic hits first)"""
+    all_candidates = []
+    for query_semantic, query_bm25 in zip(semantic, bm25):
+        unique = {id(doc): doc for doc, _ in query_semantic + query_bm25}
+        all_candidates.append(list(unique.values()))
+    return all_candidates
+
+def rerank_candidates(reranker, queries: List[str], all_candidates: List[List[Document]],
+                      top_k: int) -> List[List[Document]]:
+    """Rerank every (query, candidate) pair with a single CrossEncoder call"""
+    pairs = [
+        [query, doc.page_content]
+        for query, candidates in zip(queries, all_candidates)
+        for doc in candidates
+    ]
+    if not pairs:
+        return [[] for _ in queries]
+    with span("rerank", pairs=len(pairs)):
+        rerank_scores = np.asarray(reranker.predict(pairs))
+    
+    results = []
+    offset = 0
+    for candidates in all_candidates:
+        scores = rerank_scores[offset:offset + len(candidates)]
+        offset += len(candidates)
+        ranked_indices = scores.argsort()[::-1][:top_k]
+        results.append([candidates[i] for i in ranked_indices])
+    
+    return results
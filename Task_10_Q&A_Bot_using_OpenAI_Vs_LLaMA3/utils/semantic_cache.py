@@ -0,0 +1,160 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import numpy as np
+
+class SemanticCache:
+    """Answer cache keyed by document fingerprint + query embedding
+
+    A lookup returns a stored result when the cosine similarity between the new
+    query and a cached query on the same document is at least ``threshold``.
+    Entries are evicted least-recently-used beyond ``max_entries`` and expire
+    after ``ttl_seconds``. With ``db_path`` entries are also kept in SQLite so
+    they survive restarts and are shared by every app process on the host: a
+    lookup that misses in memory checks the table for rows other processes
+    stored for the same document. The table keeps the newest ``max_entries``
+    rows; evicting from the in-memory LRU never deletes rows.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 512,
+                 ttl_seconds: float = 3600, db_path: str = ""):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+
+        # entry id -> (fingerprint, unit embedding, result, created_at)
+        self.entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._next_id = 0
+
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "id INTEGER PRIMARY KEY, fingerprint TEXT, embedding BLOB, "
+                "result TEXT, created_at REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS answers_fingerprint ON answers (fingerprint)")
+            self.db.commit()
+            self._load()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def _load(self):
+        """Warm the in-memory LRU from disk (newest entries first)"""
+        cutoff = time.time() - self.ttl_seconds
+        self.db.execute("DELETE FROM answers WHERE created_at < ?", (cutoff,))
+        self.db.commit()
+        rows = self.db.execute(
+            "SELECT id, fingerprint, embedding, result, created_at FROM answers "
+            "ORDER BY created_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for row_id, fingerprint, blob, result, created_at in reversed(rows):
+            embedding = np.frombuffer(blob, dtype=np.float32)
+            self.entries[row_id] = (fingerprint, embedding, json.loads(result), created_at)
+
+    def _load_fingerprint(self, fingerprint: str, now: float) -> bool:
+        """Pull rows of one document stored by other processes (caller holds the lock)"""
+        try:
+            rows = self.db.execute(
+                "SELECT id, embedding, result, created_at FROM answers "
+                "WHERE fingerprint = ? AND created_at >= ?", (fingerprint, now - self.ttl_seconds)
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Answer cache: reading {fingerprint[:8]} failed ({e})")
+            return False
+        added = False
+        for row_id, blob, result, created_at in rows:
+            if row_id not in self.entries:
+                embedding = np.frombuffer(blob, dtype=np.float32)
+                self.entries[row_id] = (fingerprint, embedding, json.loads(result), created_at)
+                added = True
+        self._evict()
+        return added
+
+    def _evict(self):
+        """Trim the in-memory LRU (rows stay in the table for other processes)"""
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _best(self, fingerprint: str, query: np.ndarray, now: float) -> Optional[int]:
+        best_id, best_sim = None, self.threshold
+        expired = False
+        for entry_id, (fp, vec, _, created_at) in list(self.entries.items()):
+            if now - created_at > self.ttl_seconds:
+                del self.entries[entry_id]
+                expired = True
+                continue
+            if fp != fingerprint or vec.shape != query.shape:
+                continue
+            sim = float(vec @ query)
+            if sim >= best_sim:
+                best_id, best_sim = entry_id, sim
+        if expired and self.db is not None:
+            # Expired for every process, so any process may delete it
+            try:
+                self.db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+                self.db.commit()
+            except sqlite3.Error as e:
+                print(f"Answer cache: pruning expired rows failed ({e})")
+        return best_id
+
+    def get(self, fingerprint: str, embedding) -> Optional[Dict[str, Any]]:
+        """Best cached result above the similarity threshold, or None"""
+        query = self._normalize(embedding)
+        now = time.time()
+
+        with self.lock:
+            best_id = self._best(fingerprint, query, now)
+            if best_id is None and self.db is not None and self._load_fingerprint(fingerprint, now):
+                best_id = self._best(fingerprint, query, now)
+            if best_id is None:
+                return None
+            self.entries.move_to_end(best_id)
+            return self.entries[best_id][2]
+
+    def put(self, fingerprint: str, embedding, result: Dict[str, Any]):
+        """Store a result, evicting the least recently used entries"""
+        vec = self._normalize(embedding)
+        created_at = time.time()
+
+        with self.lock:
+            if self.db is None:
+                entry_id = self._next_id
+                self._next_id += 1
+            else:
+                # SQLite assigns the id, so processes sharing the table never collide
+                try:
+                    entry_id = self.db.execute(
+                        "INSERT INTO answers (fingerprint, embedding, result, created_at) VALUES (?, ?, ?, ?)",
+                        (fingerprint, vec.tobytes(), json.dumps(result), created_at)
+                    ).lastrowid
+                    self.db.execute(
+                        "DELETE FROM answers WHERE id NOT IN "
+                        "(SELECT id FROM answers ORDER BY created_at DESC LIMIT ?)", (self.max_entries,)
+                    )
+                    self.db.commit()
+                except sqlite3.Error as e:
+                    self.db.rollback()
+                    print(f"Answer cache: storing the answer failed ({e})")
+                    return
+            self.entries[entry_id] = (fingerprint, vec, result, created_at)
+            self._evict()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM answers")
+                self.db.commit()
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -0,0 +1,144 @@
+import time
+import threading
+import importlib
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+from utils.config import config
+
+# Reference point of the startup report (the app imports this module before anything heavy)
+PROCESS_START = time.perf_counter()
+
+# Imported on the loader thread so the first upload or question doesn't pay for them
+HEAVY_MODULES = (
+    "numpy",
+    "torch",
+    "sentence_transformers",
+    "langchain_core.documents",
+    "pypdf",
+    "utils.ingestion",
+    "utils.corpus",
+    "utils.semantic_cache",
+    "utils.qa_pipeline",
+    "models.model_handler",
+)
+
+class StartupReport:
+    """Durations of the startup phases and when each milestone was reached"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = round(time.perf_counter() - start, 3)
+
+    def mark(self, name: str):
+        """Seconds since PROCESS_START (first mark of a name wins)"""
+        with self._lock:
+            self.milestones.setdefault(name, round(time.perf_counter() - PROCESS_START, 3))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"phases_s": dict(self.phases), "milestones_s": dict(self.milestones)}
+
+    def summary(self) -> str:
+        report = self.to_dict()
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in report["phases_s"].items())
+        milestones = ", ".join(f"{name} at {seconds:.2f}s" for name, seconds in report["milestones_s"].items())
+        return f"Startup: {milestones} ({phases})"
+
+def warm_up(embedder, reranker):
+    """One dummy encode and one dummy rerank shaped like a real question
+
+    The first call of a model pays for lazy initialisation (thread pools,
+    kernel selection, allocator growth); doing it here keeps that off the
+    first user's query.
+    """
+    query = "What are the main findings of this document?"
+    chunk = ("The study reports its main findings in this section. " * 40)[:config.CHUNK_SIZE]
+    embedder.encode([query, chunk], show_progress_bar=False)
+    reranker.predict([[query, chunk], [query, query]], show_progress_bar=False)
+
+class ModelLoader:
+    """Loads the embedder, reranker and model handler on a background thread
+
+    ``ready()`` never blocks, so the UI can render while models load;
+    ``result()`` waits and re-raises a loading error in the caller.
+    """
+
+    def __init__(self):
+        self.report = StartupReport()
+        self._done = threading.Event()
+        self._models: Optional[Tuple[Any, Any, Any]] = None
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+
+    def start(self) -> "ModelLoader":
+        self.report.mark("loader_started")
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            with self.report.phase("imports"):
+                for module in HEAVY_MODULES:
+                    try:
+                        importlib.import_module(module)
+                    except ImportError as e:
+                        print(f"Startup: could not preload {module} ({e})")
+            from utils.inference_backend import load_embedder, load_reranker
+            from models.model_handler import ModelHandler
+
+            with self.report.phase("embedder"):
+                embedder = load_embedder(config.EMBEDDING_MODEL)
+            with self.report.phase("reranker"):
+                reranker = load_reranker(config.RERANKER_MODEL)
+            with self.report.phase("model_handler"):
+                model_handler = ModelHandler()
+            if config.MODEL_WARMUP:
+                with self.report.phase("warm_up"):
+                    warm_up(embedder, reranker)
+            self._models = (embedder, reranker, model_handler)
+            self.report.mark("models_ready")
+            print(self.report.summary())
+        except BaseException as e:
+            self._error = e
+            print(f"Startup: model loading failed ({e})")
+        finally:
+            self._done.set()
+
+    def ready(self) -> bool:
+        return self._done.is_set() and self._error is None
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def result(self) -> Tuple[Any, Any, Any]:
+        """(embedder, reranker, model_handler), waiting for the loader if needed"""
+        self._done.wait()
+        if self._error is not None:
+            raise RuntimeError(f"Model loading failed: {self._error}") from self._error
+        return self._models
+
+# Process-wide loader shared by every session and page
+_loader: Optional[ModelLoader] = None
+_loader_lock = threading.Lock()
+
+def get_model_loader() -> ModelLoader:
+    """The shared loader, started on first use"""
+    global _loader
+    with _loader_lock:
+        if _loader is None:
+            _loader = ModelLoader().start()
+        return _loader
+
+def startup_report() -> Optional[Dict[str, Any]]:
+    """Report of the shared loader, or None if it has not been started"""
+    return None if _loader is None else _loader.report.to_dict()
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import uuid
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+from utils.config import config
+
+class Span:
+    """One timed stage of a request"""
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.children: List["Span"] = []
+        self.start = time.perf_counter()
+        self.end = None
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration(self) -> float:
+        """Seconds (up to now if the span is still open)"""
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    @property
+    def path(self) -> str:
+        """Stage path below the root, e.g. "retrieval/rerank" """
+        names = []
+        span = self
+        while span.parent is not None:
+            names.append(span.name)
+            span = span.parent
+        return "/".join(reversed(names))
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+class Tracer:
+    """Lightweight nested span recorder with JSONL export
+
+    ``trace()`` opens the root span of a request; ``span()`` (context manager)
+    and ``traced()`` (decorator) record nested stages in the current context.
+    Work handed to another thread joins the caller's trace when wrapped with
+    ``propagate()``. Spans opened outside a trace are not recorded, so
+    instrumented code costs almost nothing when nobody is tracing it.
+    """
+
+    def __init__(self, export_path: str = "", max_bytes: int = 0):
+        self.export_path = export_path
+        self.max_bytes = max_bytes
+        # Open spans, innermost last (a tuple, so copied contexts never share a stack)
+        self._stack: contextvars.ContextVar = contextvars.ContextVar("trace_stack", default=())
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack.get()
+        return stack[-1] if stack else None
+
+    def propagate(self, func):
+        """Bind func to the caller's current trace, e.g. before submitting it to an executor"""
+        context = contextvars.copy_context()
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return context.run(func, *args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Root span of one request; exported when it closes"""
+        root = Span(name, **attributes)
+        root.trace_id = uuid.uuid4().hex
+        root.wall_start = time.time()
+        token = self._stack.set((root,))
+        try:
+            yield root
+        finally:
+            root.end = time.perf_counter()
+            self._stack.reset(token)
+            self.export(root)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Nested stage inside the current trace (no-op without one)"""
+        parent = self.current()
+        if parent is None:
+            yield None
+            return
+        span = Span(name, parent, **attributes)
+        token = self._stack.set(self._stack.get() + (span,))
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._stack.reset(token)
+
+    def traced(self, name: str = None):
+        """Decorator form of span()"""
+        def decorator(func):
+            span_name = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_dict(self, root: Span) -> Dict[str, Any]:
+        return {
+            "trace_id": root.trace_id,
+            "name": root.name,
+            "timestamp": root.wall_start,
+            "duration_ms": round(root.duration * 1000, 3),
+            "attributes": root.attributes,
+            "spans": [
+                {
+                    "path": span.path,
+                    "name": span.name,
+                    "offset_ms": round((span.start - root.start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    "attributes": span.attributes
+                }
+                for span in root.walk() if span is not root
+            ]
+        }
+
+    def export(self, root: Span):
+        """Append a finished trace to the JSONL file (rotated to ``<path>.1`` once it reaches max_bytes)"""
+        if not self.export_path:
+            return
+        line = json.dumps(self.to_dict(root), default=str)
+        with self._lock:
+            try:
+                if self.max_bytes > 0 and os.path.getsize(self.export_path) >= self.max_bytes:
+                    os.replace(self.export_path, self.export_path + ".1")
+            except OSError:
+                pass
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+# Process-wide tracer used by the pipeline
+tracer = Tracer(config.TRACE_EXPORT_PATH, int(config.TRACE_EXPORT_MAX_MB * 2**20))
+span = tracer.span
+traced = tracer.traced
+propagate = tracer.propagate
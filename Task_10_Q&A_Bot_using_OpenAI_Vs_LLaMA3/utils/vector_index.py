@@ -0,0 +1,369 @@
+import mmap
+import tempfile
+from typing import List, Tuple
+import numpy as np
+
+def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores, best first, without a full sort"""
+    if top_k <= 0 or scores.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    if top_k >= scores.size:
+        return np.argsort(-scores)
+    part = np.argpartition(-scores, top_k - 1)[:top_k]
+    return part[np.argsort(-scores[part])]
+
+def _top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest scores in every row (unordered)"""
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Set bits per row of uint64 words (np.bitwise_count on NumPy 2, lookup table before)"""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    return _POPCOUNT[words.view(np.uint8)].sum(axis=-1, dtype=np.int32)
+
+def resident_nbytes(array: np.ndarray) -> int:
+    """Heap bytes of an array (0 for views of a memory-mapped file, which live in the page cache)"""
+    base = array
+    while base is not None:
+        if isinstance(base, (np.memmap, mmap.mmap)):
+            return 0
+        base = getattr(base, "base", None)
+    return array.nbytes
+
+def _pack_signs(bits: np.ndarray) -> np.ndarray:
+    """Boolean rows -> rows of uint64 words (zero-padded to a multiple of 64 bits)"""
+    packed = np.packbits(bits, axis=-1)
+    pad = -packed.shape[-1] % 8
+    if pad:
+        packed = np.pad(packed, [(0, 0)] * (packed.ndim - 1) + [(0, pad)])
+    return np.ascontiguousarray(packed).view(np.uint64)
+
+class ExactIndex:
+    """Brute-force inner-product search (always correct, O(N) per query)"""
+
+    kind = "exact"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def memory_bytes(self) -> int:
+        return resident_nbytes(self.embeddings)
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(self.embeddings) == 0:
+            self.embeddings = vectors
+        else:
+            self.embeddings = np.vstack([self.embeddings, vectors])
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self.embeddings) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = self.embeddings @ np.asarray(query, dtype=np.float32)
+        idx = _top_k(scores, top_k)
+        return idx, scores[idx]
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Score all queries with a single matrix-matrix product"""
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(self.embeddings) == 0:
+            return [self.search(q, top_k) for q in queries]
+        scores = queries @ self.embeddings.T
+        results = []
+        for row in scores:
+            idx = _top_k(row, top_k)
+            results.append((idx, row[idx]))
+        return results
+
+class IVFFlatIndex:
+    """Inverted-file index: k-means coarse quantizer + exact scan of nprobe lists
+
+    Query cost is O(nlist + N * nprobe / nlist) instead of O(N). Pure NumPy.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, embeddings: np.ndarray, nlist: int = 0, nprobe: int = 8,
+                 n_iter: int = 10, seed: int = 0):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        n = len(self.embeddings)
+        self.nlist = nlist if nlist > 0 else max(1, int(np.sqrt(n)))
+        self.nlist = min(self.nlist, max(1, n))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+
+        self.centroids = self._kmeans(self.embeddings, self.nlist, n_iter, seed)
+        assignments = self._assign(self.embeddings)
+        self.lists = [np.flatnonzero(assignments == c) for c in range(self.nlist)]
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def memory_bytes(self) -> int:
+        return resident_nbytes(self.embeddings) + self.centroids.nbytes + sum(ids.nbytes for ids in self.lists)
+
+    @staticmethod
+    def _kmeans(data: np.ndarray, k: int, n_iter: int, seed: int) -> np.ndarray:
+        """Spherical k-means on a sample (enough to partition the space)"""
+        rng = np.random.default_rng(seed)
+        sample = data
+        if len(data) > k * 64:
+            sample = data[rng.choice(len(data), k * 64, replace=False)]
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+
+        for _ in range(n_iter):
+            labels = (sample @ centroids.T).argmax(axis=1)
+            for c in range(k):
+                members = sample[labels == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+                else:
+                    centroids[c] = sample[rng.integers(len(sample))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.maximum(norms, 1e-12)
+        return centroids
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        if len(vectors) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return (vectors @ self.centroids.T).argmax(axis=1)
+
+    def add(self, vectors: np.ndarray):
+        """Assign new vectors to existing lists (centroids are not retrained)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        start = len(self.embeddings)
+        self.embeddings = np.vstack([self.embeddings, vectors])
+        for offset, c in enumerate(self._assign(vectors)):
+            self.lists[c] = np.append(self.lists[c], start + offset)
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = np.asarray(query, dtype=np.float32)
+        probe = _top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self.lists[c] for c in probe])
+        if candidates.size == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = self.embeddings[candidates] @ query
+        best = _top_k(scores, top_k)
+        return candidates[best], scores[best]
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        return [self.search(q, top_k) for q in np.asarray(queries, dtype=np.float32)]
+
+class HNSWIndex:
+    """Graph index backed by the optional ``hnswlib`` package"""
+
+    kind = "hnsw"
+
+    def __init__(self, embeddings: np.ndarray, m: int = 16, ef_construction: int = 200,
+                 ef_search: int = 64):
+        import hnswlib
+
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+        self.index.init_index(max_elements=max(1, len(self.embeddings)), M=m,
+                              ef_construction=ef_construction)
+        if len(self.embeddings):
+            self.index.add_items(self.embeddings, np.arange(len(self.embeddings)))
+        self.index.set_ef(ef_search)
+        self.m = m
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+    def memory_bytes(self) -> int:
+        """Vectors twice (ours and hnswlib's copy) plus ~2*M neighbour links per element"""
+        return resident_nbytes(self.embeddings) + self.embeddings.nbytes + len(self.embeddings) * self.m * 2 * 4
+
+    def add(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        start = len(self.embeddings)
+        self.embeddings = np.vstack([self.embeddings, vectors])
+        self.index.resize_index(len(self.embeddings))
+        self.index.add_items(vectors, np.arange(start, len(self.embeddings)))
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        top_k = min(top_k, len(self.embeddings))
+        if top_k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        self.index.set_ef(max(self.ef_search, top_k))
+        labels, distances = self.index.knn_query(np.asarray(query, dtype=np.float32), k=top_k)
+        # hnswlib "ip" distance is 1 - inner product
+        return labels[0].astype(np.int64), (1.0 - distances[0]).astype(np.float32)
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = np.asarray(queries, dtype=np.float32)
+        top_k = min(top_k, len(self.embeddings))
+        if top_k <= 0:
+            return [self.search(q, top_k) for q in queries]
+        self.index.set_ef(max(self.ef_search, top_k))
+        labels, distances = self.index.knn_query(queries, k=top_k)
+        return [
+            (labels[i].astype(np.int64), (1.0 - distances[i]).astype(np.float32))
+            for i in range(len(queries))
+        ]
+
+class QuantizedIndex:
+    """Two-phase search: quantized scan, then exact rescoring of the candidates
+
+    Only the compact codes stay resident: int8 codes (per-dimension scale,
+    4x smaller than float32) or sign bits around the per-dimension mean
+    (binary, 32x smaller). Full-precision vectors live in a memory-mapped
+    file (an existing ``.npy`` memmap is used as is), so the rescoring phase
+    pages in only the ``top_k * rescore_factor`` candidate rows.
+    """
+
+    BLOCK = 16384  # rows scanned/encoded per step (bounds temporary float32 copies)
+
+    def __init__(self, embeddings: np.ndarray, mode: str = "int8", rescore_factor: int = 16):
+        if mode not in ("int8", "binary"):
+            raise ValueError(f"Unknown quantization mode '{mode}'")
+        self.kind = mode
+        self.rescore_factor = max(1, rescore_factor)
+
+        # asanyarray keeps a memmap a memmap
+        embeddings = np.asanyarray(embeddings, dtype=np.float32)
+        self.dim = embeddings.shape[1] if embeddings.ndim == 2 else 0
+        self._count = len(embeddings)
+        if isinstance(embeddings, np.memmap):
+            # Already on disk (e.g. a corpus shard): nothing to spill
+            self._store = embeddings
+        else:
+            self._store = self._spill(max(len(embeddings), 1))
+            self._store[:len(embeddings)] = embeddings
+
+        if mode == "int8":
+            peak = np.abs(embeddings).max(axis=0) if len(embeddings) else np.ones(self.dim, dtype=np.float32)
+            self.scale = np.maximum(peak, 1e-12).astype(np.float32) / 127.0
+        else:
+            self.center = embeddings.mean(axis=0) if len(embeddings) else np.zeros(self.dim, dtype=np.float32)
+        self.codes = self._encode(embeddings)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """Full-precision vectors (memory-mapped)"""
+        return self._store[:self._count]
+
+    def _spill(self, capacity: int) -> np.ndarray:
+        # Anonymous temporary file: removed by the OS once the index is gone
+        return np.memmap(tempfile.TemporaryFile(), dtype=np.float32, mode="w+", shape=(capacity, self.dim))
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        blocks = []
+        for start in range(0, len(vectors), self.BLOCK):
+            block = np.asarray(vectors[start:start + self.BLOCK])
+            if self.kind == "int8":
+                blocks.append(np.clip(np.rint(block / self.scale), -127, 127).astype(np.int8))
+            else:
+                blocks.append(_pack_signs(block > self.center))
+        if not blocks:
+            width = self.dim if self.kind == "int8" else (self.dim + 63) // 64
+            return np.zeros((0, width), dtype=np.int8 if self.kind == "int8" else np.uint64)
+        return np.concatenate(blocks)
+
+    def memory_bytes(self) -> int:
+        """Resident bytes (codes plus quantizer parameters)"""
+        params = self.scale if self.kind == "int8" else self.center
+        return self.codes.nbytes + params.nbytes
+
+    def add(self, vectors: np.ndarray):
+        """Append vectors (the quantizer is not retrained; int8 values are clipped)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        needed = self._count + len(vectors)
+        if (isinstance(self._store, np.memmap) and self._store.mode == "r") or needed > len(self._store):
+            # Grow by doubling so appends stay amortised O(1) per row
+            grown = self._spill(max(needed, 2 * len(self._store)))
+            grown[:self._count] = self._store[:self._count]
+            self._store = grown
+        self._store[self._count:needed] = vectors
+        self._count = needed
+        self.codes = np.concatenate([self.codes, self._encode(vectors)])
+
+    def _approximate_scores(self, queries: np.ndarray, start: int, end: int) -> np.ndarray:
+        """Phase 1 scores of rows [start, end) for every query (higher = closer)"""
+        codes = self.codes[start:end]
+        if self.kind == "int8":
+            scaled = queries * self.scale
+            if len(queries) <= 4:
+                # Accumulate straight from int8 (no float32 copy of the block)
+                return np.einsum("kj,ij->ki", scaled, codes, dtype=np.float32, casting="unsafe")
+            return scaled @ codes.T.astype(np.float32)
+        query_words = _pack_signs(queries > self.center)
+        # Negative Hamming distance
+        return -np.stack([_popcount(codes ^ words) for words in query_words]).astype(np.float32)
+
+    def search_batch(self, queries: np.ndarray, top_k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        if self._count == 0 or top_k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+
+        n_candidates = min(self._count, top_k * self.rescore_factor)
+        best_idx = np.zeros((len(queries), 0), dtype=np.int64)
+        best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, self._count, self.BLOCK):
+            end = min(start + self.BLOCK, self._count)
+            scores = self._approximate_scores(queries, start, end)
+            idx = _top_k_rows(scores, n_candidates)
+            scores = np.concatenate([best_scores, np.take_along_axis(scores, idx, axis=1)], axis=1)
+            idx = np.concatenate([best_idx, idx + start], axis=1)
+            # Merge with the candidates of earlier blocks
+            keep = _top_k_rows(scores, n_candidates)
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_idx = np.take_along_axis(idx, keep, axis=1)
+
+        # Phase 2: exact inner products for the candidates only
+        results = []
+        for query, candidates in zip(queries, best_idx):
+            candidates = np.sort(candidates)  # sequential reads from the memory map
+            exact = self._store[candidates] @ query
+            best = _top_k(exact, top_k)
+            results.append((candidates[best], exact[best]))
+        return results
+
+    def search(self, query: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        return self.search_batch(np.asarray(query).reshape(1, -1), top_k)[0]
+
+def build_vector_index(embeddings: np.ndarray, kind: str = "exact", min_size: int = 0, **kwargs):
+    """Create the configured index, falling back to exact search when needed"""
+    embeddings = np.asanyarray(embeddings, dtype=np.float32)
+
+    if kind == "exact" or len(embeddings) == 0 or len(embeddings) < min_size:
+        return ExactIndex(embeddings)
+
+    if kind == "ivf":
+        return IVFFlatIndex(
+            embeddings,
+            nlist=kwargs.get("nlist", 0),
+            nprobe=kwargs.get("nprobe", 8)
+        )
+
+    if kind in ("int8", "binary"):
+        return QuantizedIndex(
+            embeddings,
+            mode=kind,
+            rescore_factor=kwargs.get("rescore_factor", 16)
+        )
+
+    if kind == "hnsw":
+        try:
+            return HNSWIndex(
+                embeddings,
+                m=kwargs.get("m", 16),
+                ef_search=kwargs.get("ef_search", 64)
+            )
+        except ImportError:
+            print("hnswlib not installed, falling back to exact search")
+            return ExactIndex(embeddings)
+
+    print(f"Unknown vector index '{kind}', falling back to exact search")
+    return ExactIndex(embeddings)